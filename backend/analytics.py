@@ -0,0 +1,331 @@
+"""Incremental accumulators behind the analytics endpoints.
+
+Each accumulator folds ``JourneyFrame`` batches with ``update`` and renders the
+endpoint payload with ``result``, so a request can stream the journeys
+collection in bounded batches instead of holding every document in memory.
+"""
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from attribution_engine import JourneyFrame
+
+
+def fold_frame(accumulators: Sequence, frame: JourneyFrame) -> Sequence:
+    """Update every accumulator with one frame; module-level so process workers can run it"""
+    for accumulator in accumulators:
+        accumulator.update(frame)
+    return accumulators
+
+
+class GroupedSums:
+    """Running per-key sums where keys are discovered batch by batch"""
+
+    def __init__(self, *columns: str):
+        self.keys: List = []
+        self.slots: Dict = {}
+        self.sums = {column: np.zeros(0, dtype=np.float64) for column in columns}
+
+    def slots_for(self, values: np.ndarray) -> np.ndarray:
+        """Map each value to its group slot, growing the sums for unseen keys"""
+        distinct, inverse = np.unique(values, return_inverse=True)
+        slots = np.empty(len(distinct), dtype=np.int64)
+        for i, key in enumerate(distinct.tolist()):
+            slot = self.slots.get(key)
+            if slot is None:
+                slot = len(self.keys)
+                self.slots[key] = slot
+                self.keys.append(key)
+            slots[i] = slot
+        missing = len(self.keys) - len(next(iter(self.sums.values())))
+        if missing > 0:
+            for column, sums in self.sums.items():
+                self.sums[column] = np.pad(sums, (0, missing))
+        return slots[inverse]
+
+    def add(self, column: str, slots: np.ndarray, weights) -> None:
+        np.add.at(self.sums[column], slots, weights)
+
+    def load(self, rows: List[Dict]) -> None:
+        """Add pre-grouped rows (``_id`` plus one field per column), e.g. from an aggregation pipeline"""
+        if not rows:
+            return
+        slots = self.slots_for(np.array([row["_id"] for row in rows]))
+        for column in self.sums:
+            self.add(column, slots, [row[column] for row in rows])
+
+
+class ChannelSums:
+    """Running per-channel sums sized to a frame's channel index"""
+
+    def __init__(self, *columns: str):
+        self.sums = {column: np.zeros(0, dtype=np.float64) for column in columns}
+        self.first_seen = np.zeros(0, dtype=np.int64)
+        self.touchpoints_seen = 0
+
+    def grow(self, n_channels: int) -> None:
+        missing = n_channels - len(self.first_seen)
+        if missing > 0:
+            for column, sums in self.sums.items():
+                self.sums[column] = np.pad(sums, (0, missing))
+            self.first_seen = np.pad(self.first_seen, (0, missing), constant_values=np.iinfo(np.int64).max)
+
+    def add(self, column: str, channel_ids: np.ndarray, weights) -> None:
+        np.add.at(self.sums[column], channel_ids, weights)
+
+    def mark_seen(self, frame: JourneyFrame) -> None:
+        order = np.arange(len(frame.channel_ids), dtype=np.int64) + self.touchpoints_seen
+        np.minimum.at(self.first_seen, frame.channel_ids, order)
+        self.touchpoints_seen += len(frame.channel_ids)
+
+    def seen_channels(self) -> np.ndarray:
+        """Channel ids that appeared so far, in first-seen order"""
+        seen = np.flatnonzero(self.first_seen < np.iinfo(np.int64).max)
+        return seen[np.argsort(self.first_seen[seen], kind="stable")]
+
+
+class StatsAccumulator:
+    """Totals behind /stats"""
+
+    def __init__(self):
+        self.conversions = 0
+        self.revenue = 0
+        self.touchpoints = 0
+        self.time_to_conversion = 0
+        self.spend = 0
+
+    def update(self, frame: JourneyFrame) -> None:
+        self.conversions += frame.journey_count
+        self.revenue = sum(frame.conversion_value.tolist(), self.revenue)
+        self.touchpoints += int(frame.touchpoint_count.sum())
+        self.time_to_conversion += int(frame.time_to_conversion.sum())
+        self.spend = sum(frame.cost.tolist(), self.spend)
+
+    def load(self, rows: List[Dict]) -> None:
+        """Add totals already computed by the stats aggregation pipeline"""
+        for row in rows:
+            self.conversions += row["conversions"]
+            self.revenue += row["revenue"]
+            self.touchpoints += row["touchpoints"]
+            self.time_to_conversion += row["time_to_conversion"]
+            self.spend += row["spend"]
+
+    def result(self) -> Dict:
+        if not self.conversions:
+            return {
+                "total_conversions": 0,
+                "total_revenue": 0,
+                "avg_touchpoints": 0,
+                "avg_time_to_conversion": 0,
+                "total_marketing_spend": 0,
+                "overall_roas": 0
+            }
+        return {
+            "total_conversions": self.conversions,
+            "total_revenue": round(self.revenue, 2),
+            "avg_touchpoints": round(self.touchpoints / self.conversions, 1),
+            "avg_time_to_conversion": round(self.time_to_conversion / self.conversions, 1),
+            "total_marketing_spend": round(self.spend, 2),
+            "overall_roas": round(self.revenue / self.spend, 2) if self.spend > 0 else 0
+        }
+
+
+class ChannelMetricsAccumulator:
+    """Per-channel interactions, conversions, revenue and spend behind /advanced-metrics"""
+
+    def __init__(self):
+        self.channels = ChannelSums("interactions", "conversions", "revenue", "spend")
+        self.names: List[str] = []
+
+    def update(self, frame: JourneyFrame) -> None:
+        self.names = frame.index.names
+        self.channels.grow(len(frame.index))
+        ids = frame.channel_ids
+        first = frame.first_channel_occurrence
+        unique_channels = np.bincount(frame.journey_index[first], minlength=frame.journey_count)
+
+        self.channels.add("interactions", ids, 1)
+        self.channels.add("spend", ids, frame.cost)
+        self.channels.add("conversions", ids[first], 1)
+        journey = frame.journey_index[first]
+        self.channels.add("revenue", ids[first], frame.conversion_value[journey] / unique_channels[journey])
+        self.channels.mark_seen(frame)
+
+    def result(self) -> List[Dict]:
+        sums = self.channels.sums
+        results = []
+        for channel_id in self.channels.seen_channels():
+            interactions = int(sums["interactions"][channel_id])
+            conversions = int(sums["conversions"][channel_id])
+            spend = float(sums["spend"][channel_id])
+            conversion_rate = (conversions / interactions * 100) if interactions > 0 else 0
+            cpa = spend / conversions if conversions > 0 else 0
+
+            results.append({
+                "channel": self.names[channel_id],
+                "conversion_rate": round(conversion_rate, 2),
+                "cpa": round(cpa, 2),
+                "total_interactions": interactions,
+                "conversions": conversions,
+                "revenue": round(float(sums["revenue"][channel_id]), 2),
+                "spend": round(spend, 2)
+            })
+
+        return sorted(results, key=lambda x: x["conversion_rate"], reverse=True)
+
+
+class RevenueTrendsAccumulator:
+    """Daily conversions, revenue and spend behind /revenue-trends"""
+
+    def __init__(self):
+        self.days = GroupedSums("conversions", "revenue", "spend")
+
+    def update(self, frame: JourneyFrame) -> None:
+        slots = self.days.slots_for(frame.conversion_day)
+        self.days.add("conversions", slots, 1)
+        self.days.add("revenue", slots, frame.conversion_value)
+        self.days.add("spend", slots[frame.journey_index], frame.cost)
+
+    def load(self, rows: List[Dict]) -> None:
+        self.days.load(rows)
+
+    def result(self) -> List[Dict]:
+        sums = self.days.sums
+        results = []
+        cumulative_revenue = 0
+
+        dates = [str(np.datetime64(day, "D")) for day in self.days.keys]
+        for slot in sorted(range(len(dates)), key=lambda i: dates[i]):
+            revenue = float(sums["revenue"][slot])
+            spend = float(sums["spend"][slot])
+            cumulative_revenue += revenue
+            results.append({
+                "date": dates[slot],
+                "revenue": round(revenue, 2),
+                "conversions": int(sums["conversions"][slot]),
+                "spend": round(spend, 2),
+                "cumulative_revenue": round(cumulative_revenue, 2),
+                "roas": round(revenue / spend, 2) if spend > 0 else 0
+            })
+
+        return results
+
+
+class SynergyAccumulator:
+    """Channel pair co-occurrence, ordering, lift and conversion value behind /channel-synergy"""
+
+    RANKINGS = ("co_occurrences", "lift", "pmi", "avg_value_together")
+
+    def __init__(self):
+        # Journeys and revenue per distinct channel set, keyed by the set's packed bitmask
+        self.sets = GroupedSums("journeys", "revenue")
+        # ordered[a, b]: journeys touching a before a later touchpoint on b
+        self.ordered = np.zeros((0, 0), dtype=np.int64)
+        self.journeys = 0
+        self.names: List[str] = []
+
+    def update(self, frame: JourneyFrame) -> None:
+        self.names = frame.index.names
+        n_channels = len(frame.index)
+        missing = n_channels - len(self.ordered)
+        if missing > 0:
+            self.ordered = np.pad(self.ordered, ((0, missing), (0, missing)))
+        self.journeys += frame.journey_count
+        if not len(frame.channel_ids):
+            return
+
+        presence = np.zeros((frame.journey_count, n_channels), dtype=bool)
+        presence[frame.journey_index, frame.channel_ids] = True
+        # Little-endian bits, so a mask packed before the index grew keeps its value
+        packed = np.packbits(presence, axis=1, bitorder="little")
+        slots = self.sets.slots_for(packed.view(f"V{packed.shape[1]}").ravel())
+        self.sets.add("journeys", slots, 1)
+        self.sets.add("revenue", slots, frame.conversion_value)
+
+        cells = (frame.journey_index, frame.channel_ids)
+        first = np.full((frame.journey_count, n_channels), np.iinfo(np.int64).max)
+        last = np.full((frame.journey_count, n_channels), -1)
+        np.minimum.at(first, cells, frame.position)
+        np.maximum.at(last, cells, frame.position)
+        # a precedes b when a's first touch comes before b's last; chunks bound the journeys x a x b comparison
+        chunk = max(1, 4_000_000 // (n_channels * n_channels))
+        for start in range(0, frame.journey_count, chunk):
+            precedes = first[start:start + chunk, :, None] < last[start:start + chunk, None, :]
+            self.ordered[:n_channels, :n_channels] += precedes.sum(axis=0)
+
+    def result(self, top_k: Optional[int] = None, rank_by: str = "co_occurrences") -> List[Dict]:
+        """Every pair of distinct channels seen together, strongest first by `rank_by`"""
+        n_channels = len(self.names)
+        if not self.sets.keys or not n_channels:
+            return []
+
+        # Distinct channel sets as rows of a set x channel matrix; its weighted Gram matrices give every pair at once
+        width = max(len(key) for key in self.sets.keys)
+        packed = np.frombuffer(b"".join(key.ljust(width, b"\0") for key in self.sets.keys), dtype=np.uint8)
+        presence = np.unpackbits(packed.reshape(-1, width), axis=1, count=n_channels, bitorder="little")
+        presence = presence.astype(np.float64)
+        together = np.rint(presence.T @ (presence * self.sets.sums["journeys"][:, None])).astype(np.int64)
+        together_revenue = presence.T @ (presence * self.sets.sums["revenue"][:, None])
+        support = np.diag(together)
+        support_revenue = np.diag(together_revenue)
+
+        first, second = np.triu_indices(n_channels, k=1)
+        seen = together[first, second] > 0
+        first, second = first[seen], second[seen]
+        co_occurrences = together[first, second]
+        lift = co_occurrences * self.journeys / (support[first] * support[second])
+        apart = support[first] + support[second] - 2 * co_occurrences
+        apart_revenue = support_revenue[first] + support_revenue[second] - 2 * together_revenue[first, second]
+        stats = {
+            "co_occurrences": co_occurrences,
+            "lift": lift,
+            "pmi": np.log2(lift),
+            "avg_value_together": together_revenue[first, second] / co_occurrences,
+            "avg_value_apart": np.divide(apart_revenue, apart, out=np.zeros(len(apart)), where=apart > 0)
+        }
+
+        order = np.argsort(-stats[rank_by], kind="stable")[:top_k]
+        results = []
+        for pair in order.tolist():
+            a, b = int(first[pair]), int(second[pair])
+            results.append({
+                "channel1": self.names[a],
+                "channel2": self.names[b],
+                "co_occurrences": int(co_occurrences[pair]),
+                "channel1_before_channel2": int(self.ordered[a, b]),
+                "channel2_before_channel1": int(self.ordered[b, a]),
+                "lift": round(float(stats["lift"][pair]), 4),
+                "pmi": round(float(stats["pmi"][pair]), 4),
+                "avg_value_together": round(float(stats["avg_value_together"][pair]), 2),
+                "avg_value_apart": round(float(stats["avg_value_apart"][pair]), 2)
+            })
+        return results
+
+
+class FunnelAccumulator:
+    """Journeys and revenue by touchpoint count behind /funnel-analysis"""
+
+    def __init__(self):
+        self.counts = GroupedSums("journeys", "revenue")
+
+    def update(self, frame: JourneyFrame) -> None:
+        slots = self.counts.slots_for(frame.touchpoint_count)
+        self.counts.add("journeys", slots, 1)
+        self.counts.add("revenue", slots, frame.conversion_value)
+
+    def load(self, rows: List[Dict]) -> None:
+        self.counts.load(rows)
+
+    def result(self) -> List[Dict]:
+        sums = self.counts.sums
+        results = []
+        for slot in sorted(range(len(self.counts.keys)), key=lambda i: self.counts.keys[i]):
+            journeys = int(sums["journeys"][slot])
+            revenue = float(sums["revenue"][slot])
+            results.append({
+                "touchpoint_count": self.counts.keys[slot],
+                "journeys": journeys,
+                "revenue": round(revenue, 2),
+                "avg_conversion_value": round(revenue / journeys, 2)
+            })
+        return results
@@ -0,0 +1,496 @@
+"""Columnar attribution engine.
+
+Journeys are loaded once into flat NumPy arrays (one row per touchpoint plus
+journey offsets) and every rule-based model is expressed as a per-touchpoint
+credit vector that is reduced per channel with a grouped sum.  Reductions use
+``np.add.at`` so each channel accumulates in the same order as the original
+per-dict loops, which keeps the rounded results identical to the cent.
+"""
+import functools
+from datetime import date
+from operator import itemgetter
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+DIRECT_CHANNEL = "Direct Traffic"
+
+SINGLE_TOUCH_MODELS = ("first_touch", "last_touch", "last_non_direct")
+MULTI_TOUCH_MODELS = ("linear", "time_decay", "position_based", "w_shaped")
+MODEL_NAMES = SINGLE_TOUCH_MODELS + MULTI_TOUCH_MODELS
+
+
+class ChannelIndex:
+    """Stable channel name <-> integer id mapping shared by frames"""
+
+    def __init__(self, names: Iterable[str] = ()):
+        self.names: List[str] = []
+        self.ids: Dict[str, int] = {}
+        for name in names:
+            self.id_for(name)
+
+    def id_for(self, name: str) -> int:
+        channel_id = self.ids.get(name)
+        if channel_id is None:
+            channel_id = len(self.names)
+            self.ids[name] = channel_id
+            self.names.append(name)
+        return channel_id
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def day_number(day: Union[str, date]) -> int:
+    """Days since 1970-01-01 of a conversion date; building datetime64 from date objects is far slower"""
+    # ISO strings from older documents, BSON dates (UTC) otherwise
+    if isinstance(day, str):
+        return int(np.datetime64(day[:10], "D").astype(np.int64))
+    return day.toordinal() - EPOCH_ORDINAL
+
+
+class JourneyFrame:
+    """Touchpoint-level columns plus per-journey columns and offsets"""
+
+    def __init__(
+        self,
+        index: ChannelIndex,
+        channel_ids: np.ndarray,
+        sequence: np.ndarray,
+        cost: np.ndarray,
+        days_before: np.ndarray,
+        offsets: np.ndarray,
+        conversion_value: np.ndarray,
+        touchpoint_count: np.ndarray,
+        time_to_conversion: Optional[np.ndarray] = None,
+        conversion_day: Optional[np.ndarray] = None,
+    ):
+        self.index = index
+        self.channel_ids = channel_ids
+        self.sequence = sequence
+        self.cost = cost
+        self.days_before = days_before
+        self.offsets = offsets
+        self.conversion_value = conversion_value
+        self.touchpoint_count = touchpoint_count
+        self.time_to_conversion = time_to_conversion
+        self.conversion_day = conversion_day
+        self._cache: Dict[str, np.ndarray] = {}
+
+    @classmethod
+    def from_journeys(cls, journeys: List[Dict], index: Optional[ChannelIndex] = None) -> "JourneyFrame":
+        """Decode journey dicts into columns, one vectorized read per field"""
+        index = index if index is not None else ChannelIndex()
+        touchpoints = [tp for journey in journeys for tp in journey["touchpoints"]]
+        n_touchpoints, n_journeys = len(touchpoints), len(journeys)
+
+        def column(records: List[Dict], field: str, dtype) -> np.ndarray:
+            return np.fromiter(map(itemgetter(field), records), dtype=dtype, count=len(records))
+
+        # Channels get ids in order of first appearance, as one lookup per distinct name
+        channels = [tp["channel"] for tp in touchpoints]
+        ids = {name: index.id_for(name) for name in dict.fromkeys(channels)}
+        lengths = np.fromiter(map(len, map(itemgetter("touchpoints"), journeys)), dtype=np.int64, count=n_journeys)
+        offsets = np.zeros(n_journeys + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        return cls(
+            index=index,
+            channel_ids=np.fromiter(map(ids.__getitem__, channels), dtype=np.int32, count=n_touchpoints),
+            sequence=column(touchpoints, "sequence", np.int64),
+            cost=column(touchpoints, "cost", np.float64),
+            days_before=column(touchpoints, "days_before_conversion", np.int64),
+            offsets=offsets,
+            conversion_value=column(journeys, "conversion_value", np.float64),
+            touchpoint_count=column(journeys, "touchpoint_count", np.int64),
+            time_to_conversion=np.fromiter((journey.get("time_to_conversion", 0) for journey in journeys),
+                                           dtype=np.int64, count=n_journeys),
+            conversion_day=np.fromiter((day_number(journey.get("conversion_date", "")) for journey in journeys),
+                                       dtype=np.int64, count=n_journeys).view("datetime64[D]"),
+        )
+
+    @property
+    def journey_count(self) -> int:
+        return len(self.conversion_value)
+
+    def _cached(self, key: str, build) -> np.ndarray:
+        # Shared derived columns are computed once per frame and reused by every model
+        if key not in self._cache:
+            self._cache[key] = build()
+        return self._cache[key]
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return self._cached("lengths", lambda: np.diff(self.offsets))
+
+    @property
+    def journey_index(self) -> np.ndarray:
+        """Owning journey row for each touchpoint"""
+        return self._cached("journey_index", lambda: np.repeat(np.arange(self.journey_count), self.lengths))
+
+    @property
+    def position(self) -> np.ndarray:
+        """Zero-based position of each touchpoint within its journey"""
+        return self._cached(
+            "position", lambda: np.arange(len(self.channel_ids)) - self.offsets[:-1][self.journey_index]
+        )
+
+    @property
+    def first_channel_occurrence(self) -> np.ndarray:
+        """Mask of the first touchpoint of each distinct channel within a journey"""
+        return self._cached("first_channel_occurrence", self._first_channel_occurrence)
+
+    @property
+    def touchpoint_value(self) -> np.ndarray:
+        """Owning journey's conversion value for each touchpoint"""
+        return self._cached("touchpoint_value", lambda: self.conversion_value[self.journey_index])
+
+    def position_cells(self, size: int) -> np.ndarray:
+        """Flat (touchpoint count, position) cell of each touchpoint in a position table of the given size"""
+        return self._cached(f"position_cells:{size}", lambda: self.lengths[self.journey_index] * size + self.position)
+
+    def decay(self, half_life: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Time-decay weights per touchpoint and their per-journey totals"""
+        def build():
+            weights = decay_weights(self.days_before, half_life)
+            totals = np.zeros(self.journey_count, dtype=np.float64)
+            np.add.at(totals, self.journey_index, weights)
+            return weights, totals
+        return self._cached(f"decay:{half_life}", build)
+
+    def _first_channel_occurrence(self) -> np.ndarray:
+        keys = self.journey_index.astype(np.int64) * max(len(self.index), 1) + self.channel_ids
+        _, first = np.unique(keys, return_index=True)
+        mask = np.zeros(len(keys), dtype=bool)
+        mask[first] = True
+        return mask
+
+    def total_revenue(self) -> float:
+        # Python's sequential sum keeps totals bit-identical to the dict loops
+        return sum(self.conversion_value.tolist())
+
+
+class TouchpointCredits:
+    """Per-touchpoint outputs of one model over a frame.
+
+    ``revenue`` is the credit assigned to each touchpoint, ``include`` marks
+    touchpoints counted towards a channel's touchpoints/cost/positions and
+    ``convert`` marks the touchpoint that counts a conversion for its channel.
+    """
+
+    def __init__(self, revenue: np.ndarray, include: np.ndarray, convert: np.ndarray):
+        self.revenue = revenue
+        self.include = include
+        self.convert = convert
+
+
+def _selected_touchpoints(frame: JourneyFrame, model: str) -> np.ndarray:
+    """Index of the single credited touchpoint for each non-empty journey"""
+    nonempty = frame.lengths > 0
+    starts = frame.offsets[:-1][nonempty]
+    ends = frame.offsets[1:][nonempty] - 1
+
+    if model == "first_touch":
+        return starts
+    if model == "last_touch":
+        return ends
+
+    direct_id = frame.index.ids.get(DIRECT_CHANNEL, -1)
+    candidates = np.where(frame.channel_ids != direct_id, np.arange(len(frame.channel_ids)), -1)
+    last_non_direct = np.maximum.reduceat(candidates, starts) if len(starts) else starts
+    return np.where(last_non_direct >= 0, last_non_direct, ends)
+
+
+# Tunable model parameters and their defaults; position weights are shares of conversion value
+DEFAULT_PARAMS = {
+    "time_decay": {"half_life": 7},
+    "position_based": {"first": 0.4, "middle": 0.2, "last": 0.4},
+    "w_shaped": {"first": 0.3, "middle": 0.3, "last": 0.3, "others": 0.1},
+}
+
+ModelParams = Tuple[Tuple[str, float], ...]
+ModelSpec = Union[str, Tuple[str, Optional[ModelParams]]]
+
+# Model rows credited and reduced together; bounds the stacked arrays for large parameter sweeps
+ROWS_PER_PASS = 32
+
+
+def resolve_params(model: str, **overrides: Optional[float]) -> ModelParams:
+    """Canonical, hashable parameters for a model with unset values taken from the defaults.
+
+    The remainder share (position_based ``middle``, w_shaped ``others``) is
+    derived from the explicit weights when not given.
+    """
+    defaults = DEFAULT_PARAMS.get(model)
+    if defaults is None:
+        return ()
+    given = {key: value for key, value in overrides.items() if value is not None and key in defaults}
+    if model == "time_decay":
+        half_life = given.get("half_life", defaults["half_life"])
+        if half_life <= 0:
+            raise ValueError("half_life must be positive")
+        return (("half_life", half_life),)
+
+    remainder = "middle" if model == "position_based" else "others"
+    params = dict(defaults)
+    params.update(given)
+    if remainder not in given and any(key in given for key in params if key != remainder):
+        # Rounded so that e.g. 1 - 0.4 - 0.4 yields the literal 0.2 the defaults use
+        params[remainder] = round(1 - sum(value for key, value in params.items() if key != remainder), 12)
+    if any(value < 0 for value in params.values()) or sum(params.values()) > 1 + 1e-9:
+        raise ValueError("Position weights must be non-negative and sum to at most 1")
+    return tuple(sorted(params.items()))
+
+
+@functools.lru_cache(maxsize=64)
+def decay_table(half_life: float, size: int) -> np.ndarray:
+    """2 ** (-days / half_life) for days 0..size-1, evaluated once per half-life"""
+    return np.array([2 ** (-days / half_life) for days in range(size)], dtype=np.float64)
+
+
+def decay_weights(days_before: np.ndarray, half_life: float = 7) -> np.ndarray:
+    """Per-touchpoint decay weights looked up from the cached table"""
+    if not len(days_before):
+        return np.zeros(0, dtype=np.float64)
+    low, high = int(days_before.min()), int(days_before.max())
+    if low < 0:
+        # Out-of-range days (not produced by the generator) fall back to per-distinct evaluation
+        distinct, inverse = np.unique(days_before, return_inverse=True)
+        return np.array([2 ** (-int(days) / half_life) for days in distinct], dtype=np.float64)[inverse]
+    return decay_table(half_life, _table_size(high + 1))[days_before]
+
+
+def _table_size(needed: int) -> int:
+    # Power-of-two sizes let frames with similar maxima share one cached table
+    return 1 << max(3, (needed - 1).bit_length())
+
+
+@functools.lru_cache(maxsize=1024)
+def position_table(model: str, params: ModelParams, size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(share, divisor) by [touchpoint count, position] so credit = value * share / divisor.
+
+    Keeping the divisor separate reproduces the original ``value * 0.2 / (count - 2)``
+    evaluation order exactly.
+    """
+    weights = dict(params)
+    share = np.zeros((size + 1, size), dtype=np.float64)
+    divisor = np.ones((size + 1, size), dtype=np.float64)
+    for count in range(1, size + 1):
+        for position in range(count):
+            if count == 1:
+                share[count, position] = 1.0
+            elif model == "position_based":
+                if position == 0:
+                    share[count, position] = weights["first"]
+                elif position == count - 1:
+                    share[count, position] = weights["last"]
+                else:
+                    share[count, position], divisor[count, position] = weights["middle"], count - 2
+            elif count == 2:
+                edges = weights["first"] + weights["last"]
+                edge = weights["first"] if position == 0 else weights["last"]
+                share[count, position] = edge / edges if edges > 0 else 0.0
+            elif position == 0:
+                share[count, position] = weights["first"]
+            elif position == count - 1:
+                share[count, position] = weights["last"]
+            elif position == count // 2:
+                share[count, position] = weights["middle"]
+            else:
+                share[count, position], divisor[count, position] = weights["others"], count - 3
+    return share, divisor
+
+
+def model_credits(frame: JourneyFrame, model: str, params: Optional[ModelParams] = None) -> TouchpointCredits:
+    """Build the per-touchpoint credit vector for a rule-based model"""
+    n_tp = len(frame.channel_ids)
+    journey = frame.journey_index
+    value = frame.touchpoint_value
+
+    if model in SINGLE_TOUCH_MODELS:
+        selected = _selected_touchpoints(frame, model)
+        revenue = np.zeros(n_tp, dtype=np.float64)
+        revenue[selected] = frame.conversion_value[frame.lengths > 0]
+        convert = np.zeros(n_tp, dtype=bool)
+        convert[selected] = True
+        credited = np.full(frame.journey_count, -1, dtype=np.int64)
+        credited[frame.lengths > 0] = frame.channel_ids[selected]
+        include = frame.channel_ids == credited[journey]
+        return TouchpointCredits(revenue, include, convert)
+
+    include = np.ones(n_tp, dtype=bool)
+    convert = frame.first_channel_occurrence
+    params = params or resolve_params(model)
+
+    if model == "linear":
+        revenue = value / frame.touchpoint_count[journey]
+    elif model == "time_decay":
+        half_life = dict(params)["half_life"]
+        weights, totals = frame.decay(half_life)
+        revenue = value * (weights / totals[journey])
+    elif model in ("position_based", "w_shaped"):
+        size = _table_size(int(frame.lengths.max()) if frame.journey_count else 1)
+        share, divisor = position_table(model, params, size)
+        cells = frame.position_cells(size)
+        revenue = value * share.reshape(-1)[cells] / divisor.reshape(-1)[cells]
+    else:
+        raise ValueError(f"Unknown attribution model: {model}")
+
+    return TouchpointCredits(revenue, include, convert)
+
+
+class AttributionMatrix:
+    """Per-channel accumulators for several models, laid out as model x channel arrays.
+
+    All requested models are credited from the same frame and reduced with a
+    single stacked ``np.add.at`` per measure, so a frame is traversed once no
+    matter how many models are evaluated.
+    """
+
+    def __init__(self, index: ChannelIndex, models: Iterable[ModelSpec] = MODEL_NAMES):
+        self.index = index
+        specs = [(spec, None) if isinstance(spec, str) else spec for spec in models]
+        for model, _ in specs:
+            if model not in MODEL_NAMES:
+                raise ValueError(f"Unknown attribution model: {model}")
+        # A row per (model, parameters) so one model may appear with several parameterizations
+        self.models = tuple(model for model, _ in specs)
+        self.params = tuple(params if params is not None else resolve_params(model) for model, params in specs)
+        self.total_revenue = 0
+        self.journeys = 0
+        self.touchpoints_seen = 0
+        shape = (len(self.models), len(index))
+        self.revenue = np.zeros(shape, dtype=np.float64)
+        self.touchpoints = np.zeros(shape, dtype=np.int64)
+        self.cost = np.zeros(shape, dtype=np.float64)
+        self.conversions = np.zeros(shape, dtype=np.int64)
+        self.position_sum = np.zeros(shape, dtype=np.int64)
+        self.first_seen = np.full(shape, np.iinfo(np.int64).max, dtype=np.int64)
+
+    def _grow(self):
+        missing = len(self.index) - self.revenue.shape[1]
+        if missing <= 0:
+            return
+        pad = ((0, 0), (0, missing))
+        self.revenue = np.pad(self.revenue, pad)
+        self.touchpoints = np.pad(self.touchpoints, pad)
+        self.cost = np.pad(self.cost, pad)
+        self.conversions = np.pad(self.conversions, pad)
+        self.position_sum = np.pad(self.position_sum, pad)
+        self.first_seen = np.pad(self.first_seen, pad, constant_values=np.iinfo(np.int64).max)
+
+    def update(self, frame: JourneyFrame) -> "AttributionMatrix":
+        """Fold a frame's credits for every model into the accumulators"""
+        if frame.index.names[:len(self.index)] != self.index.names:
+            raise ValueError("Frame channel ids do not extend the matrix channel index")
+        # Indexes only grow, so adopting the frame's keeps ids stable (and survives pickling to workers)
+        self.index = frame.index
+        self._grow()
+        ids = frame.channel_ids.astype(np.int64)
+        order = np.arange(len(ids), dtype=np.int64) + self.touchpoints_seen
+
+        # Touchpoint, cost, position and conversion counts depend only on the model, not its parameters,
+        # so they are accumulated for one row per model and copied to the others
+        measured = {}
+        for row, model in enumerate(self.models):
+            measured.setdefault(model, row)
+        for start in range(0, len(self.models), ROWS_PER_PASS):
+            rows = range(start, min(start + ROWS_PER_PASS, len(self.models)))
+            self._fold_rows(frame, rows, ids, order, set(measured.values()))
+        for row, model in enumerate(self.models):
+            source = measured[model]
+            if row != source:
+                for measure in (self.touchpoints, self.cost, self.conversions, self.position_sum, self.first_seen):
+                    measure[row] = measure[source]
+
+        # Python's sequential sum keeps totals bit-identical to the dict loops
+        self.total_revenue = sum(frame.conversion_value.tolist(), self.total_revenue)
+        self.journeys += frame.journey_count
+        self.touchpoints_seen += len(ids)
+        return self
+
+    def _fold_rows(self, frame: JourneyFrame, rows: range, ids: np.ndarray, order: np.ndarray,
+                   measured: set) -> None:
+        n_channels = len(self.index)
+        revenue_cells, revenue = [], []
+        included_cells, converted_cells = [], []
+        cost, sequence, converted_order = [], [], []
+        for row in rows:
+            model = self.models[row]
+            credits = model_credits(frame, model, self.params[row])
+            # Multi-touch models include every touchpoint, so their credits need no masking
+            if model in MULTI_TOUCH_MODELS:
+                cells, credited = ids + row * n_channels, credits.revenue
+            else:
+                cells, credited = ids[credits.include] + row * n_channels, credits.revenue[credits.include]
+            revenue_cells.append(cells)
+            revenue.append(credited)
+            if row in measured:
+                included_cells.append(cells)
+                cost.append(frame.cost[credits.include])
+                sequence.append(frame.sequence[credits.include])
+                converted_cells.append(ids[credits.convert] + row * n_channels)
+                converted_order.append(order[credits.convert])
+
+        np.add.at(self.revenue.reshape(-1), np.concatenate(revenue_cells), np.concatenate(revenue))
+        if not included_cells:
+            return
+        included_cells = np.concatenate(included_cells)
+        converted_cells = np.concatenate(converted_cells)
+        np.add.at(self.cost.reshape(-1), included_cells, np.concatenate(cost))
+        np.add.at(self.position_sum.reshape(-1), included_cells, np.concatenate(sequence))
+        self.touchpoints += np.bincount(included_cells, minlength=self.touchpoints.size).reshape(self.touchpoints.shape)
+        self.conversions += np.bincount(
+            converted_cells, minlength=self.conversions.size
+        ).reshape(self.conversions.shape)
+        np.minimum.at(self.first_seen.reshape(-1), converted_cells, np.concatenate(converted_order))
+
+    def present(self) -> np.ndarray:
+        """Boolean model x channel mask of channels that received any credit event"""
+        return self.conversions > 0
+
+    def channel_data(self, model: Union[str, int]) -> Dict[str, Dict]:
+        """One model's (or matrix row's) accumulators in the layout used by format_attribution_results"""
+        row = model if isinstance(model, int) else self.models.index(model)
+        present = np.flatnonzero(self.conversions[row] > 0)
+        channel_data = {}
+        for channel_id in present[np.argsort(self.first_seen[row, present], kind="stable")]:
+            channel_data[self.index.names[channel_id]] = {
+                "revenue": float(self.revenue[row, channel_id]),
+                "touchpoints": int(self.touchpoints[row, channel_id]),
+                "cost": float(self.cost[row, channel_id]),
+                "conversions": int(self.conversions[row, channel_id]),
+                "position_sum": int(self.position_sum[row, channel_id]),
+            }
+        return channel_data
+
+
+def attribute(frame: JourneyFrame, model: str, params: Optional[ModelParams] = None) -> Dict[str, Dict]:
+    """Reduce a single model's credits into the channel_data layout"""
+    return AttributionMatrix(frame.index, ((model, params),)).update(frame).channel_data(0)
+
+
+def evaluate_models(frame: JourneyFrame, models: Iterable[ModelSpec] = MODEL_NAMES) -> AttributionMatrix:
+    """Evaluate several models over one frame in a single pass"""
+    return AttributionMatrix(frame.index, models).update(frame)
+
+
+def spread_statistics(values: np.ndarray, present: np.ndarray) -> Dict[str, np.ndarray]:
+    """Row-wise mean, population std, CoV, min and max over the present cells of a channel x model matrix"""
+    counts = present.sum(axis=1)
+    safe_counts = np.maximum(counts, 1)
+    mean = np.where(present, values, 0.0).sum(axis=1) / safe_counts
+    variance = np.where(present, (values - mean[:, None]) ** 2, 0.0).sum(axis=1) / safe_counts
+    std = np.sqrt(variance)
+    cov = np.divide(std * 100, mean, out=np.zeros_like(mean), where=mean > 0)
+    return {
+        "count": counts,
+        "mean": mean,
+        "std": std,
+        "cov": cov,
+        "min": np.where(present, values, np.inf).min(axis=1, initial=np.inf),
+        "max": np.where(present, values, -np.inf).max(axis=1, initial=-np.inf),
+    }
@@ -0,0 +1,111 @@
+"""Benchmark the columnar attribution engine against the original loops.
+
+Run from the backend directory:
+
+    python -m benchmarks.attribution_engine --journeys 100000
+
+Every model is checked for cent-exact parity with the legacy implementation
+before timings are reported.  Engine times and speedups include loading the
+frame, as a request pays it; the compute column is the loaded frame alone.
+``--sweep`` also times one pass over a grid of time-decay and
+position-weight parameter sets.
+"""
+import argparse
+import os
+import random
+import time
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "attribution_bench")
+
+import server  # noqa: E402
+from attribution_engine import AttributionMatrix, ChannelIndex, JourneyFrame, attribute, resolve_params  # noqa: E402
+from benchmarks.legacy_attribution import LEGACY_MODELS, to_engine_layout  # noqa: E402
+
+
+def best_of(repeat, fn, *args):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(*args)
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def legacy(journeys, model):
+    channel_data, total_revenue = LEGACY_MODELS[model](journeys)
+    return server.format_attribution_results(to_engine_layout(channel_data), total_revenue)
+
+
+def sweep_specs(count):
+    """Alternate time-decay half-lives with position-based and W-shaped weight grids"""
+    specs = []
+    for step in range(count):
+        if step % 3 == 0:
+            specs.append(("time_decay", resolve_params("time_decay", half_life=1 + step % 60)))
+        elif step % 3 == 1:
+            first = round(0.05 * (step % 10), 2)
+            specs.append(("position_based", resolve_params("position_based", first=first, last=0.5 - first / 2)))
+        else:
+            edge = round(0.2 + 0.01 * (step % 10), 2)
+            specs.append(("w_shaped", resolve_params("w_shaped", first=edge, middle=edge, last=edge)))
+    return specs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--journeys", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--sweep", type=int, default=300, help="parameter sets in the sweep (0 to skip)")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    journeys = server.build_sample_journeys(args.journeys)
+    touchpoints = sum(len(j["touchpoints"]) for j in journeys)
+    print(f"{args.journeys} journeys, {touchpoints} touchpoints, best of {args.repeat}")
+
+    load_time, frame = best_of(args.repeat, JourneyFrame.from_journeys, journeys, ChannelIndex(server.CHANNELS))
+    print(f"frame load: {load_time * 1000:.1f} ms (paid once per request, included in engine ms)\n")
+    print(f"{'model':<16}{'legacy ms':>12}{'engine ms':>12}{'compute ms':>12}{'speedup':>10}")
+
+    total_revenue = frame.total_revenue()
+    for model in LEGACY_MODELS:
+        legacy_time, expected = best_of(args.repeat, legacy, journeys, model)
+        engine_time, actual = best_of(args.repeat, server.calculate_model, journeys, model)
+        compute_time, _ = best_of(
+            args.repeat,
+            lambda: server.format_attribution_results(attribute(frame, model), total_revenue),
+        )
+
+        if [r.model_dump() for r in actual] != [r.model_dump() for r in expected]:
+            raise SystemExit(f"{model}: engine results differ from the legacy implementation")
+
+        print(
+            f"{model:<16}{legacy_time * 1000:>12.1f}{engine_time * 1000:>12.1f}"
+            f"{compute_time * 1000:>12.1f}{legacy_time / engine_time:>9.1f}x"
+        )
+
+    models = list(LEGACY_MODELS)
+    legacy_time, _ = best_of(args.repeat, lambda: [legacy(journeys, model) for model in models])
+    separate_time, _ = best_of(args.repeat, lambda: [server.calculate_model(journeys, model) for model in models])
+    matrix_time, matrix = best_of(args.repeat, server.evaluate_attribution, journeys, models)
+    for model in models:
+        expected = [r.model_dump() for r in legacy(journeys, model)]
+        if [r.model_dump() for r in server.format_model_results(matrix, model)] != expected:
+            raise SystemExit(f"{model}: multi-model matrix differs from the legacy implementation")
+    print(
+        f"\nall {len(models)} models: legacy {legacy_time * 1000:.1f} ms, "
+        f"engine per model {separate_time * 1000:.1f} ms, single pass {matrix_time * 1000:.1f} ms "
+        f"({legacy_time / matrix_time:.1f}x)"
+    )
+
+    if args.sweep:
+        specs = sweep_specs(args.sweep)
+        sweep_time, _ = best_of(args.repeat, lambda: AttributionMatrix(frame.index, specs).update(frame))
+        print(f"sweep of {len(specs)} parameter sets: {sweep_time * 1000:.1f} ms in one pass")
+
+
+if __name__ == "__main__":
+    main()
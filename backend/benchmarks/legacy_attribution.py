@@ -0,0 +1,291 @@
+"""Original per-dict attribution loops, kept as the baseline for benchmarks.
+
+Each function returns ``(channel_data, total_revenue)`` exactly as the
+pre-engine ``calculate_*`` functions built them before formatting.
+"""
+from typing import Dict, List, Tuple
+
+
+def calculate_first_touch(journeys: List[Dict]) -> Tuple[Dict, float]:
+    """100% credit to first touchpoint"""
+    channel_data = {}
+
+    for journey in journeys:
+        first_tp = journey["touchpoints"][0]
+        channel = first_tp["channel"]
+
+        if channel not in channel_data:
+            channel_data[channel] = {
+                "revenue": 0,
+                "touchpoints": 0,
+                "cost": 0,
+                "conversions": 0,
+                "positions": []
+            }
+
+        channel_data[channel]["revenue"] += journey["conversion_value"]
+        channel_data[channel]["conversions"] += 1
+
+        for tp in journey["touchpoints"]:
+            if tp["channel"] == channel:
+                channel_data[channel]["touchpoints"] += 1
+                channel_data[channel]["cost"] += tp["cost"]
+                channel_data[channel]["positions"].append(tp["sequence"])
+
+    return channel_data, sum(j["conversion_value"] for j in journeys)
+
+
+def calculate_last_touch(journeys: List[Dict]) -> Tuple[Dict, float]:
+    """100% credit to last touchpoint"""
+    channel_data = {}
+
+    for journey in journeys:
+        last_tp = journey["touchpoints"][-1]
+        channel = last_tp["channel"]
+
+        if channel not in channel_data:
+            channel_data[channel] = {
+                "revenue": 0,
+                "touchpoints": 0,
+                "cost": 0,
+                "conversions": 0,
+                "positions": []
+            }
+
+        channel_data[channel]["revenue"] += journey["conversion_value"]
+        channel_data[channel]["conversions"] += 1
+
+        for tp in journey["touchpoints"]:
+            if tp["channel"] == channel:
+                channel_data[channel]["touchpoints"] += 1
+                channel_data[channel]["cost"] += tp["cost"]
+                channel_data[channel]["positions"].append(tp["sequence"])
+
+    return channel_data, sum(j["conversion_value"] for j in journeys)
+
+
+def calculate_last_non_direct(journeys: List[Dict]) -> Tuple[Dict, float]:
+    """100% credit to last non-direct touchpoint"""
+    channel_data = {}
+
+    for journey in journeys:
+        # Find last non-direct touchpoint
+        last_non_direct = None
+        for tp in reversed(journey["touchpoints"]):
+            if tp["channel"] != "Direct Traffic":
+                last_non_direct = tp
+                break
+
+        if not last_non_direct:
+            last_non_direct = journey["touchpoints"][-1]
+
+        channel = last_non_direct["channel"]
+
+        if channel not in channel_data:
+            channel_data[channel] = {
+                "revenue": 0,
+                "touchpoints": 0,
+                "cost": 0,
+                "conversions": 0,
+                "positions": []
+            }
+
+        channel_data[channel]["revenue"] += journey["conversion_value"]
+        channel_data[channel]["conversions"] += 1
+
+        for tp in journey["touchpoints"]:
+            if tp["channel"] == channel:
+                channel_data[channel]["touchpoints"] += 1
+                channel_data[channel]["cost"] += tp["cost"]
+                channel_data[channel]["positions"].append(tp["sequence"])
+
+    return channel_data, sum(j["conversion_value"] for j in journeys)
+
+
+def calculate_linear(journeys: List[Dict]) -> Tuple[Dict, float]:
+    """Equal credit to all touchpoints"""
+    channel_data = {}
+
+    for journey in journeys:
+        credit_per_tp = journey["conversion_value"] / journey["touchpoint_count"]
+
+        for tp in journey["touchpoints"]:
+            channel = tp["channel"]
+
+            if channel not in channel_data:
+                channel_data[channel] = {
+                    "revenue": 0,
+                    "touchpoints": 0,
+                    "cost": 0,
+                    "conversions": 0,
+                    "positions": []
+                }
+
+            channel_data[channel]["revenue"] += credit_per_tp
+            channel_data[channel]["touchpoints"] += 1
+            channel_data[channel]["cost"] += tp["cost"]
+            channel_data[channel]["positions"].append(tp["sequence"])
+
+        # Count conversions influenced
+        channels_in_journey = set(tp["channel"] for tp in journey["touchpoints"])
+        for ch in channels_in_journey:
+            if ch in channel_data:
+                channel_data[ch]["conversions"] += 1
+
+    return channel_data, sum(j["conversion_value"] for j in journeys)
+
+
+def calculate_time_decay(journeys: List[Dict]) -> Tuple[Dict, float]:
+    """Exponentially more credit to recent touchpoints (7-day half-life)"""
+    channel_data = {}
+
+    for journey in journeys:
+        # Calculate weights for each touchpoint
+        weights = []
+        for tp in journey["touchpoints"]:
+            days_before = tp["days_before_conversion"]
+            weight = 2 ** (-days_before / 7)
+            weights.append(weight)
+
+        # Normalize weights
+        total_weight = sum(weights)
+        normalized_weights = [w / total_weight for w in weights]
+
+        for i, tp in enumerate(journey["touchpoints"]):
+            channel = tp["channel"]
+            credit = journey["conversion_value"] * normalized_weights[i]
+
+            if channel not in channel_data:
+                channel_data[channel] = {
+                    "revenue": 0,
+                    "touchpoints": 0,
+                    "cost": 0,
+                    "conversions": 0,
+                    "positions": []
+                }
+
+            channel_data[channel]["revenue"] += credit
+            channel_data[channel]["touchpoints"] += 1
+            channel_data[channel]["cost"] += tp["cost"]
+            channel_data[channel]["positions"].append(tp["sequence"])
+
+        channels_in_journey = set(tp["channel"] for tp in journey["touchpoints"])
+        for ch in channels_in_journey:
+            if ch in channel_data:
+                channel_data[ch]["conversions"] += 1
+
+    return channel_data, sum(j["conversion_value"] for j in journeys)
+
+
+def calculate_position_based(journeys: List[Dict]) -> Tuple[Dict, float]:
+    """40% first, 40% last, 20% split among middle"""
+    channel_data = {}
+
+    for journey in journeys:
+        touchpoints = journey["touchpoints"]
+        count = len(touchpoints)
+
+        for i, tp in enumerate(touchpoints):
+            channel = tp["channel"]
+
+            if channel not in channel_data:
+                channel_data[channel] = {
+                    "revenue": 0,
+                    "touchpoints": 0,
+                    "cost": 0,
+                    "conversions": 0,
+                    "positions": []
+                }
+
+            if count == 1:
+                credit = journey["conversion_value"]
+            elif i == 0:
+                credit = journey["conversion_value"] * 0.4
+            elif i == count - 1:
+                credit = journey["conversion_value"] * 0.4
+            else:
+                credit = journey["conversion_value"] * 0.2 / (count - 2)
+
+            channel_data[channel]["revenue"] += credit
+            channel_data[channel]["touchpoints"] += 1
+            channel_data[channel]["cost"] += tp["cost"]
+            channel_data[channel]["positions"].append(tp["sequence"])
+
+        channels_in_journey = set(tp["channel"] for tp in touchpoints)
+        for ch in channels_in_journey:
+            if ch in channel_data:
+                channel_data[ch]["conversions"] += 1
+
+    return channel_data, sum(j["conversion_value"] for j in journeys)
+
+
+def calculate_w_shaped(journeys: List[Dict]) -> Tuple[Dict, float]:
+    """30% first, 30% middle key touchpoint, 30% last, 10% to others"""
+    channel_data = {}
+
+    for journey in journeys:
+        touchpoints = journey["touchpoints"]
+        count = len(touchpoints)
+
+        for i, tp in enumerate(touchpoints):
+            channel = tp["channel"]
+
+            if channel not in channel_data:
+                channel_data[channel] = {
+                    "revenue": 0,
+                    "touchpoints": 0,
+                    "cost": 0,
+                    "conversions": 0,
+                    "positions": []
+                }
+
+            if count == 1:
+                credit = journey["conversion_value"]
+            elif count == 2:
+                credit = journey["conversion_value"] * 0.5
+            elif i == 0:
+                credit = journey["conversion_value"] * 0.3
+            elif i == count - 1:
+                credit = journey["conversion_value"] * 0.3
+            elif i == count // 2:
+                credit = journey["conversion_value"] * 0.3
+            else:
+                others_count = count - 3
+                credit = journey["conversion_value"] * 0.1 / others_count if others_count > 0 else 0
+
+            channel_data[channel]["revenue"] += credit
+            channel_data[channel]["touchpoints"] += 1
+            channel_data[channel]["cost"] += tp["cost"]
+            channel_data[channel]["positions"].append(tp["sequence"])
+
+        channels_in_journey = set(tp["channel"] for tp in touchpoints)
+        for ch in channels_in_journey:
+            if ch in channel_data:
+                channel_data[ch]["conversions"] += 1
+
+    return channel_data, sum(j["conversion_value"] for j in journeys)
+
+
+LEGACY_MODELS = {
+    "first_touch": calculate_first_touch,
+    "last_touch": calculate_last_touch,
+    "last_non_direct": calculate_last_non_direct,
+    "linear": calculate_linear,
+    "time_decay": calculate_time_decay,
+    "position_based": calculate_position_based,
+    "w_shaped": calculate_w_shaped,
+}
+
+
+def to_engine_layout(channel_data: Dict) -> Dict:
+    """Convert positions lists to the position_sum layout used by format_attribution_results"""
+    return {
+        channel: {
+            "revenue": data["revenue"],
+            "touchpoints": data["touchpoints"],
+            "cost": data["cost"],
+            "conversions": data["conversions"],
+            "position_sum": sum(data["positions"]),
+        }
+        for channel, data in channel_data.items()
+    }
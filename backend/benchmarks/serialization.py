@@ -0,0 +1,121 @@
+"""Compare response encoding with and without Pydantic re-validation.
+
+Run from the backend directory:
+
+    python -m benchmarks.serialization --journeys 10000
+
+"validated" is what FastAPI does for a route with ``response_model``:
+validate the return value, serialize it and JSON-encode the result.  "fast"
+is the FAST_SERIALIZATION path, which encodes the same data as it is.  Both
+outputs are checked to decode to the same JSON before timings are reported.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "attribution_bench")
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+
+import server  # noqa: E402
+from serialization import dumps, orjson  # noqa: E402
+
+
+def response_field(path, method="GET"):
+    for route in server.app.routes:
+        if getattr(route, "path", None) == path and method in route.methods:
+            return route.response_field
+    raise LookupError(path)
+
+
+def best_of(repeat, fn):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def validated(field, content):
+    serialized = asyncio.run(serialize_response(field=field, response_content=content))
+    return JSONResponse(serialized).body
+
+
+def build_attribution_results(matrix, fast):
+    server.FAST_SERIALIZATION = fast
+    try:
+        return [server.ModelComparison(model_name=server.MODEL_LABELS[model],
+                                       channels=server.format_model_results(matrix, model))
+                for model in matrix.models]
+    finally:
+        server.FAST_SERIALIZATION = False
+
+
+def report(name, validated_time, fast_time, scale):
+    print(
+        f"{name:<26}{validated_time * 1000 * scale:>14.2f}{fast_time * 1000 * scale:>10.2f}"
+        f"{validated_time / fast_time:>9.1f}x"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--journeys", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    journeys = server.build_sample_journeys(args.journeys)
+    # Journeys read back from MongoDB carry naive UTC dates
+    for journey in journeys:
+        journey["conversion_date"] = journey["conversion_date"].replace(tzinfo=None)
+    scale = 10_000 / args.journeys
+
+    print(f"encoder: {'orjson' if orjson else 'json'}, best of {args.repeat}, ms per 10k journeys")
+    print(f"{'payload':<26}{'validated ms':>14}{'fast ms':>10}{'speedup':>10}")
+
+    field = response_field("/api/journeys")
+    validated_time, expected = best_of(args.repeat, lambda: validated(field, journeys))
+    fast_time, actual = best_of(args.repeat, lambda: dumps(journeys))
+    if json.loads(expected) != json.loads(actual):
+        raise SystemExit("/journeys: fast encoding differs from the validated response")
+    report("/journeys", validated_time, fast_time, scale)
+
+    # The streamed /journeys page encodes per cursor batch
+    def stream_encode(fast):
+        server.FAST_SERIALIZATION = fast
+        try:
+            return b"".join(server.encode_journeys(journeys[start:start + 500], False, True, False)
+                            for start in range(0, len(journeys), 500))
+        finally:
+            server.FAST_SERIALIZATION = False
+
+    validated_time, expected = best_of(args.repeat, lambda: stream_encode(False))
+    fast_time, actual = best_of(args.repeat, lambda: stream_encode(True))
+    if [json.loads(line) for line in expected.splitlines()] != [json.loads(line) for line in actual.splitlines()]:
+        raise SystemExit("/journeys?format=ndjson: fast encoding differs from the validated stream")
+    report("/journeys?format=ndjson", validated_time, fast_time, scale)
+
+    # Formatting plus encoding of precomputed results; the attribution math is the same either way
+    matrix = server.evaluate_attribution(journeys, list(server.MODEL_LABELS))
+    field = response_field("/api/attribution/compare/all")
+    validated_time, expected = best_of(
+        args.repeat, lambda: validated(field, build_attribution_results(matrix, False))
+    )
+    fast_time, actual = best_of(args.repeat, lambda: dumps(build_attribution_results(matrix, True)))
+    if json.loads(expected) != json.loads(actual):
+        raise SystemExit("/attribution/compare/all: fast encoding differs from the validated response")
+    # Result size does not depend on the journey count, so this row is per response
+    report("/attribution/compare/all", validated_time, fast_time, 1)
+
+
+if __name__ == "__main__":
+    main()
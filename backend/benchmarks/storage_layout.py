@@ -0,0 +1,135 @@
+"""Compare the document and compact journey storage layouts.
+
+Run from the backend directory against a local mongod:
+
+    MONGO_URL=mongodb://localhost:27017 python -m benchmarks.storage_layout --journeys 100000
+
+or with ``--in-process`` to use mongomock-motor (if installed) as a stand-in,
+in which case only BSON sizes are meaningful.  The same seeded journeys are
+written to two scratch collections, one per layout.  For each layout the
+script reports BSON bytes, MongoDB's data and storage sizes where
+``collStats`` is available, and the best-of time to fetch and decode
+
+* frames: the analytics projection decoded into a ``JourneyFrame``
+* journeys: full documents decoded into the ``Journey`` layout
+
+Both decodes are checked to agree across layouts before timings are shown.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "attribution_bench")
+
+import bson  # noqa: E402
+import numpy as np  # noqa: E402
+from pymongo.errors import OperationFailure  # noqa: E402
+
+import compact  # noqa: E402
+import server  # noqa: E402
+from attribution_engine import ChannelIndex  # noqa: E402
+
+FRAME_COLUMNS = ("channel_ids", "sequence", "cost", "days_before", "offsets", "conversion_value", "touchpoint_count",
+                 "conversion_day")
+
+
+async def fetch(collection, projection, batch_size):
+    cursor = collection.find({}, projection).sort("journey_id", 1).batch_size(batch_size)
+    return await cursor.to_list(None)
+
+
+async def best_of(repeat, fn):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = await fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+async def sizes(db, name, documents):
+    encoded = sum(len(bson.encode(document)) for document in documents)
+    try:
+        stats = await db.command({"collStats": name})
+        return encoded, stats.get("size"), stats.get("storageSize")
+    except (NotImplementedError, OperationFailure, TypeError):
+        return encoded, None, None
+
+
+def megabytes(value):
+    return f"{value / 1e6:>10.2f}" if value is not None else f"{'n/a':>10}"
+
+
+async def run(args):
+    if args.in_process:
+        from mongomock_motor import AsyncMongoMockClient
+        db = AsyncMongoMockClient()[args.db]
+    else:
+        db = server.client[args.db]
+
+    codes = compact.CodeTable({"channel": server.CHANNELS, "interaction_type": server.INTERACTION_TYPES})
+    collections = {layout: db[f"journeys_{layout}"] for layout in compact.LAYOUTS}
+    for collection in collections.values():
+        await collection.drop()
+
+    generator = server.sample_generator(args.journeys, args.seed)
+    for index in range(generator.blocks):
+        journeys = generator.block(index)
+        await collections["compact"].insert_many(compact.encode_journeys(journeys, codes))
+        await collections["document"].insert_many(journeys)
+
+    results = {}
+    try:
+        for layout, collection in collections.items():
+            frame_projection = compact.translate_projection(server.FRAME_PROJECTION, layout)
+            stored = await fetch(collection, {"_id": 0}, args.batch_size)
+            size = await sizes(db, collection.name, stored)
+
+            async def frames():
+                batch = await fetch(collection, frame_projection, args.batch_size)
+                return compact.decode_frame(batch, ChannelIndex(server.CHANNELS), codes)
+
+            async def journeys():
+                return compact.decode_journeys(await fetch(collection, {"_id": 0}, args.batch_size), codes)
+
+            frame_time, frame = await best_of(args.repeat, frames)
+            journey_time, decoded = await best_of(args.repeat, journeys)
+            results[layout] = (size, frame_time, journey_time, frame, decoded)
+    finally:
+        for collection in collections.values():
+            await collection.drop()
+
+    expected, actual = results["document"], results["compact"]
+    for column in FRAME_COLUMNS:
+        if not np.array_equal(getattr(expected[3], column), getattr(actual[3], column)):
+            raise SystemExit(f"compact frames differ from document frames in {column}")
+    if expected[4] != actual[4]:
+        raise SystemExit("compact journeys decode differently from document journeys")
+
+    print(f"{args.journeys} journeys, best of {args.repeat}")
+    print(f"{'layout':<10}{'BSON MB':>10}{'data MB':>10}{'disk MB':>10}{'frames ms':>12}{'journeys ms':>13}")
+    for layout, ((encoded, data, storage), frame_time, journey_time, _, _) in results.items():
+        print(
+            f"{layout:<10}{megabytes(encoded)}{megabytes(data)}{megabytes(storage)}"
+            f"{frame_time * 1000:>12.1f}{journey_time * 1000:>13.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--journeys", type=int, default=100_000)
+    parser.add_argument("--db", default=os.environ["DB_NAME"])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=server.JOURNEY_BATCH_SIZE)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--in-process", action="store_true")
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
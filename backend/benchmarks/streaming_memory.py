@@ -0,0 +1,85 @@
+"""Check that streamed aggregation keeps resident memory flat.
+
+Run from the backend directory:
+
+    python -m benchmarks.streaming_memory --journeys 1000000
+
+Synthetic journeys are produced one batch at a time and folded through every
+attribution model and analytics accumulator exactly as the endpoints do.  The
+run fails if peak RSS grows by more than ``--max-growth-mb`` after warm-up.
+"""
+import argparse
+import asyncio
+import os
+import random
+import resource
+import time
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "attribution_bench")
+
+import server  # noqa: E402
+from analytics import (  # noqa: E402
+    ChannelMetricsAccumulator, FunnelAccumulator, RevenueTrendsAccumulator, StatsAccumulator, SynergyAccumulator
+)
+from attribution_engine import AttributionMatrix, ChannelIndex, JourneyFrame  # noqa: E402
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def synthetic_frames(index, journeys, batch_size, samples):
+    produced = 0
+    while produced < journeys:
+        count = min(batch_size, journeys - produced)
+        yield JourneyFrame.from_journeys(server.build_sample_journeys(count), index)
+        produced += count
+        samples.append((produced, peak_rss_mb()))
+
+
+async def run(args):
+    index = ChannelIndex(server.CHANNELS)
+    accumulators = [
+        AttributionMatrix(index, list(server.MODEL_LABELS)),
+        StatsAccumulator(),
+        ChannelMetricsAccumulator(),
+        RevenueTrendsAccumulator(),
+        SynergyAccumulator(),
+        FunnelAccumulator(),
+    ]
+    samples = []
+    started = time.perf_counter()
+    journeys = await server.fold_frames(
+        synthetic_frames(index, args.journeys, args.batch_size, samples), *accumulators
+    )
+    elapsed = time.perf_counter() - started
+    return journeys, elapsed, samples, accumulators
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--journeys", type=int, default=1_000_000)
+    parser.add_argument("--batch-size", type=int, default=server.JOURNEY_BATCH_SIZE)
+    parser.add_argument("--max-growth-mb", type=float, default=32)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    journeys, elapsed, samples, accumulators = asyncio.run(run(args))
+
+    warm = samples[min(len(samples) - 1, max(1, len(samples) // 10))][1]
+    peak = samples[-1][1]
+    print(f"{journeys} journeys in {elapsed:.1f}s, batch size {args.batch_size}")
+    print(f"peak RSS after warm-up {warm:.1f} MB, at end {peak:.1f} MB (growth {peak - warm:.1f} MB)")
+    print(f"total conversions folded: {accumulators[1].result()['total_conversions']}")
+
+    if journeys != args.journeys:
+        raise SystemExit("not every journey was folded")
+    if peak - warm > args.max_growth_mb:
+        raise SystemExit(f"RSS grew by more than {args.max_growth_mb} MB while streaming")
+
+
+if __name__ == "__main__":
+    main()
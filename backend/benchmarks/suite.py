@@ -0,0 +1,326 @@
+"""Time every attribution model and analytics endpoint at several dataset sizes.
+
+Run from the backend directory:
+
+    python -m benchmarks.suite --sizes 1k,100k --save-baseline
+    python -m benchmarks.suite --sizes 1k,100k            # compare with the saved baseline
+    python -m benchmarks.suite --sizes 1m,10m --modes in-process --repeat 3
+
+Each size is a seeded dataset written once as a columnar snapshot (see
+snapshot.py) under ``--data-dir`` and reused by later runs.  Two modes are
+timed over it:
+
+* ``in-process``: each model and accumulator folds the snapshot's frames
+  directly, which isolates the engine from I/O and the web stack.
+* ``asgi``: each endpoint is requested through an httpx ASGI client with the
+  result cache cleared first.  ``--source snapshot`` (the default) serves
+  analytics from the snapshot with mongomock-motor standing in for the rest
+  of MongoDB, which scales to 10M journeys on a laptop; ``mongomock`` or
+  ``mongod`` load the journeys into that database instead (keep those to
+  small sizes), so aggregation pipelines and the materialized aggregates are
+  exercised too.
+
+For every case the suite reports p50/p99 latency over ``--repeat`` runs,
+throughput in journeys per second at the p50, and peak traced memory from
+one extra run under tracemalloc.  ``--save-baseline`` writes the results to
+``--baseline``; otherwise an existing baseline is compared and the run fails
+when a case's p50 or peak memory exceeds it by more than ``--threshold``.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "attribution_bench")
+
+import numpy as np  # noqa: E402
+
+import server  # noqa: E402
+import snapshot  # noqa: E402
+from analytics import (  # noqa: E402
+    ChannelMetricsAccumulator, FunnelAccumulator, RevenueTrendsAccumulator, StatsAccumulator, SynergyAccumulator
+)
+from attribution_engine import MODEL_NAMES, AttributionMatrix, ChannelIndex, spread_statistics  # noqa: E402
+from markov import MarkovAccumulator, MarkovModel  # noqa: E402
+from paths import PathAccumulator, PathIndex  # noqa: E402
+from shapley import ShapleyAccumulator  # noqa: E402
+
+SUFFIXES = {"k": 1_000, "m": 1_000_000}
+
+MODES = ("in-process", "asgi")
+
+SOURCES = ("snapshot", "mongomock", "mongod")
+
+# Absolute growth below this is timer noise on millisecond cases, whatever the ratio
+NOISE = {"p50_ms": 5.0, "peak_memory_mb": 1.0}
+
+ENDPOINTS = (
+    [f"/api/attribution/{model}" for model in server.MODEL_LABELS]
+    + ["/api/attribution/markov", "/api/attribution/shapley", "/api/attribution/compare/all", "/api/stats",
+       "/api/advanced-metrics", "/api/revenue-trends", "/api/channel-synergy", "/api/funnel-analysis",
+       "/api/top-performers", "/api/attribution-variance", "/api/path-analysis", "/api/dashboard",
+       "/api/attribution/linear?sample=0.05", "/api/attribution/compare/all?max_error=0.01"]
+)
+
+# Every widget of /api/dashboard, answered together for comparison with the endpoints above
+DASHBOARD = {"widgets": [
+    *({"widget": "attribution", "id": model, "params": {"model": model}} for model in [*server.MODEL_LABELS, "markov", "shapley"]),
+    *({"widget": widget} for widget in server.DASHBOARD_WIDGETS if widget != "attribution")
+]}
+
+
+def parse_size(value: str) -> int:
+    value = value.strip().lower()
+    if value[-1:] in SUFFIXES:
+        return int(float(value[:-1]) * SUFFIXES[value[-1]])
+    return int(value)
+
+
+def size_label(journeys: int) -> str:
+    for suffix, scale in sorted(SUFFIXES.items(), key=lambda item: -item[1]):
+        if journeys >= scale and journeys % scale == 0:
+            return f"{journeys // scale}{suffix}"
+    return str(journeys)
+
+
+def dataset(data_dir: Path, journeys: int, seed: int) -> snapshot.Snapshot:
+    """The seeded snapshot of `journeys` journeys, generated on first use"""
+    path = data_dir / f"journeys-{size_label(journeys)}-seed{seed}"
+    try:
+        existing = snapshot.Snapshot(path)
+        if existing.journeys == journeys:
+            return existing
+    except snapshot.SnapshotUnavailable:
+        pass
+    started = time.perf_counter()
+    snapshot.generate(path, journeys, seed)
+    print(f"generated {journeys} journeys in {time.perf_counter() - started:.1f}s -> {path}")
+    return snapshot.Snapshot(path)
+
+
+# In-process cases: a fold over every frame and whatever the endpoint computes from the result
+def fold(data, batch_size, accumulator):
+    for frame in data.frames(ChannelIndex(server.CHANNELS), batch_size):
+        accumulator.update(frame)
+    return accumulator
+
+
+def model_case(model):
+    def case(data, batch_size):
+        matrix = AttributionMatrix(ChannelIndex(server.CHANNELS), [model])
+        fold(data, batch_size, matrix)
+        return matrix.channel_data(model)
+    return case
+
+
+def markov_case(data, batch_size):
+    markov = MarkovAccumulator(1)
+    fold(data, batch_size, markov)
+    return MarkovModel(markov)
+
+
+def shapley_case(data, batch_size):
+    coalitions = ShapleyAccumulator()
+    fold(data, batch_size, coalitions)
+    return coalitions.coalition_game().exact()
+
+
+def variance_case(data, batch_size):
+    matrix = AttributionMatrix(ChannelIndex(server.CHANNELS), server.VARIANCE_MODELS)
+    fold(data, batch_size, matrix)
+    return spread_statistics(matrix.revenue.T, matrix.present().T)
+
+
+def accumulator_case(accumulator_class, finish=lambda accumulator: accumulator.result()):
+    def case(data, batch_size):
+        accumulator = accumulator_class()
+        fold(data, batch_size, accumulator)
+        return finish(accumulator)
+    return case
+
+
+IN_PROCESS_CASES = {
+    **{model: model_case(model) for model in MODEL_NAMES},
+    "markov": markov_case,
+    "shapley": shapley_case,
+    "attribution_variance": variance_case,
+    "stats": accumulator_case(StatsAccumulator),
+    "advanced_metrics": accumulator_case(ChannelMetricsAccumulator),
+    "revenue_trends": accumulator_case(RevenueTrendsAccumulator),
+    "channel_synergy": accumulator_case(SynergyAccumulator),
+    "funnel_analysis": accumulator_case(FunnelAccumulator),
+    "path_analysis": accumulator_case(PathAccumulator, lambda paths: PathIndex(paths).top(10)),
+}
+
+
+def summarize(timings, journeys, peak_bytes):
+    p50, p99 = np.percentile(timings, [50, 99]).tolist()
+    return {
+        "repeats": len(timings),
+        "p50_ms": round(p50 * 1000, 3),
+        "p99_ms": round(p99 * 1000, 3),
+        "journeys_per_second": round(journeys / p50) if p50 else None,
+        "peak_memory_mb": round(peak_bytes / 1e6, 2)
+    }
+
+
+def traced_peak(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_in_process(data, args):
+    results = {}
+    for name, case in IN_PROCESS_CASES.items():
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            case(data, args.batch_size)
+            timings.append(time.perf_counter() - started)
+        results[name] = summarize(timings, data.journeys, traced_peak(lambda: case(data, args.batch_size)))
+    return results
+
+
+async def prepare_asgi(data, journeys, args):
+    """Point the server at the dataset through the chosen MongoDB stand-in"""
+    from mongomock_motor import AsyncMongoMockClient
+
+    if args.source == "mongod":
+        server.db = server.client[args.db]
+    else:
+        server.db = AsyncMongoMockClient()[args.db]
+    if args.source == "snapshot":
+        server.journey_source = server.SnapshotJourneySource(data.path)
+        return
+
+    server.journey_source = server.mongo_journeys
+    await server.db.journeys.drop()
+    generator = server.sample_generator(journeys, args.seed)
+    for block in range(generator.blocks):
+        await server.db.journeys.insert_many(await server.stored_documents(generator.block(block)), ordered=False)
+    await server.rebuild_attribution_aggregates()
+
+
+async def run_asgi(data, journeys, args):
+    from httpx import ASGITransport, AsyncClient
+
+    await prepare_asgi(data, journeys, args)
+    results = {}
+    async with AsyncClient(transport=ASGITransport(app=server.app), base_url="http://bench", timeout=None) as client:
+        async def request(path):
+            # Every repeat computes from scratch
+            server.result_cache.clear()
+            if path == "/api/dashboard":
+                response = await client.post(path, json=DASHBOARD)
+            else:
+                response = await client.get(path)
+            if response.status_code != 200:
+                raise SystemExit(f"{path} answered {response.status_code}: {response.text[:200]}")
+
+        for path in ENDPOINTS:
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                await request(path)
+                timings.append(time.perf_counter() - started)
+            tracemalloc.start()
+            try:
+                await request(path)
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+            results[path] = summarize(timings, journeys, peak)
+    if args.source != "snapshot":
+        await server.db.journeys.drop()
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Cases whose p50 latency or peak memory grew by more than `threshold` over the baseline"""
+    regressions = []
+    for key, result in results.items():
+        before = baseline.get(key)
+        if before is None:
+            continue
+        for measure, noise in NOISE.items():
+            if result[measure] > max(before[measure] * (1 + threshold), before[measure] + noise):
+                regressions.append((key, measure, before[measure], result[measure]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1k,100k", help="Comma-separated journey counts, e.g. 1k,100k,1m,10m")
+    parser.add_argument("--modes", default=",".join(MODES), help="Comma-separated subset of in-process,asgi")
+    parser.add_argument("--source", choices=SOURCES, default="snapshot", help="Where asgi mode reads journeys from")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=server.JOURNEY_BATCH_SIZE)
+    parser.add_argument("--db", default=os.environ["DB_NAME"])
+    parser.add_argument("--data-dir", type=Path, default=Path(tempfile.gettempdir()) / "attribution-benchmarks")
+    parser.add_argument("--baseline", type=Path, default=Path(__file__).parent / "baseline.json")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed relative growth before flagging")
+    args = parser.parse_args()
+
+    modes = [mode.strip() for mode in args.modes.split(",")]
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        parser.error(f"unknown modes: {', '.join(sorted(unknown))}")
+
+    results = {}
+    for journeys in map(parse_size, args.sizes.split(",")):
+        data = dataset(args.data_dir, journeys, args.seed)
+        if "in-process" in modes:
+            for name, result in run_in_process(data, args).items():
+                results[f"in-process {name} {size_label(journeys)}"] = result
+        if "asgi" in modes:
+            for path, result in asyncio.run(run_asgi(data, journeys, args)).items():
+                results[f"asgi:{args.source} {path} {size_label(journeys)}"] = result
+
+    baseline = {}
+    if args.baseline.exists() and not args.save_baseline:
+        baseline = json.loads(args.baseline.read_text())["results"]
+    regressions = compare(results, baseline, args.threshold)
+    flagged = {key for key, *_ in regressions}
+
+    width = max([58, *map(len, results)]) + 2
+    print(f"{'case':<{width}}{'p50 ms':>10}{'p99 ms':>10}{'journeys/s':>14}{'peak MB':>10}")
+    for key, result in results.items():
+        rate = result["journeys_per_second"]
+        print(
+            f"{key:<{width}}{result['p50_ms']:>10.1f}{result['p99_ms']:>10.1f}{rate if rate is not None else 'n/a':>14}"
+            f"{result['peak_memory_mb']:>10.1f}{'  REGRESSED' if key in flagged else ''}"
+        )
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps({
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.platform(),
+            "seed": args.seed,
+            "results": results
+        }, indent=2) + "\n")
+        print(f"baseline saved to {args.baseline}")
+    elif baseline:
+        for key, measure, before, after in regressions:
+            print(f"{key}: {measure} {before} -> {after}")
+        if regressions:
+            raise SystemExit(f"{len(regressions)} measures regressed by more than {args.threshold:.0%}")
+        print(f"no regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""Compact journey storage layout.
+
+In the default ``document`` layout every touchpoint is a subdocument that
+repeats its field names, channel name, interaction type and an ISO timestamp.
+The ``compact`` layout (``JOURNEY_STORAGE=compact``) keeps the journey-level
+fields and replaces ``touchpoints`` with parallel arrays under ``tp``:
+
+    tp.s  sequence        tp.c  channel code
+    tp.t  epoch seconds   tp.i  interaction type code
+    tp.k  cost            tp.d  days before conversion
+
+Codes index the name lists in ``db.journey_codes``.  Names are only ever
+appended there, so a code keeps its meaning for the life of the collection.
+Readers decode either layout, which keeps a half-migrated collection
+readable.  Convert an existing collection from the backend directory:
+
+    python -m compact migrate --to compact
+    python -m compact migrate --to document
+"""
+import argparse
+import asyncio
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Union
+
+import numpy as np
+
+from attribution_engine import ChannelIndex, JourneyFrame
+
+LAYOUTS = ("document", "compact")
+
+TOUCHPOINT_KEYS = {
+    "sequence": "s",
+    "channel": "c",
+    "timestamp": "t",
+    "cost": "k",
+    "interaction_type": "i",
+    "days_before_conversion": "d"
+}
+TOUCHPOINT_FIELDS = {key: field for field, key in TOUCHPOINT_KEYS.items()}
+
+CODED_FIELDS = ("channel", "interaction_type")
+
+
+class UnknownCode(LookupError):
+    """Raised when a document uses a code added by another process after this one loaded its table"""
+
+
+class CodeTable:
+    """Code <-> name lists for the coded touchpoint fields"""
+
+    def __init__(self, names: Optional[Dict[str, List[str]]] = None):
+        names = names or {}
+        self.names = {field: list(names.get(field, [])) for field in CODED_FIELDS}
+        self.codes = {field: {name: code for code, name in enumerate(values)} for field, values in self.names.items()}
+
+    def missing(self, journeys: Iterable[Dict]) -> Dict[str, List[str]]:
+        """Names used by document-layout journeys that have no code yet, in first-seen order"""
+        missing = {field: {} for field in CODED_FIELDS}
+        for journey in journeys:
+            for tp in journey["touchpoints"]:
+                for field in CODED_FIELDS:
+                    if tp[field] not in self.codes[field]:
+                        missing[field][tp[field]] = None
+        return {field: list(names) for field, names in missing.items() if names}
+
+
+def encode_timestamp(value: str) -> Union[int, float]:
+    """Epoch seconds of an ISO timestamp; naive timestamps are taken as UTC"""
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    seconds = moment.timestamp()
+    return int(seconds) if seconds.is_integer() else seconds
+
+
+def decode_timestamp(seconds: Union[int, float]) -> str:
+    return datetime.fromtimestamp(seconds, timezone.utc).isoformat()
+
+
+def encode_journeys(journeys: List[Dict], codes: CodeTable) -> List[Dict]:
+    """Compact documents for document-layout journeys whose names all have codes"""
+    channel_codes = codes.codes["channel"]
+    interaction_codes = codes.codes["interaction_type"]
+    # Generated data reuses a few hundred distinct timestamps
+    seconds = {}
+    documents = []
+    for journey in journeys:
+        document = {field: value for field, value in journey.items() if field not in ("_id", "touchpoints")}
+        touchpoints = journey["touchpoints"]
+        stamps = []
+        for tp in touchpoints:
+            stamp = seconds.get(tp["timestamp"])
+            if stamp is None:
+                stamp = seconds[tp["timestamp"]] = encode_timestamp(tp["timestamp"])
+            stamps.append(stamp)
+        document["tp"] = {
+            "s": [tp["sequence"] for tp in touchpoints],
+            "c": [channel_codes[tp["channel"]] for tp in touchpoints],
+            "t": stamps,
+            "k": [tp["cost"] for tp in touchpoints],
+            "i": [interaction_codes[tp["interaction_type"]] for tp in touchpoints],
+            "d": [tp["days_before_conversion"] for tp in touchpoints]
+        }
+        documents.append(document)
+    return documents
+
+
+def decode_journey(document: Dict, codes: CodeTable, stamps: Optional[Dict] = None) -> Dict:
+    """A stored journey in the document layout; projected documents keep only their projected fields"""
+    if "tp" not in document:
+        return document
+    stamps = {} if stamps is None else stamps
+    columns = {}
+    for key, values in document["tp"].items():
+        field = TOUCHPOINT_FIELDS[key]
+        if field in CODED_FIELDS:
+            names = codes.names[field]
+            try:
+                values = [names[code] for code in values]
+            except IndexError:
+                raise UnknownCode(f"{field} code out of range in journey {document.get('journey_id')}")
+        elif field == "timestamp":
+            values = [stamps[value] if value in stamps else stamps.setdefault(value, decode_timestamp(value))
+                      for value in values]
+        columns[field] = values
+    journey = {field: value for field, value in document.items() if field != "tp"}
+    # Keep the Journey field order, in which touchpoints come last
+    journey["touchpoints"] = [dict(zip(columns, values)) for values in zip(*columns.values())]
+    return journey
+
+
+def decode_journeys(documents: List[Dict], codes: CodeTable) -> List[Dict]:
+    # Timestamps repeat across a batch, so each distinct one is formatted once
+    stamps = {}
+    return [decode_journey(document, codes, stamps) for document in documents]
+
+
+def decode_frame(documents: List[Dict], index: ChannelIndex, codes: CodeTable) -> JourneyFrame:
+    """Decode stored journeys of either layout into a frame; compact arrays are concatenated without per-touchpoint work"""
+    if not all("tp" in document for document in documents):
+        return JourneyFrame.from_journeys(decode_journeys(documents, codes), index)
+
+    channels = []
+    sequence = []
+    cost = []
+    days_before = []
+    offsets = [0]
+    conversion_value = []
+    touchpoint_count = []
+    time_to_conversion = []
+    conversion_day = []
+
+    for document in documents:
+        tp = document["tp"]
+        channels.extend(tp["c"])
+        sequence.extend(tp["s"])
+        cost.extend(tp["k"])
+        days_before.extend(tp["d"])
+        offsets.append(offsets[-1] + len(tp["c"]))
+        conversion_value.append(document["conversion_value"])
+        touchpoint_count.append(document["touchpoint_count"])
+        time_to_conversion.append(document.get("time_to_conversion", 0))
+        day = document.get("conversion_date", "")
+        conversion_day.append(day[:10] if isinstance(day, str) else day.date())
+
+    # Channel codes map onto the frame's channel ids through one lookup table
+    lookup = np.array([index.id_for(name) for name in codes.names["channel"]], dtype=np.int32)
+    channel_codes = np.asarray(channels, dtype=np.int64)
+    if channel_codes.size and channel_codes.max() >= len(lookup):
+        raise UnknownCode(f"No channel with code {int(channel_codes.max())}")
+
+    return JourneyFrame(
+        index=index,
+        channel_ids=lookup[channel_codes],
+        sequence=np.asarray(sequence, dtype=np.int64),
+        cost=np.asarray(cost, dtype=np.float64),
+        days_before=np.asarray(days_before, dtype=np.int64),
+        offsets=np.asarray(offsets, dtype=np.int64),
+        conversion_value=np.asarray(conversion_value, dtype=np.float64),
+        touchpoint_count=np.asarray(touchpoint_count, dtype=np.int64),
+        time_to_conversion=np.asarray(time_to_conversion, dtype=np.int64),
+        conversion_day=np.asarray(conversion_day, dtype="datetime64[D]"),
+    )
+
+
+def touchpoint_path(field: str, layout: str) -> str:
+    """Stored path of a touchpoint field, e.g. for queries and indexes"""
+    return f"tp.{TOUCHPOINT_KEYS[field]}" if layout == "compact" else f"touchpoints.{field}"
+
+
+def translate_projection(projection: Dict, layout: str) -> Dict:
+    """A document-layout projection rewritten for the stored layout"""
+    if layout != "compact":
+        return projection
+    translated = {}
+    for field, include in projection.items():
+        parent, _, child = field.partition(".")
+        if parent == "touchpoints":
+            field = touchpoint_path(child, layout) if child else "tp"
+        translated[field] = include
+    return translated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the journeys collection between storage layouts")
+    parser.add_argument("command", choices=("migrate",))
+    parser.add_argument("--to", choices=LAYOUTS, required=True, dest="layout")
+    args = parser.parse_args()
+
+    import server
+
+    print(asyncio.run(server.migrate_journey_layout(args.layout)))
+
+
+if __name__ == "__main__":
+    main()
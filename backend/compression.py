@@ -0,0 +1,129 @@
+"""Negotiated gzip/brotli compression of responses.
+
+JSON, NDJSON and text responses of at least ``minimum_size`` bytes are
+encoded with the client's preferred coding from ``Accept-Encoding``: brotli
+when the brotli package is installed, gzip otherwise.  Streamed responses
+(``/api/journeys``) are compressed chunk by chunk with a flush after each, so
+pages keep streaming as they are read.  Responses that already carry a
+``Content-Encoding``, and bodiless ones such as 304s, pass through.
+"""
+import zlib
+from typing import Dict, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+# Preferred first when a client accepts several at the same quality
+ENCODINGS = ("br", "gzip")
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+
+def accepted_codings(accept_encoding: str) -> Dict[str, float]:
+    """Codings of an Accept-Encoding header with their q-values"""
+    codings = {}
+    for item in accept_encoding.split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        codings[coding.lower()] = quality
+    return codings
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """The coding to send, or None for identity"""
+    codings = accepted_codings(accept_encoding)
+    best, best_quality = None, 0.0
+    for encoding in ENCODINGS:
+        if encoding == "br" and brotli is None:
+            continue
+        quality = codings.get(encoding, codings.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class Encoder:
+    """Incremental compressor for one response body"""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self.compressor = brotli.Compressor(quality=brotli_quality)
+        else:
+            self.compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if self.encoding == "br":
+            out = self.compressor.process(data)
+            return out + (self.compressor.finish() if final else self.compressor.flush())
+        out = self.compressor.compress(data)
+        return out + self.compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing responses with the coding negotiated from Accept-Encoding"""
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        start = None
+        encoder = None
+
+        async def compressing_send(message):
+            nonlocal start, encoder
+            if message["type"] == "http.response.start":
+                # Held back until the first body chunk shows whether compressing is worthwhile
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start is not None:
+                headers = MutableHeaders(scope=start)
+                content_type = headers.get("content-type", "")
+                compressible = (
+                    "content-encoding" not in headers
+                    and start["status"] not in (204, 304)
+                    and content_type.startswith(COMPRESSIBLE_TYPES)
+                )
+                if compressible:
+                    headers.add_vary_header("Accept-Encoding")
+                    if encoding is not None and (more_body or len(body) >= self.minimum_size):
+                        encoder = Encoder(encoding, self.gzip_level, self.brotli_quality)
+                        headers["Content-Encoding"] = encoding
+                        del headers["Content-Length"]
+                        body = encoder.compress(body, final=not more_body)
+                        if not more_body:
+                            headers["Content-Length"] = str(len(body))
+                await send(start)
+                start = None
+            elif encoder is not None:
+                body = encoder.compress(body, final=not more_body)
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, compressing_send)
@@ -0,0 +1,91 @@
+"""Execution backends that keep CPU-bound analytics off the asyncio event loop.
+
+``thread`` runs work in a thread pool (NumPy releases the GIL for most of the
+reductions), ``process`` ships columnar frames to worker processes, and
+``inline`` runs on the caller for scripts and benchmarks.  Admission is
+bounded: once ``max_pending`` jobs are active new ones are refused with
+``ComputeOverloaded`` so the API can answer 503 instead of queueing forever.
+"""
+import asyncio
+import functools
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Optional
+
+BACKENDS = ("inline", "thread", "process")
+
+
+class ComputeOverloaded(Exception):
+    """Raised when the compute backend already has max_pending jobs"""
+
+
+class ComputeBackend:
+    """Bounded executor for attribution and analytics compute"""
+
+    def __init__(self, kind: str = "thread", workers: Optional[int] = None, max_pending: int = 32):
+        if kind not in BACKENDS:
+            raise ValueError(f"Unknown compute backend: {kind}")
+        self.kind = kind
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.pending = 0
+        self._executor: Optional[Executor] = None
+        self._decoder: Optional[Executor] = None
+
+    @property
+    def executor(self) -> Optional[Executor]:
+        if self.kind == "inline":
+            return None
+        if self._executor is None:
+            if self.kind == "process":
+                # spawn avoids forking the Motor client's background threads
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            else:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="compute")
+        return self._executor
+
+    @property
+    def decoder(self) -> Optional[Executor]:
+        """Thread pool for work on Python objects that should not be pickled to processes"""
+        if self.kind == "inline":
+            return None
+        if self.kind == "thread":
+            return self.executor
+        if self._decoder is None:
+            self._decoder = ThreadPoolExecutor(self.workers, thread_name_prefix="decode")
+        return self._decoder
+
+    @asynccontextmanager
+    async def admit(self):
+        """Reserve a job slot for the duration of a request's compute"""
+        if self.pending >= self.max_pending:
+            raise ComputeOverloaded(f"{self.pending} compute jobs already pending")
+        self.pending += 1
+        try:
+            yield self
+        finally:
+            self.pending -= 1
+
+    async def _submit(self, executor: Optional[Executor], fn: Callable, *args) -> Any:
+        if executor is None:
+            return fn(*args)
+        return await asyncio.get_running_loop().run_in_executor(executor, functools.partial(fn, *args))
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """Run picklable compute on the configured backend"""
+        return await self._submit(self.executor, fn, *args)
+
+    async def decode(self, fn: Callable, *args) -> Any:
+        """Run decoding of in-process objects (e.g. journey dicts) off the event loop"""
+        return await self._submit(self.decoder, fn, *args)
+
+    def stats(self) -> dict:
+        return {"backend": self.kind, "workers": self.workers, "pending": self.pending, "max_pending": self.max_pending}
+
+    def shutdown(self) -> None:
+        for executor in (self._executor, self._decoder):
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = self._decoder = None
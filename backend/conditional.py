@@ -0,0 +1,71 @@
+"""Conditional GET for routes whose responses depend only on a data version and the request.
+
+A route opts in with ``@conditional(version)``, where ``version`` is an async
+callable returning the current version of the data the route reads.  Its
+ETag hashes that version with the request path and query string, so a client
+repeating a request with ``If-None-Match`` gets ``304 Not Modified`` before
+any dependency or the endpoint itself runs.  Tags are weak: the same content
+may be sent identity-, gzip- or brotli-encoded (see compression.py), and
+sampled results are only semantically equivalent between computations.
+"""
+import hashlib
+from typing import Any, Awaitable, Callable, Optional
+
+from fastapi import Request, Response
+
+from metrics import InstrumentedRoute
+
+# Clients may store responses but must revalidate them, which costs a 304 when nothing changed
+CACHE_CONTROL = "no-cache"
+
+
+def conditional(version: Callable[[], Awaitable[Any]]):
+    """Tag a GET route's responses with an ETag derived from `version()` and the request"""
+    def decorator(func):
+        func.etag_version = version
+        return func
+    return decorator
+
+
+def entity_tag(version: Any, request: Request) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    # Values of a repeated parameter keep their order, which can matter (path-analysis ?path=)
+    query = sorted(request.query_params.multi_items(), key=lambda item: item[0])
+    for part in (repr(version), request.url.path, repr(query)):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return f'W/"{digest.hexdigest()}"'
+
+
+def matches(if_none_match: Optional[str], tag: str) -> bool:
+    """Weak comparison of an If-None-Match header against a tag"""
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = tag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(","))
+
+
+class ConditionalRoute(InstrumentedRoute):
+    """Instrumented route answering If-None-Match for endpoints marked with @conditional"""
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        version = getattr(self.endpoint, "etag_version", None)
+        if version is None:
+            return handler
+
+        async def conditional_handler(request: Request) -> Response:
+            if request.method != "GET":
+                return await handler(request)
+            # Read before the endpoint runs, so a tag never claims content older than it is
+            tag = entity_tag(await version(), request)
+            if matches(request.headers.get("if-none-match"), tag):
+                return Response(status_code=304, headers={"ETag": tag, "Cache-Control": CACHE_CONTROL})
+            response = await handler(request)
+            if response.status_code == 200:
+                response.headers["ETag"] = tag
+                response.headers["Cache-Control"] = CACHE_CONTROL
+            return response
+        return conditional_handler
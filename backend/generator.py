@@ -0,0 +1,177 @@
+"""Seeded, vectorized synthetic journey generation.
+
+Journeys are produced in fixed-size blocks.  Every block draws from its own
+``np.random.Generator`` seeded with ``(seed, block index)``, so a seed always
+yields the same dataset regardless of how many blocks are generated or
+inserted concurrently.  All random draws for a block happen as array
+operations; Python only assembles the final documents from ``tolist()``
+columns.
+"""
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+PATTERNS = ("paid_first", "organic_first", "mixed")
+
+# Journeys per block; part of what a seed means, so changing it changes generated data
+BLOCK_SIZE = 5000
+
+
+class JourneyGenerator:
+    """Sample journeys with the paid_first / organic_first / mixed flows of the original generator.
+
+    The first touchpoint is a paid channel (paid_first), an organic opener
+    (organic_first) or any channel (mixed); the last is a closing channel;
+    touchpoints in between are distinct channels not used yet.
+    """
+
+    def __init__(self, count: int, seed: int, channels: Sequence[str], paid_channels: Sequence[str],
+                 opening_channels: Sequence[str], closing_channels: Sequence[str],
+                 interaction_types: Sequence[str], names: Sequence[str],
+                 pattern_weights: Sequence[float] = (1, 1, 1), days: int = 90,
+                 end_date: Optional[datetime] = None):
+        weights = np.asarray(pattern_weights, dtype=np.float64)
+        if len(weights) != len(PATTERNS) or (weights < 0).any() or weights.sum() <= 0:
+            raise ValueError("Pattern weights must be three non-negative numbers with a positive sum")
+        self.count = count
+        self.seed = seed
+        self.pattern_probabilities = weights / weights.sum()
+        self.channels = list(channels)
+        self.channel_ids = {name: i for i, name in enumerate(self.channels)}
+        self.paid_ids = np.array([self.channel_ids[c] for c in paid_channels])
+        self.opening_ids = np.array([self.channel_ids[c] for c in opening_channels])
+        self.closing_ids = np.array([self.channel_ids[c] for c in closing_channels])
+        self.is_paid = np.isin(np.arange(len(self.channels)), self.paid_ids)
+        self.interaction_types = list(interaction_types)
+        self.names = list(names)
+        self.days = days
+        self.id_width = max(3, len(str(count)))
+
+        # Dates are anchored to the start of a UTC day so a seed reproduces the same data all day
+        end = end_date or datetime.now(timezone.utc)
+        end = end.replace(hour=0, minute=0, second=0, microsecond=0)
+        self.start_date = end - timedelta(days=days)
+        self.conversion_dates = [self.start_date + timedelta(days=day) for day in range(days + 1)]
+        # Touchpoints fall up to 45 days before the earliest conversion day
+        self.timestamps = [(self.start_date + timedelta(days=offset)).isoformat() for offset in range(-45, days + 1)]
+
+    @property
+    def blocks(self) -> int:
+        return -(-self.count // BLOCK_SIZE)
+
+    def block(self, index: int) -> List[Dict]:
+        """Journey documents for block `index`"""
+        first = index * BLOCK_SIZE
+        n = min(BLOCK_SIZE, self.count - first)
+        if n <= 0:
+            return []
+        rng = np.random.default_rng([self.seed, index])
+        n_channels = len(self.channels)
+
+        names = rng.integers(0, len(self.names), n)
+        conversion_value = np.round(rng.uniform(1000, 50000, n), 2)
+        time_to_conversion = rng.integers(1, 46, n)
+        conversion_day = rng.integers(0, self.days + 1, n)
+        touchpoint_count = rng.integers(2, 9, n)
+        pattern = rng.choice(len(PATTERNS), n, p=self.pattern_probabilities)
+
+        # Opening channel by pattern, then a random order of the remaining channels for the middle
+        opener = np.where(
+            pattern == 0,
+            self.paid_ids[rng.integers(0, len(self.paid_ids), n)],
+            np.where(pattern == 1, self.opening_ids[rng.integers(0, len(self.opening_ids), n)], -1)
+        )
+        keys = rng.random((n, n_channels))
+        rows = np.flatnonzero(opener >= 0)
+        keys[rows, opener[rows]] = -1.0
+        order = np.argsort(keys, axis=1)
+        closer = self.closing_ids[rng.integers(0, len(self.closing_ids), n)]
+
+        # Flatten to one row per touchpoint
+        offsets = np.concatenate([[0], np.cumsum(touchpoint_count)])
+        total = int(offsets[-1])
+        journey = np.repeat(np.arange(n), touchpoint_count)
+        position = np.arange(total) - offsets[:-1][journey]
+        count = touchpoint_count[journey]
+        channel = np.where(position == count - 1, closer[journey], order[journey, np.minimum(position, n_channels - 1)])
+
+        seq = position + 1
+        ttc = time_to_conversion[journey]
+        days_before = np.floor((ttc / count) * (count - seq)).astype(np.int64)
+        cost = np.where(self.is_paid[channel], np.round(rng.uniform(50, 5000, total), 2), 0.0)
+        interaction = rng.integers(0, len(self.interaction_types), total)
+        stamp = conversion_day[journey] - days_before + 45
+
+        channel_names = self.channels
+        interaction_types = self.interaction_types
+        timestamps = self.timestamps
+        touchpoints = [
+            {
+                "sequence": s,
+                "channel": channel_names[c],
+                "timestamp": timestamps[t],
+                "cost": v,
+                "interaction_type": interaction_types[i],
+                "days_before_conversion": d
+            }
+            for s, c, t, v, i, d in zip(seq.tolist(), channel.tolist(), stamp.tolist(), cost.tolist(),
+                                        interaction.tolist(), days_before.tolist())
+        ]
+
+        journeys = []
+        bounds = offsets.tolist()
+        for row, (name, value, ttc_days, day, tp_count) in enumerate(zip(
+                names.tolist(), conversion_value.tolist(), time_to_conversion.tolist(),
+                conversion_day.tolist(), touchpoint_count.tolist())):
+            journeys.append({
+                "journey_id": f"J{first + row + 1:0{self.id_width}d}",
+                "customer_name": self.names[name],
+                "conversion_value": value,
+                "conversion_date": self.conversion_dates[day],
+                "touchpoint_count": tp_count,
+                "time_to_conversion": ttc_days,
+                "touchpoints": touchpoints[bounds[row]:bounds[row + 1]]
+            })
+        return journeys
+
+    def journeys(self) -> List[Dict]:
+        """Every journey in one list; for small counts only"""
+        return [journey for index in range(self.blocks) for journey in self.block(index)]
+
+
+class GenerationProgress:
+    """Progress of a generation run, readable while it is in flight"""
+
+    def __init__(self, job_id: str, count: int, seed: int):
+        self.job_id = job_id
+        self.count = count
+        self.seed = seed
+        self.generated = 0
+        self.status = "running"
+        self.error: Optional[str] = None
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+
+    def advance(self, journeys: int) -> None:
+        self.generated += journeys
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self.finished = time.monotonic()
+        self.status = "failed" if error else "completed"
+        self.error = str(error) if error else None
+
+    def snapshot(self) -> Dict:
+        elapsed = (self.finished or time.monotonic()) - self.started
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "count": self.count,
+            "generated": self.generated,
+            "percent": round(self.generated / self.count * 100, 2) if self.count else 100.0,
+            "seed": self.seed,
+            "elapsed_seconds": round(elapsed, 2),
+            "journeys_per_second": round(self.generated / elapsed, 1) if elapsed > 0 else 0.0,
+            "error": self.error
+        }
@@ -0,0 +1,94 @@
+"""Streaming NDJSON ingestion helpers.
+
+The request body is split into lines as it arrives, lines are parsed and
+validated a batch at a time, and every rejected line is reported by its
+1-based line number: invalid JSON, schema violations and documents MongoDB
+refuses (e.g. a duplicate ``journey_id``) alike.
+"""
+import json
+from typing import AsyncIterable, AsyncIterator, Callable, Dict, List, Tuple
+
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+
+
+class LineTooLong(Exception):
+    """Raised when a line grows past the configured limit without a newline"""
+
+
+async def iter_lines(chunks: AsyncIterable[bytes], max_line_bytes: int) -> AsyncIterator[Tuple[int, bytes]]:
+    """Yield (line number, line) for every non-blank line of a chunked body"""
+    buffer = b""
+    number = 0
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            number += 1
+            if line.strip():
+                yield number, line
+        if len(buffer) > max_line_bytes:
+            raise LineTooLong(f"Line {number + 1} exceeds {max_line_bytes} bytes")
+    if buffer.strip():
+        yield number + 1, buffer
+
+
+def describe_error(error: ValueError) -> str:
+    if isinstance(error, ValidationError):
+        return "; ".join(
+            f"{'.'.join(str(part) for part in detail['loc'])}: {detail['msg']}" for detail in error.errors()
+        )
+    return str(error)
+
+
+def parse_lines(lines: List[Tuple[int, bytes]],
+                to_document: Callable[[Dict], Dict]) -> Tuple[List[Tuple[int, Dict]], List[Dict]]:
+    """Parse and validate a batch of lines into (line number, document) pairs and per-line errors"""
+    documents = []
+    errors = []
+    for number, line in lines:
+        try:
+            payload = json.loads(line)
+        except ValueError as e:
+            errors.append({"line": number, "error": f"Invalid JSON: {e}"})
+            continue
+        if not isinstance(payload, dict):
+            errors.append({"line": number, "error": "Expected a JSON object"})
+            continue
+        try:
+            documents.append((number, to_document(payload)))
+        except ValueError as e:
+            errors.append({"line": number, "error": describe_error(e)})
+    return documents, errors
+
+
+def write_errors(error: BulkWriteError, line_numbers: List[int]) -> List[Dict]:
+    """Per-line errors for the documents an unordered insert_many rejected"""
+    return [
+        {"line": line_numbers[detail["index"]], "error": detail.get("errmsg", "Write failed")}
+        for detail in error.details.get("writeErrors", [])
+    ]
+
+
+class IngestReport:
+    """Counts for one upload plus the first `max_errors` per-line errors"""
+
+    def __init__(self, max_errors: int = 1000):
+        self.max_errors = max_errors
+        self.received = 0
+        self.inserted = 0
+        self.failed = 0
+        self.errors: List[Dict] = []
+
+    def add_errors(self, errors: List[Dict]) -> None:
+        self.failed += len(errors)
+        self.errors.extend(errors[:max(0, self.max_errors - len(self.errors))])
+
+    def result(self) -> Dict:
+        return {
+            "received": self.received,
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "errors": sorted(self.errors, key=lambda error: error["line"]),
+            "errors_truncated": self.failed > len(self.errors)
+        }
@@ -0,0 +1,175 @@
+"""Markov-chain removal-effect attribution.
+
+Journeys become paths ``START -> channels... -> CONVERSION``.  For an order-k
+chain a state is the last k symbols of the path, encoded as a base-B integer.
+Transition counts are accumulated per batch with ``np.unique`` over
+(from, to) state codes, giving a sparse COO transition table.  Conversion
+probabilities come from solving the absorbing-chain system ``(I - Q) x = r``,
+once for the full graph and once per channel with that channel removed.
+"""
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from attribution_engine import ChannelIndex, JourneyFrame
+
+CONVERSION_STATE = -1
+
+# Above this many transient states the system is solved iteratively on the sparse table
+DENSE_SOLVE_LIMIT = 2000
+
+
+class MarkovAccumulator:
+    """Sparse order-k transition counts folded batch by batch"""
+
+    def __init__(self, order: int = 1, max_channels: int = 62):
+        if order < 1:
+            raise ValueError("Markov order must be at least 1")
+        self.order = order
+        # Symbol base is fixed up front so state codes stay valid as the channel index grows
+        self.base = max_channels + 2
+        if self.base ** order >= 2 ** 62:
+            raise ValueError("Markov order too high for the channel count")
+        self.index: Optional[ChannelIndex] = None
+        self.from_states = np.zeros(0, dtype=np.int64)
+        self.to_states = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.journeys = 0
+
+    @property
+    def start_symbol(self) -> int:
+        return self.base - 2
+
+    @property
+    def conversion_symbol(self) -> int:
+        return self.base - 1
+
+    def update(self, frame: JourneyFrame) -> None:
+        if len(frame.index) > self.base - 2:
+            raise ValueError("Too many channels for this Markov accumulator")
+        self.index = frame.index
+        if not frame.journey_count:
+            return
+
+        # Paths with START and CONVERSION symbols around each journey's channels
+        n_journeys = frame.journey_count
+        path_offsets = frame.offsets + 2 * np.arange(n_journeys + 1)
+        symbols = np.empty(path_offsets[-1], dtype=np.int64)
+        is_channel = np.ones(len(symbols), dtype=bool)
+        is_channel[path_offsets[:-1]] = False
+        is_channel[path_offsets[1:] - 1] = False
+        symbols[is_channel] = frame.channel_ids
+        symbols[path_offsets[:-1]] = self.start_symbol
+        symbols[path_offsets[1:] - 1] = self.conversion_symbol
+
+        # State code at every path position: last `order` symbols, padded with START
+        path_start = np.repeat(path_offsets[:-1], np.diff(path_offsets))
+        positions = np.arange(len(symbols))
+        codes = np.zeros(len(symbols), dtype=np.int64)
+        for lag in range(self.order):
+            lagged = positions - lag
+            symbol = np.where(lagged >= path_start, symbols[np.maximum(lagged, 0)], self.start_symbol)
+            codes += symbol * self.base ** lag
+
+        # Transitions from every position except each path's final (conversion) position
+        source = np.ones(len(symbols), dtype=bool)
+        source[path_offsets[1:] - 1] = False
+        from_states = codes[source]
+        targets = np.flatnonzero(source) + 1
+        to_states = np.where(symbols[targets] == self.conversion_symbol, CONVERSION_STATE, codes[targets])
+
+        self._merge(from_states, to_states, np.ones(len(from_states), dtype=np.int64))
+        self.journeys += n_journeys
+
+    def _merge(self, from_states: np.ndarray, to_states: np.ndarray, counts: np.ndarray) -> None:
+        pairs = np.stack([
+            np.concatenate([self.from_states, from_states]),
+            np.concatenate([self.to_states, to_states]),
+        ])
+        unique, inverse = np.unique(pairs, axis=1, return_inverse=True)
+        self.from_states, self.to_states = unique
+        self.counts = np.bincount(
+            inverse.reshape(-1), weights=np.concatenate([self.counts, counts]), minlength=unique.shape[1]
+        ).astype(np.int64)
+
+    def fit(self) -> "MarkovModel":
+        return MarkovModel(self)
+
+
+class MarkovModel:
+    """Row-normalized transition table with removal effects per channel"""
+
+    def __init__(self, accumulator: MarkovAccumulator):
+        self.order = accumulator.order
+        self.base = accumulator.base
+        self.channels: List[str] = list(accumulator.index.names) if accumulator.index else []
+
+        states = np.unique(accumulator.from_states)
+        self.states = states
+        to_conversion = accumulator.to_states == CONVERSION_STATE
+        rows = np.searchsorted(states, accumulator.from_states)
+        totals = np.bincount(rows, weights=accumulator.counts, minlength=len(states))
+        probabilities = accumulator.counts / totals[rows] if len(rows) else accumulator.counts.astype(np.float64)
+
+        self.conversion = np.bincount(
+            rows[to_conversion], weights=probabilities[to_conversion], minlength=len(states)
+        )
+        self.rows = rows[~to_conversion]
+        self.cols = np.searchsorted(states, accumulator.to_states[~to_conversion])
+        self.probabilities = probabilities[~to_conversion]
+        # The channel a state currently sits on is its most recent symbol
+        self.current_symbol = states % self.base
+        start_code = sum((self.base - 2) * self.base ** lag for lag in range(self.order))
+        self.start = int(np.searchsorted(states, start_code)) if len(states) else 0
+
+        self.conversion_probability = self._absorption(np.ones(len(states), dtype=bool))
+        self.removal_effects = self._removal_effects()
+
+    def _absorption(self, keep: np.ndarray) -> float:
+        """Probability of reaching CONVERSION from START when only `keep` states remain"""
+        if not len(self.states) or not keep[self.start]:
+            return 0.0
+        kept = np.flatnonzero(keep)
+        position = np.full(len(self.states), -1, dtype=np.int64)
+        position[kept] = np.arange(len(kept))
+        edges = keep[self.rows] & keep[self.cols]
+        rows, cols, probabilities = position[self.rows[edges]], position[self.cols[edges]], self.probabilities[edges]
+        conversion = self.conversion[kept]
+
+        if len(kept) <= DENSE_SOLVE_LIMIT:
+            system = np.eye(len(kept))
+            np.subtract.at(system, (rows, cols), probabilities)
+            return float(np.linalg.solve(system, conversion)[position[self.start]])
+
+        # Fixed-point iteration x = r + Qx on the sparse table; converges because every path is absorbed
+        x = conversion.copy()
+        for _ in range(10_000):
+            updated = conversion + np.bincount(rows, weights=probabilities * x[cols], minlength=len(kept))
+            if np.max(np.abs(updated - x)) < 1e-12:
+                return float(updated[position[self.start]])
+            x = updated
+        return float(x[position[self.start]])
+
+    def _removal_effects(self) -> np.ndarray:
+        effects = np.zeros(len(self.channels), dtype=np.float64)
+        if self.conversion_probability <= 0:
+            return effects
+        for channel_id in range(len(self.channels)):
+            removed = self._absorption(self.current_symbol != channel_id)
+            effects[channel_id] = max(0.0, 1 - removed / self.conversion_probability)
+        return effects
+
+    def shares(self) -> np.ndarray:
+        """Removal effects normalized to sum to one"""
+        total = self.removal_effects.sum()
+        return self.removal_effects / total if total > 0 else self.removal_effects
+
+    def channel_data(self, touchpoint_data: Dict[str, Dict], total_revenue: float) -> Dict[str, Dict]:
+        """Attach Markov revenue to per-channel touchpoint, cost and position accumulators"""
+        shares = self.shares()
+        channel_data = {}
+        for channel, data in touchpoint_data.items():
+            channel_id = self.channels.index(channel) if channel in self.channels else None
+            share = shares[channel_id] if channel_id is not None and channel_id < len(shares) else 0.0
+            channel_data[channel] = {**data, "revenue": float(total_revenue * share)}
+        return channel_data
@@ -0,0 +1,334 @@
+"""Request instrumentation exposed in the Prometheus text format.
+
+``MetricsMiddleware`` gives every HTTP request a ``RequestTimings`` in a
+context variable.  Hot-path code reports into it with ``stage("db_fetch")``
+blocks and ``count_processed``, and ``InstrumentedRoute`` marks when the
+endpoint returns, so the time until the response starts is counted as
+serialization.  When the request finishes its totals are recorded per route
+in the histograms and counters of ``registry``, which ``render`` writes out
+for ``GET /metrics``.  Metrics are per process; with several workers each one
+is scraped separately.
+
+``monitor_event_loop`` records how late the event loop wakes from a short
+sleep, and ``StackSampler`` keeps a rolling window of sampled thread stacks
+so requests slower than a threshold can be dumped as folded stacks (one
+``frame;frame;frame count`` line per distinct stack, the input format of
+flamegraph tools).  Samples cover every thread, so a dump also shows work of
+requests that overlapped the slow one.
+"""
+import asyncio
+import bisect
+import functools
+import re
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from fastapi.routing import APIRoute
+
+# Seconds; request latencies range from cached lookups to multi-second full passes
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() and abs(value) < 1e15 else repr(float(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {_number(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, *labels: str, value: float) -> None:
+        self.values[labels] = value
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        # Per label set: observations per bucket (last one is +Inf), then their sum
+        self.values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, *labels: str, value: float) -> None:
+        counts, total = self.values.setdefault(labels, ([0] * (len(self.buckets) + 1), [0.0]))
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        names = self.label_names + ("le",)
+        for labels, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(names, labels + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {_number(total[0])}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Metrics in registration order, plus callbacks that refresh gauges just before rendering"""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors: List[Callable[[], None]] = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        for collect in self.collectors:
+            collect()
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+
+registry = Registry()
+
+requests_total = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route, method and status", ("route", "method", "status")))
+request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "Time from request to the last response byte", ("route", "method")))
+stage_duration = registry.register(Histogram(
+    "http_request_stage_seconds", "Time a request spent in each stage", ("route", "stage")))
+journeys_processed = registry.register(Counter(
+    "journeys_processed_total", "Journeys folded by analytics, by route", ("route",)))
+touchpoints_processed = registry.register(Counter(
+    "touchpoints_processed_total", "Touchpoints folded by analytics, by route", ("route",)))
+cache_lookups = registry.register(Counter(
+    "result_cache_lookups_total", "Result cache lookups by cached endpoint and outcome", ("endpoint", "outcome")))
+loop_lag = registry.register(Histogram(
+    "event_loop_lag_seconds", "How late the event loop woke from a timed sleep", buckets=LAG_BUCKETS))
+profiles_written = registry.register(Counter(
+    "slow_request_profiles_total", "Sampled profiles dumped for slow requests", ("route",)))
+
+
+class RequestTimings:
+    """Stage times and work counts of one request"""
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self.active: set = set()
+        self.journeys = 0
+        self.touchpoints = 0
+        self.returned: Optional[float] = None
+
+
+current: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Add the time spent in the block to the current request's `name` stage; nested blocks of a stage count once"""
+    timings = current.get()
+    if timings is None or name in timings.active:
+        yield
+        return
+    timings.active.add(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.active.discard(name)
+        timings.stages[name] = timings.stages.get(name, 0.0) + time.perf_counter() - started
+
+
+def timed(name: str) -> Callable:
+    """Count every call of a function towards the current request's `name` stage"""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count_processed(journeys: int, touchpoints: int) -> None:
+    timings = current.get()
+    if timings is not None:
+        timings.journeys += journeys
+        timings.touchpoints += touchpoints
+
+
+def record_cache_lookup(endpoint: str, hit: bool) -> None:
+    cache_lookups.inc(endpoint, "hit" if hit else "miss")
+
+
+class InstrumentedRoute(APIRoute):
+    """API route whose endpoint notes its path and when it returned"""
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        # include_router re-creates routes from already instrumented endpoints
+        if asyncio.iscoroutinefunction(endpoint) and not hasattr(endpoint, "route_path"):
+            endpoint = _mark_return(endpoint, path)
+        super().__init__(path, endpoint, **kwargs)
+
+
+def _mark_return(endpoint: Callable, path: str) -> Callable:
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        try:
+            return await endpoint(*args, **kwargs)
+        finally:
+            timings = current.get()
+            if timings is not None:
+                timings.returned = time.perf_counter()
+    wrapper.route_path = path
+    return wrapper
+
+
+def route_label(scope: Dict) -> str:
+    """Route template of a handled request; unmatched paths share one label to bound cardinality"""
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    return getattr(endpoint, "route_path", scope.get("path", "unmatched"))
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route latency, stage times and work counts"""
+
+    def __init__(self, app, sampler: Optional["StackSampler"] = None, slow_request_seconds: Optional[float] = None,
+                 profile_dir: Optional[Path] = None):
+        self.app = app
+        self.sampler = sampler
+        self.slow_request_seconds = slow_request_seconds
+        self.profile_dir = profile_dir
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = current.set(timings)
+        status = [500]
+        response_started = [None]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                response_started[0] = time.perf_counter()
+            await send(message)
+
+        started = time.perf_counter()
+        started_at = time.time()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current.reset(token)
+            elapsed = time.perf_counter() - started
+            route = route_label(scope)
+            requests_total.inc(route, scope["method"], str(status[0]))
+            request_duration.observe(route, scope["method"], value=elapsed)
+            if timings.returned is not None and response_started[0] is not None:
+                serialize = max(0.0, response_started[0] - timings.returned)
+                timings.stages["serialize"] = timings.stages.get("serialize", 0.0) + serialize
+            for name, seconds in timings.stages.items():
+                stage_duration.observe(route, name, value=seconds)
+            if timings.journeys:
+                journeys_processed.inc(route, amount=timings.journeys)
+                touchpoints_processed.inc(route, amount=timings.touchpoints)
+            if self.sampler is not None and self.slow_request_seconds is not None and elapsed >= self.slow_request_seconds:
+                profiles_written.inc(route)
+                asyncio.get_running_loop().run_in_executor(
+                    None, self.sampler.dump, started_at, started_at + elapsed, route, self.profile_dir
+                )
+
+
+async def monitor_event_loop(interval: float) -> None:
+    """Sleep for `interval` forever, recording how much later than requested each wake-up comes"""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        loop_lag.observe(value=max(0.0, loop.time() - started - interval))
+
+
+class StackSampler:
+    """Background thread sampling every other thread's Python stack into a time-bounded ring buffer"""
+
+    def __init__(self, interval: float = 0.005, window: float = 120.0):
+        self.interval = interval
+        self.samples: deque = deque(maxlen=max(1, int(window / interval)))
+        self.thread: Optional[threading.Thread] = None
+        self.stopped = threading.Event()
+
+    def start(self) -> None:
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+            self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                calls = []
+                while frame is not None:
+                    calls.append(f"{frame.f_code.co_name} ({Path(frame.f_code.co_filename).name}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stacks.append(";".join([names.get(ident, str(ident))] + calls[::-1]))
+            self.samples.append((time.time(), stacks))
+
+    def folded(self, start: float, end: float) -> Dict[str, int]:
+        """Sample counts per distinct stack between two wall-clock times"""
+        counts: Dict[str, int] = {}
+        for moment, stacks in list(self.samples):
+            if start <= moment <= end:
+                for stack in stacks:
+                    counts[stack] = counts.get(stack, 0) + 1
+        return counts
+
+    def dump(self, start: float, end: float, route: str, directory: Path) -> Path:
+        """Write the samples of a slow request as folded stacks named after its start time and route"""
+        directory.mkdir(parents=True, exist_ok=True)
+        name = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+        path = directory / f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime(start))}-{int(start * 1000) % 1000:03d}-{name}.folded"
+        counts = self.folded(start, end)
+        path.write_text("".join(f"{stack} {count}\n" for stack, count in sorted(counts.items())))
+        return path
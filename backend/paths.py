@@ -0,0 +1,140 @@
+"""Conversion path analysis over a prefix trie of channel sequences.
+
+Every journey's sequence of channel ids is inserted into a trie whose nodes
+are keyed by (parent node, channel), one depth at a time for a whole frame.
+Each node sums the journeys, revenue and time to conversion of the journeys
+whose path starts with it (its prefix) and of those whose path ends on it
+(the full path), so once the trie is built the top paths, the top prefixes
+of a length and the figures for any one path are array lookups.
+"""
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from analytics import GroupedSums
+from attribution_engine import JourneyFrame
+
+# Trie key of a node: (parent node + 1) * CHANNEL_SPAN + channel id, with -1 as the root
+CHANNEL_SPAN = 1 << 16
+
+MEASURES = ("journeys", "revenue", "time_to_conversion")
+
+SCOPES = ("prefix", "path")
+
+RANKINGS = ("journeys", "revenue", "avg_value")
+
+
+class PathAccumulator:
+    """Prefix trie of channel sequences with per-node journey, revenue and time-to-conversion sums"""
+
+    def __init__(self):
+        self.nodes = GroupedSums(*(f"{scope}_{measure}" for scope in SCOPES for measure in MEASURES))
+        self.journeys = 0
+        self.names: List[str] = []
+
+    def _add(self, scope: str, slots: np.ndarray, revenue: np.ndarray, time_to_conversion: np.ndarray) -> None:
+        self.nodes.add(f"{scope}_journeys", slots, 1)
+        self.nodes.add(f"{scope}_revenue", slots, revenue)
+        self.nodes.add(f"{scope}_time_to_conversion", slots, time_to_conversion)
+
+    def update(self, frame: JourneyFrame) -> None:
+        self.names = list(frame.index.names)
+        self.journeys += frame.journey_count
+        lengths = frame.lengths
+        starts = frame.offsets[:-1]
+        node = np.full(frame.journey_count, -1, dtype=np.int64)
+        active = np.flatnonzero(lengths > 0)
+        depth = 0
+        # Step every unfinished journey one touchpoint deeper into the trie
+        while len(active):
+            keys = (node[active] + 1) * CHANNEL_SPAN + frame.channel_ids[starts[active] + depth]
+            slots = self.nodes.slots_for(keys)
+            node[active] = slots
+            revenue = frame.conversion_value[active]
+            time_to_conversion = frame.time_to_conversion[active]
+            self._add("prefix", slots, revenue, time_to_conversion)
+            depth += 1
+            ending = lengths[active] == depth
+            self._add("path", slots[ending], revenue[ending], time_to_conversion[ending])
+            active = active[~ending]
+
+
+class PathIndex:
+    """Top-k and single-path queries over a folded path trie"""
+
+    def __init__(self, paths: PathAccumulator):
+        keys = np.asarray(paths.nodes.keys, dtype=np.int64)
+        self.parent = keys // CHANNEL_SPAN - 1
+        self.channel = keys % CHANNEL_SPAN
+        self.slots = paths.nodes.slots
+        self.sums = paths.nodes.sums
+        self.journeys = paths.journeys
+        self.names = paths.names
+
+        # Number of touchpoints on each node's path; one pass per trie level
+        self.length = np.ones(len(keys), dtype=np.int64)
+        child = self.parent >= 0
+        while True:
+            length = self.length.copy()
+            length[child] = self.length[self.parent[child]] + 1
+            if np.array_equal(length, self.length):
+                break
+            self.length = length
+
+    @property
+    def distinct_paths(self) -> int:
+        return int(np.count_nonzero(self.sums["path_journeys"]))
+
+    def channels(self, node: int) -> List[str]:
+        path = []
+        while node >= 0:
+            path.append(self.names[self.channel[node]])
+            node = int(self.parent[node])
+        return path[::-1]
+
+    def entry(self, node: int, scope: str) -> Dict:
+        journeys = int(self.sums[f"{scope}_journeys"][node])
+        revenue = float(self.sums[f"{scope}_revenue"][node])
+        time_to_conversion = float(self.sums[f"{scope}_time_to_conversion"][node])
+        return {
+            "path": self.channels(node),
+            "journeys": journeys,
+            "share": round(journeys / self.journeys, 4) if self.journeys else 0.0,
+            "revenue": round(revenue, 2),
+            "avg_value": round(revenue / journeys, 2) if journeys else 0.0,
+            "avg_time_to_conversion": round(time_to_conversion / journeys, 1) if journeys else 0.0
+        }
+
+    def top(self, k: int, rank_by: str = "journeys", prefix_length: Optional[int] = None) -> List[Dict]:
+        """The k strongest whole paths, or prefixes of `prefix_length` touchpoints, by `rank_by`"""
+        scope = "path" if prefix_length is None else "prefix"
+        journeys = self.sums[f"{scope}_journeys"]
+        if prefix_length is None:
+            candidates = np.flatnonzero(journeys > 0)
+        else:
+            candidates = np.flatnonzero(self.length == prefix_length)
+        if rank_by == "avg_value":
+            scores = self.sums[f"{scope}_revenue"][candidates] / journeys[candidates]
+        else:
+            scores = self.sums[f"{scope}_{rank_by}"][candidates]
+        ranked = candidates[np.argsort(-scores, kind="stable")[:k]]
+        return [self.entry(node, scope) for node in ranked.tolist()]
+
+    def find(self, path: Sequence[str]) -> Optional[int]:
+        node = -1
+        for name in path:
+            if name not in self.names:
+                return None
+            node = self.slots.get((node + 1) * CHANNEL_SPAN + self.names.index(name))
+            if node is None:
+                return None
+        return node
+
+    def lookup(self, path: Sequence[str]) -> Dict:
+        """Journeys following exactly `path`, and those starting with it"""
+        node = self.find(path)
+        if node is None:
+            empty = {"path": list(path), "journeys": 0, "share": 0.0, "revenue": 0.0, "avg_value": 0.0,
+                     "avg_time_to_conversion": 0.0}
+            return {**empty, "as_prefix": empty}
+        return {**self.entry(node, "path"), "as_prefix": self.entry(node, "prefix")}
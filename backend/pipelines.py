@@ -0,0 +1,99 @@
+"""Server-side aggregation pipelines for the summary endpoints.
+
+Each pipeline returns only the small grouped result, which is loaded into the
+matching accumulator from analytics.py so formatting stays shared with the
+in-Python fallback.
+"""
+from typing import Dict, List, Optional
+
+
+def _match(query: Optional[Dict]) -> List[Dict]:
+    return [{"$match": query}] if query else []
+
+
+def stats_pipeline(query: Optional[Dict] = None, cost_path: str = "touchpoints.cost") -> List[Dict]:
+    """Totals behind /stats in a single $group; cost_path is where the stored layout keeps touchpoint costs"""
+    return _match(query) + [
+        {"$group": {
+            "_id": None,
+            "conversions": {"$sum": 1},
+            "revenue": {"$sum": "$conversion_value"},
+            "touchpoints": {"$sum": "$touchpoint_count"},
+            "time_to_conversion": {"$sum": "$time_to_conversion"},
+            "spend": {"$sum": {"$sum": f"${cost_path}"}}
+        }}
+    ]
+
+
+def funnel_pipeline(query: Optional[Dict] = None) -> List[Dict]:
+    """Journeys and revenue grouped by touchpoint count"""
+    return _match(query) + [
+        {"$group": {
+            "_id": "$touchpoint_count",
+            "journeys": {"$sum": 1},
+            "revenue": {"$sum": "$conversion_value"}
+        }},
+        {"$sort": {"_id": 1}}
+    ]
+
+
+def revenue_trends_pipeline(query: Optional[Dict] = None, cost_path: str = "touchpoints.cost") -> List[Dict]:
+    """Daily conversions, revenue and spend, truncated to UTC days server-side"""
+    return _match(query) + [
+        {"$group": {
+            "_id": {"$dateTrunc": {
+                # $toDate accepts both BSON dates and ISO strings from older documents
+                "date": {"$toDate": "$conversion_date"},
+                "unit": "day"
+            }},
+            "conversions": {"$sum": 1},
+            "revenue": {"$sum": "$conversion_value"},
+            "spend": {"$sum": {"$sum": f"${cost_path}"}}
+        }},
+        {"$sort": {"_id": 1}},
+        {"$project": {
+            "_id": {"$dateToString": {"date": "$_id", "format": "%Y-%m-%d"}},
+            "conversions": 1,
+            "revenue": 1,
+            "spend": 1
+        }}
+    ]
+
+
+def daily_attribution_pipeline(models: List[str], days: Optional[Dict] = None) -> List[Dict]:
+    """Channel measures per model summed over the attribution_daily documents of a date range"""
+    match = {"model": {"$in": models}}
+    if days:
+        match["day"] = days
+    return [
+        {"$match": match},
+        {"$project": {"model": 1, "channels": {"$objectToArray": "$channels"}}},
+        {"$unwind": "$channels"},
+        {"$group": {
+            "_id": {"model": "$model", "channel": "$channels.k"},
+            "revenue": {"$sum": "$channels.v.revenue"},
+            "touchpoints": {"$sum": "$channels.v.touchpoints"},
+            "cost": {"$sum": "$channels.v.cost"},
+            "conversions": {"$sum": "$channels.v.conversions"},
+            "position_sum": {"$sum": "$channels.v.position_sum"}
+        }}
+    ]
+
+
+def strata_pipeline(query: Optional[Dict] = None, touchpoint_cap: int = 8) -> List[Dict]:
+    """Journeys and revenue per sampling stratum, keyed like sampling.stratum_keys"""
+    date = {"$toDate": "$conversion_date"}
+    months = {"$add": [
+        {"$multiply": [{"$subtract": [{"$year": date}, 1970]}, 12]},
+        {"$subtract": [{"$month": date}, 1]}
+    ]}
+    return _match(query) + [
+        {"$group": {
+            "_id": {"$add": [
+                {"$multiply": [months, touchpoint_cap + 1]},
+                {"$min": ["$touchpoint_count", touchpoint_cap]}
+            ]},
+            "journeys": {"$sum": 1},
+            "revenue": {"$sum": "$conversion_value"}
+        }}
+    ]
@@ -0,0 +1,209 @@
+"""Stratified sample estimates of rule-based attribution with confidence intervals.
+
+Journeys are stratified by conversion month and touchpoint count.  A
+Bernoulli draw at the sampling fraction picks the journeys that are
+credited, either per frame here or server-side with MongoDB's
+``$sampleRate``, in which case the population of each stratum comes from
+``pipelines.strata_pipeline``.  Each stratum keeps its population, the
+sampled journeys' conversion values, and per model and channel the sum, sum
+of squares and product with conversion value of the credits.
+
+A channel's revenue is the combined ratio estimate ``X * Y_hat / X_hat``.
+``X`` is the exact total conversion value, and ``Y_hat`` and ``X_hat`` are
+stratified expansion estimates.  Its linearized variance is
+``sum_h N_h^2 (1 - n_h / N_h) s_h^2 / n_h`` over the residuals
+``d = y - R x``, which gives normal confidence intervals.  For models that
+split each conversion across its channels, the estimated shares sum to
+100%.  Strata with fewer than two sampled journeys are pooled, with the
+smallest other stratum if the pool alone is still too thin.
+"""
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from analytics import GroupedSums
+from attribution_engine import JourneyFrame, ModelSpec, model_credits, resolve_params
+from snapshot import take
+
+# Journeys with at least this many touchpoints share the last touchpoint stratum (see strata_pipeline)
+STRATUM_TOUCHPOINTS = 8
+
+# Stratum key: months since 1970-01 * STRATUM_SPAN + min(touchpoint count, STRATUM_TOUCHPOINTS)
+STRATUM_SPAN = STRATUM_TOUCHPOINTS + 1
+
+# Cell key: (stratum key * ROW_SPAN + model row) * CHANNEL_SPAN + channel id
+ROW_SPAN = 1 << 12
+CHANNEL_SPAN = 1 << 16
+
+MIN_STRATUM_SAMPLE = 2
+
+CELL_MEASURES = ("revenue", "revenue_sq", "revenue_value", "touchpoints", "cost", "conversions", "position_sum")
+
+# Two-sided 95% normal quantile
+Z_95 = 1.959963984540054
+
+
+def stratum_keys(frame: JourneyFrame) -> np.ndarray:
+    months = frame.conversion_day.astype("datetime64[M]").astype(np.int64)
+    return months * STRATUM_SPAN + np.minimum(frame.touchpoint_count, STRATUM_TOUCHPOINTS)
+
+
+def add_grouped(sums: GroupedSums, keys: np.ndarray, columns: Dict[str, Optional[np.ndarray]]) -> None:
+    """Add per-row values (None counts rows) to their keys' sums, reduced per key first as np.add.at is slow"""
+    distinct, inverse = np.unique(keys, return_inverse=True)
+    slots = sums.slots_for(distinct)
+    for column, weights in columns.items():
+        sums.add(column, slots, np.bincount(inverse, weights=weights, minlength=len(distinct)))
+
+
+class AttributionEstimate:
+    """Per-model channel data with the half-width of each channel's revenue confidence interval"""
+
+    def __init__(self, models: List[str], channel_data: List[Dict[str, Dict]], half_widths: List[Dict[str, float]],
+                 journeys: int, sampled: int, total_revenue: float, exact: bool = False):
+        self.models = models
+        self.channel_data = channel_data
+        self.half_widths = half_widths
+        self.journeys = journeys
+        self.sampled = sampled
+        self.total_revenue = total_revenue
+        self.exact = exact
+
+    @classmethod
+    def exact(cls, models: List[str], channel_data: List[Dict[str, Dict]], journeys: int,
+              total_revenue: float) -> "AttributionEstimate":
+        """Results of an exact pass or the stored aggregates, with zero-width intervals"""
+        return cls(list(models), channel_data, [dict.fromkeys(data, 0.0) for data in channel_data],
+                   journeys, journeys, total_revenue, exact=True)
+
+    @property
+    def fraction(self) -> float:
+        return self.sampled / self.journeys if self.journeys else 1.0
+
+    @property
+    def share_error(self) -> float:
+        """Widest confidence half-width of any channel's share of revenue"""
+        widths = [width for row in self.half_widths for width in row.values()]
+        if not widths or not self.total_revenue:
+            return 0.0
+        return max(widths) / self.total_revenue
+
+
+class SampledAttribution:
+    """Stratified sample sums for several rule-based models, folded frame by frame"""
+
+    def __init__(self, models: Iterable[ModelSpec], fraction: float, seed: Optional[int] = None):
+        specs = [(spec, None) if isinstance(spec, str) else spec for spec in models]
+        self.models = tuple(model for model, _ in specs)
+        self.params = tuple(params if params is not None else resolve_params(model) for model, params in specs)
+        self.fraction = fraction
+        self.rng = np.random.default_rng(seed)
+        self.strata = GroupedSums("population", "population_value", "sampled", "value", "value_sq")
+        self.cells = GroupedSums(*CELL_MEASURES)
+        self.names: List[str] = []
+        # Set when the population came from strata_pipeline and every folded journey is already sampled
+        self.presampled = False
+
+    def load_population(self, rows: List[Dict]) -> None:
+        """Take stratum populations from strata_pipeline rows; folded frames are then the sample itself"""
+        if rows:
+            slots = self.strata.slots_for(np.array([row["_id"] for row in rows], dtype=np.int64))
+            self.strata.add("population", slots, [row["journeys"] for row in rows])
+            self.strata.add("population_value", slots, [row["revenue"] for row in rows])
+        self.presampled = True
+
+    def update(self, frame: JourneyFrame) -> None:
+        self.names = list(frame.index.names)
+        strata = stratum_keys(frame)
+        if not self.presampled:
+            add_grouped(self.strata, strata, {"population": None, "population_value": frame.conversion_value})
+            sample = self.rng.random(frame.journey_count) < self.fraction
+            frame, strata = take(frame, sample), strata[sample]
+        if not frame.journey_count:
+            return
+
+        value = frame.conversion_value
+        add_grouped(self.strata, strata, {"sampled": None, "value": value, "value_sq": value * value})
+
+        # Credits are summed per (journey, channel) before squaring
+        n_channels = len(frame.index)
+        pairs, inverse = np.unique(frame.journey_index * n_channels + frame.channel_ids, return_inverse=True)
+        journeys, channels = pairs // n_channels, pairs % n_channels
+        keys, measures = [], {measure: [] for measure in CELL_MEASURES}
+        for row, model in enumerate(self.models):
+            credits = model_credits(frame, model, self.params[row])
+            included = inverse[credits.include]
+            revenue = np.bincount(inverse, weights=credits.revenue, minlength=len(pairs))
+            keys.append((strata[journeys] * ROW_SPAN + row) * CHANNEL_SPAN + channels)
+            measures["revenue"].append(revenue)
+            measures["revenue_sq"].append(revenue * revenue)
+            measures["revenue_value"].append(revenue * value[journeys])
+            measures["touchpoints"].append(np.bincount(included, minlength=len(pairs)))
+            measures["cost"].append(np.bincount(included, weights=frame.cost[credits.include], minlength=len(pairs)))
+            measures["conversions"].append(np.bincount(inverse[credits.convert], minlength=len(pairs)))
+            measures["position_sum"].append(
+                np.bincount(included, weights=frame.sequence[credits.include], minlength=len(pairs)))
+        add_grouped(self.cells, np.concatenate(keys),
+                    {measure: np.concatenate(values).astype(np.float64) for measure, values in measures.items()})
+
+    def estimate(self, z: float = Z_95) -> AttributionEstimate:
+        strata = self.strata.sums
+        sampled = strata["sampled"]
+        # A server-side stratum can differ from the decoded one for dates near a month boundary
+        population = np.maximum(strata["population"], sampled)
+        n_models, n_channels = len(self.models), len(self.names)
+
+        # Pool thin strata into one extra stratum, so every variance term has at least two observations
+        pooled = sampled < MIN_STRATUM_SAMPLE
+        # A pool that is itself too thin, as when one stratum alone is, takes in the smallest other stratum
+        if pooled.any() and sampled[pooled].sum() < MIN_STRATUM_SAMPLE and not pooled.all():
+            pooled[np.flatnonzero(~pooled)[np.argmin(sampled[~pooled])]] = True
+        effective = np.where(pooled, len(population), np.arange(len(population)))
+        size = len(population) + 1
+        N = np.bincount(effective, population, minlength=size)
+        n = np.bincount(effective, sampled, minlength=size)
+        x = np.bincount(effective, strata["value"], minlength=size)
+        xx = np.bincount(effective, strata["value_sq"], minlength=size)
+
+        keys = np.asarray(self.cells.keys, dtype=np.int64)
+        stratum_slots = np.array([self.strata.slots[key] for key in (keys // CHANNEL_SPAN // ROW_SPAN).tolist()],
+                                 dtype=np.int64)
+        cell = (effective[stratum_slots], keys // CHANNEL_SPAN % ROW_SPAN, keys % CHANNEL_SPAN)
+        dense = {}
+        for measure, sums in self.cells.sums.items():
+            dense[measure] = np.zeros((size, n_models, n_channels))
+            np.add.at(dense[measure], cell, sums)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            weight = np.where(n > 0, N / n, 0.0)[:, None, None]
+            total = float(strata["population_value"].sum())
+            ratio = np.nan_to_num((weight * dense["revenue"]).sum(axis=0) / (weight[:, 0, 0] * x).sum())
+            revenue = ratio * total
+
+            residual = dense["revenue"] - ratio * x[:, None, None]
+            residual_sq = dense["revenue_sq"] - 2 * ratio * dense["revenue_value"] + ratio ** 2 * xx[:, None, None]
+            spread = np.maximum(residual_sq - residual ** 2 / n[:, None, None], 0) / (n - 1)[:, None, None]
+            unsampled = (1 - n / N)[:, None, None]
+            terms = np.where(unsampled > 0, N[:, None, None] ** 2 * unsampled * spread / n[:, None, None], 0.0)
+            # A stratum with unsampled journeys but too few sampled ones has no usable variance
+            terms[(N > n) & (n < MIN_STRATUM_SAMPLE)] = np.inf
+            half_width = z * np.sqrt(terms.sum(axis=0))
+        expanded = {measure: (weight * dense[measure]).sum(axis=0) for measure in CELL_MEASURES}
+
+        channel_data, half_widths = [], []
+        for row in range(n_models):
+            present = np.flatnonzero(expanded["conversions"][row] > 0)
+            present = present[np.argsort(-revenue[row, present], kind="stable")]
+            channel_data.append({
+                self.names[channel]: {
+                    "revenue": float(revenue[row, channel]),
+                    "touchpoints": int(round(expanded["touchpoints"][row, channel])),
+                    "cost": float(expanded["cost"][row, channel]),
+                    "conversions": int(round(expanded["conversions"][row, channel])),
+                    "position_sum": int(round(expanded["position_sum"][row, channel]))
+                }
+                for channel in present.tolist()
+            })
+            half_widths.append({self.names[channel]: float(half_width[row, channel]) for channel in present.tolist()})
+        return AttributionEstimate(list(self.models), channel_data, half_widths, int(population.sum()),
+                                   int(sampled.sum()), total)
@@ -0,0 +1,47 @@
+"""Fast JSON encoding for responses whose shape our own code guarantees.
+
+FastAPI validates a route's return value against its ``response_model`` and
+then encodes it again; for data built by the attribution engine or read
+straight from MongoDB both steps are redundant.  ``FastJSONResponse`` encodes
+dicts, lists and Pydantic models as they are, with orjson when it is
+installed and the standard library otherwise.  Returning a response object
+bypasses the validation while the route keeps its ``response_model`` for the
+OpenAPI schema.
+"""
+import json
+from datetime import datetime, timezone
+from typing import Any
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # orjson is optional
+    orjson = None
+
+
+def isoformat_utc(value: datetime) -> str:
+    """ISO string for a stored date; BSON dates are UTC and come back naive"""
+    return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).isoformat()
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        # Fields are trusted as-is; nested models come back through this hook
+        return dict(value)
+    if isinstance(value, datetime):
+        return isoformat_utc(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Encode pre-shaped content without validation"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NAIVE_UTC)
+    return json.dumps(content, default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -1,15 +1,57 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReplaceOne, ReturnDocument
+from pymongo.errors import BulkWriteError, OperationFailure, PyMongoError
 import os
+import re
+import base64
+import binascii
+import asyncio
+import functools
+import inspect
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Dict, Any
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel, Field, ConfigDict, ValidationError, create_model, field_validator
+from typing import List, Dict, Any, Optional, AsyncIterator, AsyncIterable, Callable, Union
 import uuid
-from datetime import datetime, timezone, timedelta
+from collections import OrderedDict
+from datetime import date, datetime, time, timezone, timedelta
 import random
+import numpy as np
+
+from analytics import (
+    ChannelMetricsAccumulator, FunnelAccumulator, RevenueTrendsAccumulator, StatsAccumulator, SynergyAccumulator,
+    fold_frame
+)
+import aggregates
+import compact
+import metrics
+import snapshot
+from attribution_engine import (
+    DEFAULT_PARAMS, MODEL_NAMES, AttributionMatrix, ChannelIndex, JourneyFrame, ModelParams, ModelSpec, evaluate_models,
+    resolve_params, spread_statistics
+)
+from compact import CodeTable, UnknownCode
+from compression import CompressionMiddleware
+from compute_pool import ComputeBackend, ComputeOverloaded
+from conditional import ConditionalRoute, conditional
+from generator import GenerationProgress, JourneyGenerator
+from ingest import IngestReport, LineTooLong, iter_lines, parse_lines, write_errors
+from markov import MarkovAccumulator, MarkovModel
+from metrics import MetricsMiddleware, StackSampler
+from paths import RANKINGS as PATH_RANKINGS, PathAccumulator, PathIndex
+from pipelines import (
+    daily_attribution_pipeline, funnel_pipeline, revenue_trends_pipeline, stats_pipeline, strata_pipeline
+)
+from result_cache import ResultCache
+from sampling import STRATUM_TOUCHPOINTS, AttributionEstimate, SampledAttribution
+from serialization import FastJSONResponse, dumps, isoformat_utc
+from shapley import ShapleyAccumulator, sample_shapley
+from snapshot import Snapshot, SnapshotUnavailable
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -19,11 +61,73 @@ mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
+# CPU-bound attribution and analytics run off the event loop
+compute_backend = ComputeBackend(
+    os.environ.get('COMPUTE_BACKEND', 'thread'),
+    workers=int(os.environ['COMPUTE_WORKERS']) if os.environ.get('COMPUTE_WORKERS') else None,
+    max_pending=int(os.environ.get('COMPUTE_MAX_PENDING', '32'))
+)
+
+# Analytics results are cached per dataset generation
+result_cache = ResultCache(int(os.environ.get('RESULT_CACHE_SIZE', '256')))
+
+async def dataset_version() -> int:
+    """Current generation of the journeys dataset"""
+    with metrics.stage("db_fetch"):
+        meta = await db.meta.find_one({"_id": "journeys"})
+    return meta["generation"] if meta else 0
+
+async def bump_dataset_version() -> int:
+    """Advance the dataset generation after any write to db.journeys"""
+    meta = await db.meta.find_one_and_update(
+        {"_id": "journeys"},
+        {"$inc": {"generation": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    # Entries for older generations can never be hit again on this worker
+    result_cache.clear()
+    return meta["generation"]
+
+def cached_result(endpoint: str):
+    """Serve a route from the result cache, keyed by its parameters and the dataset generation"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            key = await result_key(endpoint, kwargs)
+            metrics.record_cache_lookup(endpoint, key in result_cache)
+            return await result_cache.get_or_compute(key, lambda: func(*args, **kwargs))
+        wrapper.cache_endpoint = endpoint
+        return wrapper
+    return decorator
+
+async def result_key(endpoint: str, kwargs: Dict) -> tuple:
+    """Result cache key of a route called with `kwargs`"""
+    return (endpoint, repr(sorted(kwargs.items())), await analytics_version())
+
+async def fit_key(*parts) -> tuple:
+    """Result cache key of a fitted model or index"""
+    return (*parts, await analytics_version())
+
+# Opt-in: responses built by our own code skip response_model validation and use the fast encoder
+FAST_SERIALIZATION = os.environ.get('FAST_SERIALIZATION', 'false').lower() in ('1', 'true', 'yes')
+
+def fast_response(func):
+    """Encode a route's result directly when FAST_SERIALIZATION is on; the route keeps its response_model for OpenAPI"""
+    if not FAST_SERIALIZATION:
+        return func
+    
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return FastJSONResponse(await func(*args, **kwargs))
+    return wrapper
+
 # Create the main app without a prefix
 app = FastAPI()
 
-# Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
+# Create a router with the /api prefix; its routes report to the request metrics, and @conditional ones answer
+# If-None-Match with 304 while the data they read is unchanged
+api_router = APIRouter(prefix="/api", route_class=ConditionalRoute)
 
 # Indian names for sample data
 INDIAN_NAMES = [
@@ -64,6 +168,26 @@ PAID_CHANNELS = ["Google Ads", "Facebook Ads", "Instagram", "LinkedIn", "YouTube
 
 INTERACTION_TYPES = ["Click", "View", "Engagement", "Download", "Form Fill"]
 
+# First touchpoint of organic_first journeys, and the channels journeys most often close on
+OPENING_CHANNELS = ["Organic Search", "Blog Content", "Referral"]
+
+CLOSING_CHANNELS = ["Direct Traffic", "Organic Search", "Email Campaign"]
+
+# Display names for compared models, in /attribution/compare/all order
+MODEL_LABELS = {
+    "first_touch": "First-Touch",
+    "last_touch": "Last-Touch",
+    "last_non_direct": "Last Non-Direct",
+    "linear": "Linear",
+    "time_decay": "Time Decay",
+    "position_based": "U-Shaped",
+    "w_shaped": "W-Shaped"
+}
+
+MODEL_ALIASES = {"u_shaped": "position_based"}
+
+VARIANCE_MODELS = ["first_touch", "last_touch", "linear", "time_decay", "position_based", "w_shaped"]
+
 # Define Models
 class Touchpoint(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -83,6 +207,11 @@ class Journey(BaseModel):
     touchpoint_count: int
     time_to_conversion: int
     touchpoints: List[Touchpoint]
+    
+    @field_validator("conversion_date", mode="before")
+    @classmethod
+    def format_conversion_date(cls, value):
+        return isoformat_utc(value) if isinstance(value, datetime) else value
 
 class AttributionResult(BaseModel):
     channel: str
@@ -94,352 +223,160 @@ class AttributionResult(BaseModel):
     conversions_influenced: int
     avg_position: float
 
+class EstimatedAttributionResult(AttributionResult):
+    """A sampled result with 95% confidence intervals; exact results have zero-width intervals"""
+    attributed_revenue_ci: List[float]
+    attribution_percentage_ci: List[float]
+    sample_fraction: float = Field(description="Fraction of journeys actually sampled, which may exceed ?sample=")
+    exact: bool = Field(description="Computed over every journey instead of a sample")
+
 class ModelComparison(BaseModel):
     model_name: str
+    channels: List[Union[EstimatedAttributionResult, AttributionResult]]
+
+class ModelParameters(BaseModel):
+    model: str
+    half_life: Optional[float] = Field(None, gt=0)
+    first_weight: Optional[float] = Field(None, ge=0, le=1)
+    middle_weight: Optional[float] = Field(None, ge=0, le=1)
+    last_weight: Optional[float] = Field(None, ge=0, le=1)
+    others_weight: Optional[float] = Field(None, ge=0, le=1)
+
+class ParameterizedAttribution(BaseModel):
+    model_name: str
+    params: Dict[str, float]
     channels: List[AttributionResult]
 
+class DashboardWidget(BaseModel):
+    widget: str
+    id: Optional[str] = Field(None, description="Key of the widget in the response; defaults to the widget name")
+    params: Dict[str, Any] = Field(default_factory=dict, description="Query parameters of the widget's endpoint")
+
+class DashboardRequest(BaseModel):
+    widgets: List[DashboardWidget]
+
 # Sample data generation
-async def generate_sample_data():
-    """Generate 150 sample customer journeys with realistic patterns"""
-    journeys = []
-    conversion_end_date = datetime.now(timezone.utc)
-    conversion_start_date = conversion_end_date - timedelta(days=90)
-    
-    for i in range(150):
-        journey_id = f"J{str(i+1).zfill(3)}"
-        customer_name = random.choice(INDIAN_NAMES)
-        conversion_value = round(random.uniform(1000, 50000), 2)
-        time_to_conversion = random.randint(1, 45)
-        conversion_date = conversion_start_date + timedelta(
-            days=random.randint(0, 90)
-        )
-        
-        # Generate touchpoints with realistic patterns
-        touchpoint_count = random.randint(2, 8)
-        touchpoints = []
-        
-        # Create journey patterns based on common flows
-        pattern_type = random.choice(["paid_first", "organic_first", "mixed"])
-        
-        available_channels = CHANNELS.copy()
-        used_channels = []
-        
-        for seq in range(1, touchpoint_count + 1):
-            # Pattern logic
-            if seq == 1 and pattern_type == "paid_first":
-                channel = random.choice([c for c in PAID_CHANNELS if c in available_channels])
-            elif seq == 1 and pattern_type == "organic_first":
-                channel = random.choice(["Organic Search", "Blog Content", "Referral"])
-            elif seq == touchpoint_count:
-                # Last touchpoint more likely to be direct or organic
-                channel = random.choice(["Direct Traffic", "Organic Search", "Email Campaign"])
-            else:
-                channel = random.choice(available_channels)
-            
-            # Remove channel to avoid duplicates in small journeys
-            if channel in available_channels:
-                available_channels.remove(channel)
-            used_channels.append(channel)
-            
-            # Calculate timestamp
-            days_before = int((time_to_conversion / touchpoint_count) * (touchpoint_count - seq))
-            touchpoint_date = conversion_date - timedelta(days=days_before)
-            
-            # Cost for paid channels
-            cost = round(random.uniform(50, 5000), 2) if channel in PAID_CHANNELS else 0.0
-            
-            interaction_type = random.choice(INTERACTION_TYPES)
-            
-            touchpoint = {
-                "sequence": seq,
-                "channel": channel,
-                "timestamp": touchpoint_date.isoformat(),
-                "cost": cost,
-                "interaction_type": interaction_type,
-                "days_before_conversion": days_before
-            }
-            touchpoints.append(touchpoint)
-        
-        journey = {
-            "journey_id": journey_id,
-            "customer_name": customer_name,
-            "conversion_value": conversion_value,
-            "conversion_date": conversion_date.isoformat(),
-            "touchpoint_count": touchpoint_count,
-            "time_to_conversion": time_to_conversion,
-            "touchpoints": touchpoints
-        }
-        journeys.append(journey)
-    
-    # Clear existing data and insert new
-    await db.journeys.delete_many({})
-    await db.journeys.insert_many(journeys)
-    
-    return {"message": f"Generated {len(journeys)} sample journeys", "count": len(journeys)}
+GENERATE_MAX_COUNT = int(os.environ.get('GENERATE_MAX_COUNT', '50000000'))
+GENERATE_CONCURRENCY = int(os.environ.get('GENERATE_CONCURRENCY', '4'))
+
+def sample_generator(count: int, seed: Optional[int] = None, pattern_weights=(1, 1, 1)) -> JourneyGenerator:
+    """Journey generator over the sample channels; without a seed one is drawn from `random`"""
+    return JourneyGenerator(
+        count,
+        seed if seed is not None else random.getrandbits(63),
+        channels=CHANNELS,
+        paid_channels=PAID_CHANNELS,
+        opening_channels=OPENING_CHANNELS,
+        closing_channels=CLOSING_CHANNELS,
+        interaction_types=INTERACTION_TYPES,
+        names=INDIAN_NAMES,
+        pattern_weights=pattern_weights
+    )
+
+def build_sample_journeys(count: int = 150, seed: Optional[int] = None, pattern_weights=(1, 1, 1)) -> List[Dict]:
+    """Build sample customer journeys with realistic patterns"""
+    return sample_generator(count, seed, pattern_weights).journeys()
+
+# Generation runs by job id; the most recent ones are kept for progress queries
+generation_jobs: "OrderedDict[str, Dict]" = OrderedDict()
+
+async def generate_sample_data(count: int = 150, seed: Optional[int] = None, pattern_weights=(1, 1, 1),
+                               progress: Optional[GenerationProgress] = None):
+    """Replace the journeys with `count` generated ones, inserted in unordered chunks"""
+    generator = sample_generator(count, seed, pattern_weights)
+    progress = progress or GenerationProgress(str(uuid.uuid4()), count, generator.seed)
+    
+    # Dropping is constant-time where delete_many scans every document
+    await db.journeys.drop()
+    for collection in AGGREGATE_COLLECTIONS:
+        await db[collection].drop()
+    await ensure_journey_indexes()
+    await bump_dataset_version()
+    
+    blocks = iter(range(generator.blocks))
+    logged = 0
+    
+    async def insert_blocks():
+        nonlocal logged
+        for index in blocks:
+            journeys = await compute_backend.decode(generator.block, index)
+            await db.journeys.insert_many(await stored_documents(journeys), ordered=False)
+            await apply_attribution_deltas(journeys)
+            progress.advance(len(journeys))
+            if progress.generated * 10 // count > logged:
+                logged = progress.generated * 10 // count
+                logger.info("Generated %d/%d journeys (seed %d)", progress.generated, count, generator.seed)
+    
+    try:
+        # A few writers keep MongoDB busy while the next chunks are generated
+        await asyncio.gather(*(insert_blocks() for _ in range(min(GENERATE_CONCURRENCY, generator.blocks) or 1)))
+    except BaseException as e:
+        progress.finish(e)
+        raise
+    finally:
+        await bump_dataset_version()
+    progress.finish()
+    
+    return {"message": f"Generated {count} sample journeys", "count": count, "seed": generator.seed}
 
 # Attribution calculation functions
+def evaluate_attribution(journeys: List[Dict], models: List[ModelSpec]) -> AttributionMatrix:
+    """Evaluate several rule-based models over journeys in a single pass"""
+    frame = JourneyFrame.from_journeys(journeys, ChannelIndex(CHANNELS))
+    return evaluate_models(frame, models)
+
+def format_model_results(matrix: AttributionMatrix, model: Union[str, int]) -> List[AttributionResult]:
+    """Format one model's (or matrix row's) results"""
+    return format_attribution_results(matrix.channel_data(model), matrix.total_revenue)
+
+def calculate_model(journeys: List[Dict], model: str, params: Optional[ModelParams] = None) -> List[AttributionResult]:
+    """Run a rule-based model over journeys using the columnar engine"""
+    return format_model_results(evaluate_attribution(journeys, [(model, params)]), 0)
+
 def calculate_first_touch(journeys: List[Dict]) -> List[AttributionResult]:
     """100% credit to first touchpoint"""
-    channel_data = {}
-    
-    for journey in journeys:
-        first_tp = journey["touchpoints"][0]
-        channel = first_tp["channel"]
-        
-        if channel not in channel_data:
-            channel_data[channel] = {
-                "revenue": 0,
-                "touchpoints": 0,
-                "cost": 0,
-                "conversions": 0,
-                "positions": []
-            }
-        
-        channel_data[channel]["revenue"] += journey["conversion_value"]
-        channel_data[channel]["conversions"] += 1
-        
-        for tp in journey["touchpoints"]:
-            if tp["channel"] == channel:
-                channel_data[channel]["touchpoints"] += 1
-                channel_data[channel]["cost"] += tp["cost"]
-                channel_data[channel]["positions"].append(tp["sequence"])
-    
-    return format_attribution_results(channel_data, sum(j["conversion_value"] for j in journeys))
+    return calculate_model(journeys, "first_touch")
 
 def calculate_last_touch(journeys: List[Dict]) -> List[AttributionResult]:
     """100% credit to last touchpoint"""
-    channel_data = {}
-    
-    for journey in journeys:
-        last_tp = journey["touchpoints"][-1]
-        channel = last_tp["channel"]
-        
-        if channel not in channel_data:
-            channel_data[channel] = {
-                "revenue": 0,
-                "touchpoints": 0,
-                "cost": 0,
-                "conversions": 0,
-                "positions": []
-            }
-        
-        channel_data[channel]["revenue"] += journey["conversion_value"]
-        channel_data[channel]["conversions"] += 1
-        
-        for tp in journey["touchpoints"]:
-            if tp["channel"] == channel:
-                channel_data[channel]["touchpoints"] += 1
-                channel_data[channel]["cost"] += tp["cost"]
-                channel_data[channel]["positions"].append(tp["sequence"])
-    
-    return format_attribution_results(channel_data, sum(j["conversion_value"] for j in journeys))
+    return calculate_model(journeys, "last_touch")
 
 def calculate_last_non_direct(journeys: List[Dict]) -> List[AttributionResult]:
     """100% credit to last non-direct touchpoint"""
-    channel_data = {}
-    
-    for journey in journeys:
-        # Find last non-direct touchpoint
-        last_non_direct = None
-        for tp in reversed(journey["touchpoints"]):
-            if tp["channel"] != "Direct Traffic":
-                last_non_direct = tp
-                break
-        
-        if not last_non_direct:
-            last_non_direct = journey["touchpoints"][-1]
-        
-        channel = last_non_direct["channel"]
-        
-        if channel not in channel_data:
-            channel_data[channel] = {
-                "revenue": 0,
-                "touchpoints": 0,
-                "cost": 0,
-                "conversions": 0,
-                "positions": []
-            }
-        
-        channel_data[channel]["revenue"] += journey["conversion_value"]
-        channel_data[channel]["conversions"] += 1
-        
-        for tp in journey["touchpoints"]:
-            if tp["channel"] == channel:
-                channel_data[channel]["touchpoints"] += 1
-                channel_data[channel]["cost"] += tp["cost"]
-                channel_data[channel]["positions"].append(tp["sequence"])
-    
-    return format_attribution_results(channel_data, sum(j["conversion_value"] for j in journeys))
+    return calculate_model(journeys, "last_non_direct")
 
 def calculate_linear(journeys: List[Dict]) -> List[AttributionResult]:
     """Equal credit to all touchpoints"""
-    channel_data = {}
-    
-    for journey in journeys:
-        credit_per_tp = journey["conversion_value"] / journey["touchpoint_count"]
-        
-        for tp in journey["touchpoints"]:
-            channel = tp["channel"]
-            
-            if channel not in channel_data:
-                channel_data[channel] = {
-                    "revenue": 0,
-                    "touchpoints": 0,
-                    "cost": 0,
-                    "conversions": 0,
-                    "positions": []
-                }
-            
-            channel_data[channel]["revenue"] += credit_per_tp
-            channel_data[channel]["touchpoints"] += 1
-            channel_data[channel]["cost"] += tp["cost"]
-            channel_data[channel]["positions"].append(tp["sequence"])
-        
-        # Count conversions influenced
-        channels_in_journey = set(tp["channel"] for tp in journey["touchpoints"])
-        for ch in channels_in_journey:
-            if ch in channel_data:
-                channel_data[ch]["conversions"] += 1
-    
-    return format_attribution_results(channel_data, sum(j["conversion_value"] for j in journeys))
-
-def calculate_time_decay(journeys: List[Dict]) -> List[AttributionResult]:
-    """Exponentially more credit to recent touchpoints (7-day half-life)"""
-    channel_data = {}
-    
-    for journey in journeys:
-        # Calculate weights for each touchpoint
-        weights = []
-        for tp in journey["touchpoints"]:
-            days_before = tp["days_before_conversion"]
-            weight = 2 ** (-days_before / 7)
-            weights.append(weight)
-        
-        # Normalize weights
-        total_weight = sum(weights)
-        normalized_weights = [w / total_weight for w in weights]
-        
-        for i, tp in enumerate(journey["touchpoints"]):
-            channel = tp["channel"]
-            credit = journey["conversion_value"] * normalized_weights[i]
-            
-            if channel not in channel_data:
-                channel_data[channel] = {
-                    "revenue": 0,
-                    "touchpoints": 0,
-                    "cost": 0,
-                    "conversions": 0,
-                    "positions": []
-                }
-            
-            channel_data[channel]["revenue"] += credit
-            channel_data[channel]["touchpoints"] += 1
-            channel_data[channel]["cost"] += tp["cost"]
-            channel_data[channel]["positions"].append(tp["sequence"])
-        
-        channels_in_journey = set(tp["channel"] for tp in journey["touchpoints"])
-        for ch in channels_in_journey:
-            if ch in channel_data:
-                channel_data[ch]["conversions"] += 1
-    
-    return format_attribution_results(channel_data, sum(j["conversion_value"] for j in journeys))
+    return calculate_model(journeys, "linear")
 
-def calculate_position_based(journeys: List[Dict]) -> List[AttributionResult]:
-    """40% first, 40% last, 20% split among middle"""
-    channel_data = {}
-    
-    for journey in journeys:
-        touchpoints = journey["touchpoints"]
-        count = len(touchpoints)
-        
-        for i, tp in enumerate(touchpoints):
-            channel = tp["channel"]
-            
-            if channel not in channel_data:
-                channel_data[channel] = {
-                    "revenue": 0,
-                    "touchpoints": 0,
-                    "cost": 0,
-                    "conversions": 0,
-                    "positions": []
-                }
-            
-            if count == 1:
-                credit = journey["conversion_value"]
-            elif i == 0:
-                credit = journey["conversion_value"] * 0.4
-            elif i == count - 1:
-                credit = journey["conversion_value"] * 0.4
-            else:
-                credit = journey["conversion_value"] * 0.2 / (count - 2)
-            
-            channel_data[channel]["revenue"] += credit
-            channel_data[channel]["touchpoints"] += 1
-            channel_data[channel]["cost"] += tp["cost"]
-            channel_data[channel]["positions"].append(tp["sequence"])
-        
-        channels_in_journey = set(tp["channel"] for tp in touchpoints)
-        for ch in channels_in_journey:
-            if ch in channel_data:
-                channel_data[ch]["conversions"] += 1
-    
-    return format_attribution_results(channel_data, sum(j["conversion_value"] for j in journeys))
+def calculate_time_decay(journeys: List[Dict], half_life: float = 7) -> List[AttributionResult]:
+    """Exponentially more credit to recent touchpoints (7-day half-life by default)"""
+    return calculate_model(journeys, "time_decay", resolve_params("time_decay", half_life=half_life))
 
-def calculate_w_shaped(journeys: List[Dict]) -> List[AttributionResult]:
-    """30% first, 30% middle key touchpoint, 30% last, 10% to others"""
-    channel_data = {}
-    
-    for journey in journeys:
-        touchpoints = journey["touchpoints"]
-        count = len(touchpoints)
-        
-        for i, tp in enumerate(touchpoints):
-            channel = tp["channel"]
-            
-            if channel not in channel_data:
-                channel_data[channel] = {
-                    "revenue": 0,
-                    "touchpoints": 0,
-                    "cost": 0,
-                    "conversions": 0,
-                    "positions": []
-                }
-            
-            if count == 1:
-                credit = journey["conversion_value"]
-            elif count == 2:
-                credit = journey["conversion_value"] * 0.5
-            elif i == 0:
-                credit = journey["conversion_value"] * 0.3
-            elif i == count - 1:
-                credit = journey["conversion_value"] * 0.3
-            elif i == count // 2:
-                credit = journey["conversion_value"] * 0.3
-            else:
-                others_count = count - 3
-                credit = journey["conversion_value"] * 0.1 / others_count if others_count > 0 else 0
-            
-            channel_data[channel]["revenue"] += credit
-            channel_data[channel]["touchpoints"] += 1
-            channel_data[channel]["cost"] += tp["cost"]
-            channel_data[channel]["positions"].append(tp["sequence"])
-        
-        channels_in_journey = set(tp["channel"] for tp in touchpoints)
-        for ch in channels_in_journey:
-            if ch in channel_data:
-                channel_data[ch]["conversions"] += 1
-    
-    return format_attribution_results(channel_data, sum(j["conversion_value"] for j in journeys))
+def calculate_position_based(journeys: List[Dict], first: float = 0.4, middle: float = 0.2,
+                             last: float = 0.4) -> List[AttributionResult]:
+    """40% first, 40% last, 20% split among middle by default"""
+    params = resolve_params("position_based", first=first, middle=middle, last=last)
+    return calculate_model(journeys, "position_based", params)
 
+def calculate_w_shaped(journeys: List[Dict], first: float = 0.3, middle: float = 0.3, last: float = 0.3,
+                       others: float = 0.1) -> List[AttributionResult]:
+    """30% first, 30% middle key touchpoint, 30% last, 10% to others by default"""
+    params = resolve_params("w_shaped", first=first, middle=middle, last=last, others=others)
+    return calculate_model(journeys, "w_shaped", params)
+
+@metrics.timed("serialize")
 def format_attribution_results(channel_data: Dict, total_revenue: float) -> List[AttributionResult]:
     """Format attribution results"""
     results = []
+    # Values are computed here, so the fast path skips validating them
+    build = AttributionResult.model_construct if FAST_SERIALIZATION else AttributionResult
     
     for channel, data in channel_data.items():
-        avg_position = sum(data["positions"]) / len(data["positions"]) if data["positions"] else 0
+        avg_position = data["position_sum"] / data["touchpoints"] if data["touchpoints"] else 0
         roas = data["revenue"] / data["cost"] if data["cost"] > 0 else 0
         
-        results.append(AttributionResult(
+        results.append(build(
             channel=channel,
             attributed_revenue=round(data["revenue"], 2),
             attribution_percentage=round((data["revenue"] / total_revenue * 100), 2) if total_revenue > 0 else 0,
@@ -450,7 +387,800 @@ def format_attribution_results(channel_data: Dict, total_revenue: float) -> List
             avg_position=round(avg_position, 2)
         ))
     
-    return sorted(results, key=lambda x: x.attributed_revenue, reverse=True)
+    # Ties go by channel name, so stored aggregates and a fold over the journeys list them alike
+    return sorted(results, key=lambda x: (-x.attributed_revenue, x.channel))
+
+def format_estimated_results(estimate: AttributionEstimate, row: int) -> List[EstimatedAttributionResult]:
+    """Format one model's sampled results with confidence intervals of its revenue and share"""
+    build = EstimatedAttributionResult.model_construct if FAST_SERIALIZATION else EstimatedAttributionResult
+    channel_data, half_widths = estimate.channel_data[row], estimate.half_widths[row]
+    total_revenue = estimate.total_revenue
+    fraction = round(estimate.fraction, 4)
+    
+    results = []
+    for result in format_attribution_results(channel_data, total_revenue):
+        revenue, half_width = channel_data[result.channel]["revenue"], half_widths[result.channel]
+        # Attributed revenue is never negative
+        interval = [max(revenue - half_width, 0.0), revenue + half_width]
+        results.append(build(
+            **dict(result),
+            attributed_revenue_ci=[round(bound, 2) for bound in interval],
+            attribution_percentage_ci=[round(bound / total_revenue * 100, 2) if total_revenue > 0 else 0
+                                       for bound in interval],
+            sample_fraction=fraction,
+            exact=estimate.exact
+        ))
+    return results
+
+# Journey storage layout: "document" keeps touchpoint subdocuments, "compact" parallel coded arrays (see compact.py)
+JOURNEY_STORAGE = os.environ.get('JOURNEY_STORAGE', 'document').lower()
+if JOURNEY_STORAGE not in compact.LAYOUTS:
+    raise ValueError(f"JOURNEY_STORAGE must be one of {', '.join(compact.LAYOUTS)}")
+
+# Loaded at startup; replaced, never mutated, when another writer adds names
+journey_codes = CodeTable()
+
+async def load_journey_codes() -> CodeTable:
+    """Reload the channel and interaction type codes from db.journey_codes"""
+    global journey_codes
+    journey_codes = CodeTable({row["_id"]: row["names"] async for row in db.journey_codes.find()})
+    return journey_codes
+
+async def register_journey_codes(missing: Dict[str, List[str]]) -> CodeTable:
+    """Append names without a code; $addToSet keeps concurrent writers agreeing on every code"""
+    for field, names in missing.items():
+        await db.journey_codes.update_one({"_id": field}, {"$addToSet": {"names": {"$each": names}}}, upsert=True)
+    return await load_journey_codes()
+
+async def stored_documents(journeys: List[Dict]) -> List[Dict]:
+    """Document-layout journeys as they are written in the configured storage layout"""
+    if JOURNEY_STORAGE != "compact":
+        return journeys
+    codes = journey_codes
+    missing = codes.missing(journeys)
+    if missing:
+        codes = await register_journey_codes(missing)
+    return await compute_backend.decode(compact.encode_journeys, journeys, codes)
+
+async def decode_stored(fn, *args):
+    """Run a decoder over stored journeys, reloading the code table once if it has fallen behind"""
+    try:
+        return await compute_backend.decode(fn, *args, journey_codes)
+    except UnknownCode:
+        await load_journey_codes()
+        return await compute_backend.decode(fn, *args, journey_codes)
+
+async def migrate_journey_layout(layout: str) -> Dict:
+    """Rewrite every journey stored in the other layout into `layout`, one batch at a time"""
+    await load_journey_codes()
+    converted = 0
+    query = {"tp": {"$exists": layout == "document"}}
+    while True:
+        # Keyset on _id so each batch starts where the previous one ended
+        batch = await db.journeys.find(query).sort("_id", 1).limit(JOURNEY_BATCH_SIZE).to_list(None)
+        if not batch:
+            break
+        query["_id"] = {"$gt": batch[-1]["_id"]}
+        if layout == "compact":
+            missing = journey_codes.missing(batch)
+            if missing:
+                await register_journey_codes(missing)
+            documents = await compute_backend.decode(compact.encode_journeys, batch, journey_codes)
+        else:
+            documents = await decode_stored(compact.decode_journeys, batch)
+        await db.journeys.bulk_write(
+            [ReplaceOne({"_id": original["_id"]}, document) for original, document in zip(batch, documents)],
+            ordered=False
+        )
+        converted += len(batch)
+    
+    await db.journeys.create_index(compact.touchpoint_path("channel", layout))
+    for other in compact.LAYOUTS:
+        if other != layout:
+            try:
+                await db.journeys.drop_index(f"{compact.touchpoint_path('channel', other)}_1")
+            except OperationFailure:
+                pass
+    return {"layout": layout, "converted": converted}
+
+# Streaming journey reads
+JOURNEY_BATCH_SIZE = int(os.environ.get('JOURNEY_BATCH_SIZE', '5000'))
+
+# Fields decoded into a JourneyFrame; names, ids and timestamps stay in MongoDB
+FRAME_PROJECTION = {
+    "_id": 0,
+    "conversion_value": 1,
+    "conversion_date": 1,
+    "touchpoint_count": 1,
+    "time_to_conversion": 1,
+    "touchpoints.channel": 1,
+    "touchpoints.sequence": 1,
+    "touchpoints.cost": 1,
+    "touchpoints.days_before_conversion": 1
+}
+STORED_FRAME_PROJECTION = compact.translate_projection(FRAME_PROJECTION, JOURNEY_STORAGE)
+STORED_COST_PATH = compact.touchpoint_path("cost", JOURNEY_STORAGE)
+
+async def iter_journey_batches(query: Optional[Dict] = None, projection: Optional[Dict] = None,
+                               batch_size: Optional[int] = None, sort: Optional[List] = None) -> AsyncIterator[List[Dict]]:
+    """Yield journey documents from a Motor cursor in bounded batches"""
+    batch_size = batch_size or JOURNEY_BATCH_SIZE
+    cursor = db.journeys.find(query or {}, projection or STORED_FRAME_PROJECTION).batch_size(batch_size)
+    if sort:
+        cursor = cursor.sort(sort)
+    
+    while True:
+        with metrics.stage("db_fetch"):
+            batch = await cursor.to_list(batch_size)
+        if not batch:
+            break
+        yield batch
+
+# Analytics sources: the live journeys collection, or a columnar snapshot of it (see snapshot.py)
+ANALYTICS_SOURCE = os.environ.get('ANALYTICS_SOURCE', 'mongo').lower()
+if ANALYTICS_SOURCE not in ('mongo', 'snapshot'):
+    raise ValueError("ANALYTICS_SOURCE must be one of mongo, snapshot")
+SNAPSHOT_PATH = Path(os.environ.get('SNAPSHOT_PATH', ROOT_DIR / 'journeys.snapshot'))
+
+class MongoJourneySource:
+    """Journeys streamed from db.journeys, filtered by MongoDB"""
+    
+    async def version(self) -> int:
+        return await dataset_version()
+    
+    async def frames(self, index: ChannelIndex, query: Optional[Dict] = None,
+                     batch_size: Optional[int] = None) -> AsyncIterator[JourneyFrame]:
+        """Decode each streamed batch into a columnar frame sharing one channel index"""
+        async for batch in iter_journey_batches(await stored_query(query or {}), STORED_FRAME_PROJECTION, batch_size):
+            with metrics.stage("decode"):
+                frame = await decode_stored(compact.decode_frame, batch, index)
+            yield frame
+
+class SnapshotJourneySource:
+    """Journeys read from the memory-mapped snapshot at `path`, filtered in numpy; MongoDB is never queried"""
+    
+    def __init__(self, path: Path):
+        self.path = path
+        self.snapshot: Optional[Snapshot] = None
+        self.stamp = None
+    
+    def open(self) -> Snapshot:
+        """The current snapshot, reopened when a refresh has replaced it"""
+        stamp = snapshot.manifest_stamp(self.path)
+        if self.snapshot is None or stamp != self.stamp:
+            self.snapshot = Snapshot(self.path)
+            self.stamp = stamp
+        return self.snapshot
+    
+    async def version(self) -> str:
+        return self.open().snapshot_id
+    
+    async def frames(self, index: ChannelIndex, query: Optional[Dict] = None,
+                     batch_size: Optional[int] = None) -> AsyncIterator[JourneyFrame]:
+        """Zero-copy frames of the snapshot; only batches a query drops journeys from are copied"""
+        for frame in self.open().frames(index, batch_size or JOURNEY_BATCH_SIZE):
+            if query:
+                with metrics.stage("decode"):
+                    frame = await compute_backend.decode(snapshot.select, frame, query)
+            yield frame
+
+mongo_journeys = MongoJourneySource()
+snapshot_journeys = SnapshotJourneySource(SNAPSHOT_PATH)
+journey_source = snapshot_journeys if ANALYTICS_SOURCE == 'snapshot' else mongo_journeys
+
+async def analytics_version():
+    """Version of the data analytics read: the dataset generation, or the snapshot id"""
+    return await journey_source.version()
+
+async def refresh_snapshot(path: Optional[Path] = None) -> Dict:
+    """Export the journeys collection to a new snapshot that replaces the one at `path` when complete"""
+    # Read first, so writes racing the export leave the snapshot marked stale
+    version = await dataset_version()
+    writer = snapshot.SnapshotWriter(path or SNAPSHOT_PATH)
+    try:
+        async for frame in mongo_journeys.frames(ChannelIndex(CHANNELS)):
+            writer.append(frame)
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.commit(dataset_version=version, source=f"{db.name}.journeys")
+
+async def snapshot_status() -> Dict:
+    """The snapshot's manifest details, its age and whether the journeys collection has changed since"""
+    status = {"analytics_source": ANALYTICS_SOURCE, "path": str(SNAPSHOT_PATH)}
+    try:
+        manifest = snapshot_journeys.open().manifest
+    except SnapshotUnavailable:
+        return {**status, "available": False, "stale": True}
+    
+    try:
+        current = await dataset_version()
+    except PyMongoError:
+        current = None
+    created_at = datetime.fromisoformat(manifest["created_at"])
+    return {
+        **status,
+        "available": True,
+        "snapshot_id": manifest["snapshot_id"],
+        "created_at": manifest["created_at"],
+        "age_seconds": round((datetime.now(timezone.utc) - created_at).total_seconds(), 1),
+        "journeys": manifest["journeys"],
+        "dataset_version": manifest["dataset_version"],
+        "current_dataset_version": current,
+        # Unknown while MongoDB is unreachable
+        "stale": None if current is None else manifest["dataset_version"] != current
+    }
+
+async def fold_frames(frames: AsyncIterable[JourneyFrame], *accumulators) -> int:
+    """Fold every frame into the accumulators on the compute backend and return the number of journeys seen"""
+    journeys = 0
+    async with compute_backend.admit():
+        async for frame in frames:
+            with metrics.stage("compute"):
+                updated = await compute_backend.run(fold_frame, accumulators, frame)
+            metrics.count_processed(frame.journey_count, len(frame.channel_ids))
+            # Process workers hand back updated copies; carry their state over to the caller's objects
+            for accumulator, copy in zip(accumulators, updated):
+                if copy is not accumulator:
+                    vars(accumulator).update(vars(copy))
+            journeys += frame.journey_count
+    return journeys
+
+async def fold_journeys(*accumulators, index: Optional[ChannelIndex] = None, query: Optional[Dict] = None,
+                        batch_size: Optional[int] = None, source=None) -> int:
+    """Stream the journeys of the analytics source (or `source`) through accumulators"""
+    index = index or ChannelIndex(CHANNELS)
+    source = source or journey_source
+    return await fold_frames(source.frames(index, query, batch_size), *accumulators)
+
+async def stream_attribution(models: List[ModelSpec], query: Optional[Dict] = None) -> AttributionMatrix:
+    """Evaluate attribution models over the whole collection, one batch at a time"""
+    index = ChannelIndex(CHANNELS)
+    matrix = AttributionMatrix(index, models)
+    await fold_journeys(matrix, index=index, query=query)
+    return matrix
+
+# Materialized attribution: per-model, per-channel totals and a day x model x channel rollup,
+# kept current by every journey write
+USE_ATTRIBUTION_AGGREGATES = os.environ.get('USE_ATTRIBUTION_AGGREGATES', 'true').lower() in ('1', 'true', 'yes')
+
+AGGREGATE_COLLECTIONS = ("attribution_aggregates", "attribution_daily")
+
+async def apply_attribution_deltas(journeys: List[Dict], sign: int = 1) -> None:
+    """Add (sign=1) or remove (sign=-1) journeys' credit in the attribution aggregates"""
+    if not journeys:
+        return
+    if not USE_ATTRIBUTION_AGGREGATES:
+        # Unmaintained aggregates must not be served if the setting is turned back on before a rebuild
+        for collection in AGGREGATE_COLLECTIONS:
+            await db[collection].delete_one({"_id": aggregates.TOTALS_ID})
+        return
+    
+    deltas = await compute_backend.decode(aggregates.aggregate_deltas, journeys, CHANNELS, sign)
+    await asyncio.gather(*(db[collection].bulk_write(operations, ordered=False)
+                           for collection, operations in deltas.items()))
+
+async def current_totals(collection) -> Optional[Dict]:
+    """The totals document of an aggregate collection, or None when it does not account for every journey"""
+    if not USE_ATTRIBUTION_AGGREGATES or journey_source is not mongo_journeys:
+        return None
+    totals = await collection.find_one({"_id": aggregates.TOTALS_ID})
+    # A write between inserting journeys and applying their deltas shows up as a count mismatch
+    if not totals or totals["journeys"] != await db.journeys.estimated_document_count():
+        return None
+    return totals
+
+async def read_attribution_aggregates(models: List[str]) -> Optional[Dict]:
+    """All-time channel totals for rule-based models, or None when they cannot be trusted"""
+    totals = await current_totals(db.attribution_aggregates)
+    if not totals:
+        return None
+    
+    rows = await db.attribution_aggregates.find({"model": {"$in": models}}).sort("_id", 1).to_list(None)
+    return {
+        "journeys": totals["journeys"],
+        "total_revenue": totals["revenue"],
+        "channel_data": {model: aggregates.channel_data([row for row in rows if row["model"] == model])
+                         for model in models}
+    }
+
+def rollup_window(filters: Dict) -> Optional[Dict]:
+    """The conversion_date range of a journeys query the daily rollup can answer ({} for all days), else None"""
+    if set(filters) - {"conversion_date"}:
+        return None
+    return filters.get("conversion_date", {})
+
+async def read_daily_attribution(models: List[str], days: Dict) -> Optional[Dict]:
+    """Channel totals for rule-based models over a range of conversion days, or None when they cannot be trusted"""
+    if not await current_totals(db.attribution_daily):
+        return None
+    
+    day_query = {"day": days} if days else {}
+    totals = await db.attribution_daily.find(
+        {"model": aggregates.TOTALS_ID, **day_query}, {"_id": 0, "conversions": 1, "revenue": 1}
+    ).to_list(None)
+    
+    channel_data = None
+    if USE_AGGREGATION_PIPELINES:
+        try:
+            rows = await db.attribution_daily.aggregate(daily_attribution_pipeline(models, days)).to_list(None)
+            channel_data = aggregates.grouped_channel_data(rows, models)
+        except OperationFailure as e:
+            logger.warning("Daily rollup pipeline failed, summing its documents in Python instead: %s", e)
+    if channel_data is None:
+        documents = await db.attribution_daily.find({"model": {"$in": models}, **day_query}).to_list(None)
+        channel_data = aggregates.sum_daily_documents(documents, models)
+    
+    return {
+        "journeys": sum(row["conversions"] for row in totals),
+        "total_revenue": sum(row["revenue"] for row in totals),
+        "channel_data": channel_data
+    }
+
+async def stored_attribution(models: List[str], filters: Dict) -> Optional[Dict]:
+    """Default-parameter attribution from the maintained aggregates when they can answer the query"""
+    days = rollup_window(filters)
+    if days is None:
+        return None
+    with metrics.stage("db_fetch"):
+        if not filters:
+            return await read_attribution_aggregates(models)
+        return await read_daily_attribution(models, days)
+
+async def read_daily_totals(days: Dict) -> Optional[List[Dict]]:
+    """Per-day conversions, revenue and spend from the daily rollup, shaped like revenue_trends_pipeline rows"""
+    with metrics.stage("db_fetch"):
+        if not await current_totals(db.attribution_daily):
+            return None
+        query = {"model": aggregates.TOTALS_ID, **({"day": days} if days else {})}
+        rows = await db.attribution_daily.find(query, {"_id": 0, "model": 0}).sort("day", 1).to_list(None)
+    return [{"_id": row["day"].date().isoformat(), "conversions": row["conversions"], "revenue": row["revenue"],
+             "spend": row["spend"]}
+            for row in rows if row["conversions"] > 0]
+
+async def recompute_attribution_aggregates() -> Dict[str, List[Dict]]:
+    """Contents of every aggregate collection recomputed from the journeys collection"""
+    index = ChannelIndex(CHANNELS)
+    matrix = AttributionMatrix(index, MODEL_NAMES)
+    rollup = aggregates.DailyRollup()
+    await fold_journeys(matrix, rollup, index=index, source=mongo_journeys)
+    return aggregates.collection_documents(matrix, rollup)
+
+async def rebuild_attribution_aggregates() -> Dict:
+    """Replace the attribution aggregates with a full recomputation"""
+    expected = await recompute_attribution_aggregates()
+    for collection, documents in expected.items():
+        # Readers fall back to streaming while the totals document is missing
+        await db[collection].delete_many({})
+        await db[collection].insert_many(documents)
+    return {collection: len(documents) for collection, documents in expected.items()}
+
+async def check_attribution_aggregates() -> Dict:
+    """Compare the attribution aggregates with a full recomputation"""
+    stored = {collection: await db[collection].find().to_list(None) for collection in AGGREGATE_COLLECTIONS}
+    expected = await recompute_attribution_aggregates()
+    mismatches = [
+        {"collection": collection, **mismatch}
+        for collection, documents in expected.items()
+        for mismatch in aggregates.compare(stored[collection], documents)
+    ]
+    return {"consistent": not mismatches, "mismatches": mismatches[:100], "mismatch_count": len(mismatches)}
+
+# Journey listing: keyset pages on journey_id, streamed as they are read
+JOURNEYS_MAX_PAGE = int(os.environ.get('JOURNEYS_MAX_PAGE', '10000'))
+
+JOURNEY_STREAM_BATCH_SIZE = 500
+
+def encode_cursor(journey_id: str) -> str:
+    """Opaque page cursor for the last journey_id of a page"""
+    return base64.urlsafe_b64encode(journey_id.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> str:
+    """journey_id a page cursor points past; anything not from encode_cursor is a 400"""
+    try:
+        journey_id = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        journey_id = None
+    # The decoder skips stray characters, so only a cursor that re-encodes to itself is accepted
+    if not journey_id or encode_cursor(journey_id) != cursor:
+        raise HTTPException(status_code=400, detail="Malformed cursor")
+    return journey_id
+
+def journey_projection(fields: Optional[str]) -> Optional[Dict]:
+    """Projection for a comma-separated field list; None means full documents"""
+    if not fields:
+        return None
+    
+    selected = {"journey_id"}
+    for field in (name.strip() for name in fields.split(",")):
+        parent, _, child = field.partition(".")
+        if parent not in Journey.model_fields or (child and (parent != "touchpoints" or child not in Touchpoint.model_fields)):
+            raise HTTPException(status_code=400, detail=f"Unknown journey field: {field}")
+        selected.add(field)
+    
+    # A whole touchpoints array already covers its subfields, and MongoDB rejects both together
+    if "touchpoints" in selected:
+        selected = {field for field in selected if not field.startswith("touchpoints.")}
+    return compact.translate_projection({"_id": 0, **{field: 1 for field in sorted(selected)}}, JOURNEY_STORAGE)
+
+def encode_journeys(batch: List[Dict], projected: bool, ndjson: bool, leading: bool,
+                    codes: Optional[CodeTable] = None) -> bytes:
+    """Serialize a batch of stored journey documents as NDJSON lines or JSON array items"""
+    if codes is not None:
+        batch = compact.decode_journeys(batch, codes)
+    if projected or FAST_SERIALIZATION:
+        # Partial documents cannot be validated as Journey, and trusted ones need not be
+        items = [dumps(doc) for doc in batch]
+    else:
+        items = [Journey.model_validate(doc).model_dump_json().encode() for doc in batch]
+    
+    if ndjson:
+        return b"".join(item + b"\n" for item in items)
+    return (b"," if leading else b"") + b",".join(items)
+
+async def stream_journeys(query: Dict, projection: Optional[Dict], ndjson: bool) -> AsyncIterator[bytes]:
+    """Stream one page of journeys without holding more than a cursor batch in memory"""
+    if not ndjson:
+        yield b"["
+    leading = False
+    async for batch in iter_journey_batches(query, projection or {"_id": 0}, JOURNEY_STREAM_BATCH_SIZE,
+                                            sort=[("journey_id", 1)]):
+        with metrics.stage("serialize"):
+            chunk = await decode_stored(encode_journeys, batch, projection is not None, ndjson, leading)
+        yield chunk
+        leading = True
+    if not ndjson:
+        yield b"]"
+
+# Bulk ingestion: NDJSON is read, validated and inserted a batch at a time
+BULK_BATCH_SIZE = int(os.environ.get('BULK_BATCH_SIZE', '1000'))
+BULK_MAX_PENDING_BATCHES = int(os.environ.get('BULK_MAX_PENDING_BATCHES', '2'))
+BULK_MAX_ERRORS = int(os.environ.get('BULK_MAX_ERRORS', '1000'))
+BULK_MAX_LINE_BYTES = int(os.environ.get('BULK_MAX_LINE_BYTES', str(1 << 20)))
+
+# Shared by all uploads so ingestion cannot take every MongoDB connection from dashboard reads
+bulk_insert_slots = asyncio.Semaphore(int(os.environ.get('BULK_INSERT_CONCURRENCY', '4')))
+
+def journey_document(payload: Dict) -> Dict:
+    """Validate an uploaded journey and shape it for storage"""
+    journey = Journey.model_validate(payload)
+    # The attribution engine indexes journeys by their touchpoints; an empty or miscounted journey would skew it
+    if not journey.touchpoints:
+        raise ValueError("touchpoints: at least one touchpoint is required")
+    if journey.touchpoint_count != len(journey.touchpoints):
+        raise ValueError(
+            f"touchpoint_count: {journey.touchpoint_count} does not match {len(journey.touchpoints)} touchpoints"
+        )
+    document = journey.model_dump()
+    conversion_date = datetime.fromisoformat(journey.conversion_date)
+    document["conversion_date"] = conversion_date if conversion_date.tzinfo else conversion_date.replace(tzinfo=timezone.utc)
+    return document
+
+async def insert_journey_lines(lines: List, report: IngestReport) -> None:
+    """Validate a batch of NDJSON lines off the event loop and insert the valid journeys unordered"""
+    documents, errors = await compute_backend.decode(parse_lines, lines, journey_document)
+    report.add_errors(errors)
+    if not documents:
+        return
+    
+    journeys = [document for _, document in documents]
+    async with bulk_insert_slots:
+        try:
+            result = await db.journeys.insert_many(await stored_documents(journeys), ordered=False)
+            report.inserted += len(result.inserted_ids)
+        except BulkWriteError as e:
+            report.inserted += e.details.get("nInserted", 0)
+            report.add_errors(write_errors(e, [number for number, _ in documents]))
+            rejected = {detail["index"] for detail in e.details.get("writeErrors", [])}
+            journeys = [journey for i, journey in enumerate(journeys) if i not in rejected]
+        await apply_attribution_deltas(journeys)
+
+# Journey filters, pushed into the MongoDB query so the indexes below can serve them
+async def stored_query(query: Dict) -> Dict:
+    """A journeys query from journey_filters rewritten for the stored layout; compact channels filter by code"""
+    if JOURNEY_STORAGE != "compact" or "touchpoints.channel" not in query:
+        return query
+    names = query["touchpoints.channel"]["$in"]
+    codes = journey_codes
+    if any(name not in codes.codes["channel"] for name in names):
+        codes = await load_journey_codes()
+    stored = {field: condition for field, condition in query.items() if field != "touchpoints.channel"}
+    # Names nobody has written match nothing
+    stored[compact.touchpoint_path("channel", JOURNEY_STORAGE)] = {
+        "$in": [codes.codes["channel"][name] for name in names if name in codes.codes["channel"]]
+    }
+    return stored
+
+async def journey_filters(
+    start: Optional[date] = Query(None, description="First conversion day (UTC), inclusive"),
+    end: Optional[date] = Query(None, description="Last conversion day (UTC), inclusive"),
+    channel: Optional[List[str]] = Query(None, description="Only journeys touching any of these channels"),
+    min_value: Optional[float] = Query(None, ge=0),
+    max_value: Optional[float] = Query(None, ge=0)
+) -> Dict:
+    """Build the journeys query for the common filter parameters"""
+    if start and end and start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    if min_value is not None and max_value is not None and min_value > max_value:
+        raise HTTPException(status_code=400, detail="min_value must not exceed max_value")
+    
+    query = {}
+    dates = {}
+    if start:
+        dates["$gte"] = datetime.combine(start, time.min, tzinfo=timezone.utc)
+    if end:
+        dates["$lt"] = datetime.combine(end + timedelta(days=1), time.min, tzinfo=timezone.utc)
+    if dates:
+        query["conversion_date"] = dates
+    if channel:
+        query["touchpoints.channel"] = {"$in": sorted(set(channel))}
+    values = {}
+    if min_value is not None:
+        values["$gte"] = min_value
+    if max_value is not None:
+        values["$lte"] = max_value
+    if values:
+        query["conversion_value"] = values
+    return query
+
+# Tunable rule-based models; weight tables are built once per parameter set and reused across requests
+ATTRIBUTION_BATCH_LIMIT = int(os.environ.get('ATTRIBUTION_BATCH_LIMIT', '1000'))
+
+def model_parameters(model: str, half_life: Optional[float] = None, first_weight: Optional[float] = None,
+                     middle_weight: Optional[float] = None, last_weight: Optional[float] = None,
+                     others_weight: Optional[float] = None) -> ModelParams:
+    """Validate request parameters for a rule-based model, filling unset values from its defaults"""
+    try:
+        return resolve_params(
+            model, half_life=half_life, first=first_weight, middle=middle_weight, last=last_weight,
+            others=others_weight
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def check_model_parameters(model: str, half_life: Optional[float] = None, first_weight: Optional[float] = None,
+                           middle_weight: Optional[float] = None, last_weight: Optional[float] = None,
+                           others_weight: Optional[float] = None) -> None:
+    """Reject tuning parameters the model does not use instead of silently ignoring them"""
+    given = {"half_life": half_life, "first_weight": first_weight, "middle_weight": middle_weight,
+             "last_weight": last_weight, "others_weight": others_weight}
+    used = DEFAULT_PARAMS.get(model, {})
+    unused = [name for name, value in given.items() if value is not None and name.removesuffix("_weight") not in used]
+    if unused:
+        raise HTTPException(status_code=400, detail=f"{', '.join(unused)} not used by the {model} model")
+
+def normalize_model(model: str) -> str:
+    model = model.lower().replace("-", "_")
+    return MODEL_ALIASES.get(model, model)
+
+# Data-driven Markov model; fitted chains are cached per dataset generation
+MARKOV_MAX_ORDER = 4
+
+async def fit_markov(order: int, query: Optional[Dict] = None):
+    """Fit an order-k Markov chain plus linear touchpoint stats over the matching journeys"""
+    async def fit():
+        index = ChannelIndex(CHANNELS)
+        matrix = AttributionMatrix(index, ["linear"])
+        markov = MarkovAccumulator(order)
+        await fold_journeys(matrix, markov, index=index, query=query)
+        with metrics.stage("compute"):
+            async with compute_backend.admit():
+                return matrix, await compute_backend.run(MarkovModel, markov)
+    
+    return await result_cache.get_or_compute(await fit_key("markov_fit", order, repr(query)), fit)
+
+async def markov_attribution(order: int, query: Optional[Dict] = None) -> List[AttributionResult]:
+    """Attribute revenue by each channel's removal effect"""
+    matrix, model = await fit_markov(order, query)
+    
+    if not matrix.journeys:
+        raise HTTPException(status_code=404, detail="No journeys found. Please generate sample data first.")
+    
+    channel_data = model.channel_data(matrix.channel_data("linear"), matrix.total_revenue)
+    return format_attribution_results(channel_data, matrix.total_revenue)
+
+# Shapley values over channel coalitions; exact enumeration up to this many channels
+SHAPLEY_EXACT_MAX_CHANNELS = 20
+
+async def fit_shapley_game(query: Optional[Dict] = None):
+    """Collapse the matching journeys to (channel-set bitmask, revenue) pairs plus linear touchpoint stats"""
+    async def fit():
+        index = ChannelIndex(CHANNELS)
+        matrix = AttributionMatrix(index, ["linear"])
+        coalitions = ShapleyAccumulator()
+        await fold_journeys(matrix, coalitions, index=index, query=query)
+        return matrix, coalitions.coalition_game()
+    
+    return await result_cache.get_or_compute(await fit_key("shapley_game", repr(query)), fit)
+
+async def shapley_attribution(mode: str, tolerance: float, max_samples: int,
+                              query: Optional[Dict] = None) -> List[AttributionResult]:
+    """Attribute revenue by each channel's Shapley value"""
+    matrix, game = await fit_shapley_game(query)
+    
+    if not matrix.journeys:
+        raise HTTPException(status_code=404, detail="No journeys found. Please generate sample data first.")
+    
+    if mode == "exact" and game.players > SHAPLEY_EXACT_MAX_CHANNELS:
+        raise HTTPException(status_code=400, detail=f"Exact Shapley supports at most {SHAPLEY_EXACT_MAX_CHANNELS} channels")
+    
+    if mode == "sample" or (mode == "auto" and game.players > SHAPLEY_EXACT_MAX_CHANNELS):
+        with metrics.stage("compute"):
+            async with compute_backend.admit():
+                values, error, samples = await sample_shapley(
+                    game, compute_backend.run, compute_backend.workers, tolerance, max_samples
+                )
+        logger.info("Sampled Shapley over %d permutations, relative std error %.5f", samples, error)
+    else:
+        key = ("shapley_exact", repr(query), await analytics_version())
+        
+        async def solve():
+            async with compute_backend.admit():
+                return await compute_backend.run(game.exact)
+        with metrics.stage("compute"):
+            values = await result_cache.get_or_compute(key, solve)
+    
+    revenue = dict(zip(game.channels, values.tolist()))
+    channel_data = {
+        channel: {**data, "revenue": revenue.get(channel, 0.0)}
+        for channel, data in matrix.channel_data("linear").items()
+    }
+    return format_attribution_results(channel_data, matrix.total_revenue)
+
+# Sampled attribution (?sample= / ?max_error=): rule-based models evaluated on a stratified sample of the journeys,
+# with 95% confidence intervals (see sampling.py)
+SAMPLE_PILOT_FRACTION = float(os.environ.get('SAMPLE_PILOT_FRACTION', '0.01'))
+SAMPLE_MIN_JOURNEYS = int(os.environ.get('SAMPLE_MIN_JOURNEYS', '1000'))
+
+# A larger sample costs about as much as the exact pass, which is run instead
+SAMPLE_EXACT_FRACTION = 0.25
+
+SAMPLE_ATTEMPTS = 3
+
+# Headroom on the sample size an attempt's error predicts for max_error, since that error is itself estimated
+SAMPLE_MARGIN = 1.2
+
+# Samples drawn in Python are reproducible, and a larger fraction's sample contains a smaller one's
+SAMPLE_SEED = 0
+
+async def sample_attribution(models: List[ModelSpec], fraction: float,
+                             query: Optional[Dict] = None) -> AttributionEstimate:
+    """Estimate attribution from one stratified sample of the matching journeys, drawn by MongoDB when it can"""
+    if USE_AGGREGATION_PIPELINES and journey_source is mongo_journeys:
+        estimator = SampledAttribution(models, fraction)
+        try:
+            with metrics.stage("db_fetch"):
+                pipeline = strata_pipeline(await stored_query(query or {}), STRATUM_TOUCHPOINTS)
+                estimator.load_population(await db.journeys.aggregate(pipeline, allowDiskUse=True).to_list(None))
+            # Only the journeys $sampleRate picks are fetched and decoded
+            await fold_journeys(estimator, query={**(query or {}), "$sampleRate": fraction})
+            with metrics.stage("compute"):
+                return estimator.estimate()
+        except OperationFailure as e:
+            logger.warning("Server-side sampling failed, sampling journeys in Python instead: %s", e)
+    
+    estimator = SampledAttribution(models, fraction, seed=SAMPLE_SEED)
+    await fold_journeys(estimator, query=query)
+    with metrics.stage("compute"):
+        return estimator.estimate()
+
+async def estimate_attribution(models: List[ModelSpec], query: Optional[Dict], sample: Optional[float],
+                               max_error: Optional[float]) -> AttributionEstimate:
+    """Sample at `sample`, growing the sample until every channel's share is within `max_error`; exact when a
+    sample would not be much cheaper or the bound is not met in SAMPLE_ATTEMPTS tries"""
+    fraction = sample or SAMPLE_PILOT_FRACTION
+    for _ in range(SAMPLE_ATTEMPTS):
+        if fraction >= SAMPLE_EXACT_FRACTION:
+            break
+        estimate = await sample_attribution(models, fraction, query)
+        if not estimate.journeys:
+            return estimate
+        error = estimate.share_error
+        if estimate.sampled >= SAMPLE_MIN_JOURNEYS and np.isfinite(error) and (max_error is None or error <= max_error):
+            logger.info("Sampled attribution over %d of %d journeys, share error %.5f",
+                        estimate.sampled, estimate.journeys, error)
+            return estimate
+        # A stratum with too few sampled journeys has no variance estimate until the sample grows
+        if not np.isfinite(error):
+            fraction *= 2
+        # The error shrinks with the square root of the sample size
+        elif max_error is not None and error > max_error:
+            fraction *= (error / max_error) ** 2 * SAMPLE_MARGIN
+        fraction = max(fraction, SAMPLE_MIN_JOURNEYS * SAMPLE_MARGIN / estimate.journeys)
+    
+    logger.info("Sampling would not meet the requested error cheaply; computing attribution exactly")
+    matrix = await stream_attribution(models, query)
+    return AttributionEstimate.exact(matrix.models, [matrix.channel_data(row) for row in range(len(matrix.models))],
+                                     matrix.journeys, matrix.total_revenue)
+
+async def estimated_model_results(model: str, params: ModelParams, filters: Dict, sample: Optional[float],
+                                  max_error: Optional[float]) -> List[EstimatedAttributionResult]:
+    """One rule-based model's sampled results; the stored aggregates answer exactly when they can"""
+    stored = await stored_attribution([model], filters) if params == resolve_params(model) else None
+    if stored and stored["journeys"]:
+        estimate = AttributionEstimate.exact([model], [stored["channel_data"][model]], stored["journeys"],
+                                             stored["total_revenue"])
+    else:
+        estimate = await estimate_attribution([(model, params)], filters, sample, max_error)
+    
+    if not estimate.journeys:
+        raise HTTPException(status_code=404, detail="No journeys found. Please generate sample data first.")
+    
+    return format_estimated_results(estimate, 0)
+
+async def estimated_comparison(filters: Dict, sample: Optional[float],
+                               max_error: Optional[float]) -> List[ModelComparison]:
+    """Every rule-based model's sampled results from one sample"""
+    models = list(MODEL_LABELS)
+    stored = await stored_attribution(models, filters)
+    if stored and stored["journeys"]:
+        estimate = AttributionEstimate.exact(models, [stored["channel_data"][model] for model in models],
+                                             stored["journeys"], stored["total_revenue"])
+    else:
+        estimate = await estimate_attribution(models, filters, sample, max_error)
+    
+    if not estimate.journeys:
+        raise HTTPException(status_code=404, detail="No journeys found")
+    
+    return [ModelComparison(model_name=MODEL_LABELS[model], channels=format_estimated_results(estimate, row))
+            for row, model in enumerate(estimate.models)]
+
+def check_sampled_model(model: str) -> None:
+    if model in ("markov", "shapley"):
+        raise HTTPException(status_code=400, detail="sample and max_error apply to the rule-based models only")
+
+# Channel pair statistics are folded once per dataset version and ranked per request
+async def fit_synergy() -> SynergyAccumulator:
+    """Fold every journey's channel set and channel ordering"""
+    async def fit():
+        synergy = SynergyAccumulator()
+        await fold_journeys(synergy)
+        return synergy
+    
+    return await result_cache.get_or_compute(await fit_key("synergy_fit"), fit)
+
+# Conversion paths: a prefix trie over every journey's channel sequence, built once per dataset version
+PATH_ANALYSIS_MAX_K = 1000
+
+async def fit_paths(query: Optional[Dict] = None) -> PathIndex:
+    """Build the path trie of the matching journeys in one streaming pass"""
+    async def fit():
+        paths = PathAccumulator()
+        await fold_journeys(paths, query=query)
+        with metrics.stage("compute"):
+            async with compute_backend.admit():
+                return await compute_backend.run(PathIndex, paths)
+    
+    return await result_cache.get_or_compute(await fit_key("path_index", repr(query)), fit)
+
+def path_report(index: PathIndex, top_k: int, prefix_length: Optional[int], rank_by: str,
+                path: Optional[List[str]]) -> Dict:
+    result = {
+        "journeys": index.journeys,
+        "distinct_paths": index.distinct_paths,
+        "paths": index.top(top_k, rank_by, prefix_length)
+    }
+    if path:
+        result["path"] = index.lookup(path)
+    return result
+
+# Summary endpoints run as MongoDB aggregation pipelines unless disabled
+USE_AGGREGATION_PIPELINES = os.environ.get('USE_AGGREGATION_PIPELINES', 'true').lower() in ('1', 'true', 'yes')
+
+async def aggregate_into(accumulator, pipeline: Callable[[Dict], List[Dict]], query: Optional[Dict] = None) -> bool:
+    """Load a server-side aggregation of the matching journeys into an accumulator; False means use the in-Python fold"""
+    if not USE_AGGREGATION_PIPELINES or journey_source is not mongo_journeys:
+        return False
+    
+    try:
+        with metrics.stage("db_fetch"):
+            rows = await db.journeys.aggregate(pipeline(await stored_query(query or {})), allowDiskUse=True).to_list(None)
+    except OperationFailure as e:
+        logger.warning("Aggregation pipeline failed, folding journeys in Python instead: %s", e)
+        return False
+    
+    accumulator.load(rows)
+    return True
 
 # API Routes
 @api_router.get("/")
@@ -458,347 +1188,771 @@ async def root():
     return {"message": "AttributionIQ API"}
 
 @api_router.post("/generate-data")
-async def create_sample_data():
+async def create_sample_data(
+    count: int = Query(150, ge=1, le=GENERATE_MAX_COUNT),
+    seed: Optional[int] = Query(None, ge=0, description="Same seed, count and weights reproduce the same journeys"),
+    paid_first: float = Query(1.0, ge=0, description="Relative weight of journeys opening on a paid channel"),
+    organic_first: float = Query(1.0, ge=0, description="Relative weight of journeys opening on an organic channel"),
+    mixed: float = Query(1.0, ge=0, description="Relative weight of journeys opening on any channel"),
+    background: bool = Query(False, description="Return immediately and report progress at /generate-data/{job_id}")
+):
     """Generate sample data"""
-    result = await generate_sample_data()
-    return result
+    if any(job["progress"].status == "running" for job in generation_jobs.values()):
+        raise HTTPException(status_code=409, detail="A data generation run is already in progress")
+    
+    seed = seed if seed is not None else random.getrandbits(63)
+    try:
+        sample_generator(count, seed, (paid_first, organic_first, mixed))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    progress = GenerationProgress(str(uuid.uuid4()), count, seed)
+    job = {"progress": progress}
+    generation_jobs[progress.job_id] = job
+    while len(generation_jobs) > 20:
+        generation_jobs.popitem(last=False)
+    
+    run = generate_sample_data(count, seed, (paid_first, organic_first, mixed), progress)
+    if not background:
+        return {**await run, "job_id": progress.job_id}
+    
+    job["task"] = asyncio.create_task(run)
+    job["task"].add_done_callback(lambda task: task.cancelled() or task.exception())
+    return JSONResponse(status_code=202, content=progress.snapshot())
+
+@api_router.get("/generate-data/{job_id}")
+async def get_generation_progress(job_id: str):
+    """Get progress of a data generation run"""
+    job = generation_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Generation job not found")
+    return job["progress"].snapshot()
 
 @api_router.get("/journeys", response_model=List[Journey])
-async def get_journeys():
-    """Get all customer journeys"""
-    journeys = await db.journeys.find({}, {"_id": 0}).to_list(1000)
-    return journeys
+@conditional(dataset_version)
+async def get_journeys(
+    request: Request,
+    after: Optional[str] = Query(None, description="Cursor from the previous page's X-Next-Cursor header"),
+    limit: int = Query(1000, ge=1, le=JOURNEYS_MAX_PAGE),
+    fields: Optional[str] = Query(None, description="Comma-separated fields, e.g. journey_id,customer_name,touchpoints.channel"),
+    search: Optional[str] = Query(None, max_length=100, description="Case-insensitive part of customer_name or journey_id"),
+    min_touchpoints: Optional[int] = Query(None, ge=1),
+    max_touchpoints: Optional[int] = Query(None, ge=1),
+    response_format: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+    filters: Dict = Depends(journey_filters)
+):
+    """Get a page of customer journeys ordered by journey_id"""
+    projection = journey_projection(fields)
+    query = dict(await stored_query(filters))
+    # Searched server-side so every page holds matches, not just the pages a client has loaded
+    if search:
+        pattern = {"$regex": re.escape(search), "$options": "i"}
+        query["$or"] = [{"customer_name": pattern}, {"journey_id": pattern}]
+    counts = {}
+    if min_touchpoints is not None:
+        counts["$gte"] = min_touchpoints
+    if max_touchpoints is not None:
+        counts["$lte"] = max_touchpoints
+    if counts:
+        query["touchpoint_count"] = counts
+    if after is not None:
+        query["journey_id"] = {"$gt": decode_cursor(after)}
+    
+    # Find the page's last key on the journey_id index first, so the cursor can go out in the headers
+    # and the page is bounded even if journeys are inserted while it streams
+    keys = await db.journeys.find(query, {"_id": 0, "journey_id": 1}).sort("journey_id", 1).skip(limit - 1).to_list(2)
+    headers = {}
+    if keys:
+        query["journey_id"] = {**query.get("journey_id", {}), "$lte": keys[0]["journey_id"]}
+        if len(keys) > 1:
+            cursor = encode_cursor(keys[0]["journey_id"])
+            headers["X-Next-Cursor"] = cursor
+            headers["Link"] = f'<{request.url.include_query_params(after=cursor)}>; rel="next"'
+    
+    ndjson = response_format == "ndjson"
+    return StreamingResponse(
+        stream_journeys(query, projection, ndjson),
+        media_type="application/x-ndjson" if ndjson else "application/json",
+        headers=headers
+    )
+
+@api_router.post("/journeys/bulk")
+async def bulk_insert_journeys(request: Request):
+    """Append journeys from an NDJSON request body, one journey per line"""
+    report = IngestReport(BULK_MAX_ERRORS)
+    pending = set()
+    batch = []
+    
+    async def flush():
+        nonlocal pending
+        # Reading pauses while too many batches are in flight, which pushes back on the client
+        while len(pending) >= BULK_MAX_PENDING_BATCHES:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+    
+    try:
+        async for number, line in iter_lines(request.stream(), BULK_MAX_LINE_BYTES):
+            report.received += 1
+            batch.append((number, line))
+            if len(batch) >= BULK_BATCH_SIZE:
+                await flush()
+                pending.add(asyncio.create_task(insert_journey_lines(batch, report)))
+                batch = []
+        if batch:
+            pending.add(asyncio.create_task(insert_journey_lines(batch, report)))
+        for task in asyncio.as_completed(pending):
+            await task
+    except LineTooLong as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    finally:
+        for task in pending:
+            task.cancel()
+        if report.inserted:
+            await bump_dataset_version()
+    
+    return report.result()
 
 @api_router.get("/journeys/{journey_id}", response_model=Journey)
+@conditional(dataset_version)
+@fast_response
 async def get_journey(journey_id: str):
     """Get single journey by ID"""
     journey = await db.journeys.find_one({"journey_id": journey_id}, {"_id": 0})
     if not journey:
         raise HTTPException(status_code=404, detail="Journey not found")
-    return journey
+    return await decode_stored(compact.decode_journey, journey)
+
+@api_router.delete("/journeys/{journey_id}")
+async def delete_journey(journey_id: str):
+    """Delete a single journey by ID"""
+    journey = await db.journeys.find_one_and_delete({"journey_id": journey_id}, STORED_FRAME_PROJECTION)
+    if not journey:
+        raise HTTPException(status_code=404, detail="Journey not found")
+    
+    await apply_attribution_deltas([await decode_stored(compact.decode_journey, journey)], sign=-1)
+    await bump_dataset_version()
+    return {"message": "Journey deleted", "journey_id": journey_id}
 
-@api_router.get("/attribution/{model}", response_model=List[AttributionResult])
-async def get_attribution(model: str):
+@api_router.get("/attribution/{model}", response_model=List[Union[EstimatedAttributionResult, AttributionResult]])
+@conditional(analytics_version)
+@fast_response
+@cached_result("attribution")
+async def get_attribution(
+    model: str,
+    order: int = Query(1, ge=1, le=MARKOV_MAX_ORDER),
+    mode: str = Query("auto", pattern="^(auto|exact|sample)$"),
+    tolerance: float = Query(0.005, gt=0, le=1),
+    max_samples: int = Query(20000, ge=1, le=1_000_000),
+    half_life: Optional[float] = Query(None, gt=0),
+    first_weight: Optional[float] = Query(None, ge=0, le=1),
+    middle_weight: Optional[float] = Query(None, ge=0, le=1),
+    last_weight: Optional[float] = Query(None, ge=0, le=1),
+    others_weight: Optional[float] = Query(None, ge=0, le=1),
+    sample: Optional[float] = Query(None, gt=0, le=1, description="Fraction of journeys to sample"),
+    max_error: Optional[float] = Query(
+        None, gt=0, lt=1, description="Largest 95% confidence half-width of a channel's share, as a fraction"
+    ),
+    filters: Dict = Depends(journey_filters)
+):
     """Get attribution for specific model"""
-    journeys = await db.journeys.find({}, {"_id": 0}).to_list(1000)
+    model = normalize_model(model)
+    if model not in MODEL_LABELS and model not in ("markov", "shapley"):
+        raise HTTPException(status_code=400, detail="Invalid model name")
+    sampled = sample is not None or max_error is not None
+    if sampled:
+        check_sampled_model(model)
+    check_model_parameters(model, half_life, first_weight, middle_weight, last_weight, others_weight)
     
-    if not journeys:
+    if model == "markov":
+        return await markov_attribution(order, filters)
+    if model == "shapley":
+        return await shapley_attribution(mode, tolerance, max_samples, filters)
+    
+    params = model_parameters(model, half_life, first_weight, middle_weight, last_weight, others_weight)
+    if sampled:
+        return await estimated_model_results(model, params, filters, sample, max_error)
+    if params == resolve_params(model):
+        stored = await stored_attribution([model], filters)
+        if stored and stored["journeys"]:
+            return format_attribution_results(stored["channel_data"][model], stored["total_revenue"])
+    
+    matrix = await stream_attribution([(model, params)], filters)
+    
+    if not matrix.journeys:
         raise HTTPException(status_code=404, detail="No journeys found. Please generate sample data first.")
     
-    model = model.lower().replace("-", "_")
+    return format_model_results(matrix, 0)
+
+@api_router.post("/attribution/batch", response_model=List[ParameterizedAttribution])
+@fast_response
+@cached_result("attribution_batch")
+async def batch_attribution(configs: List[ModelParameters], filters: Dict = Depends(journey_filters)):
+    """Evaluate many rule-based model parameterizations in one pass over the journeys"""
+    if not configs:
+        raise HTTPException(status_code=400, detail="At least one parameter set is required")
+    if len(configs) > ATTRIBUTION_BATCH_LIMIT:
+        raise HTTPException(status_code=400, detail=f"At most {ATTRIBUTION_BATCH_LIMIT} parameter sets per batch")
     
-    if model == "first_touch":
-        return calculate_first_touch(journeys)
-    elif model == "last_touch":
-        return calculate_last_touch(journeys)
-    elif model == "last_non_direct":
-        return calculate_last_non_direct(journeys)
-    elif model == "linear":
-        return calculate_linear(journeys)
-    elif model == "time_decay":
-        return calculate_time_decay(journeys)
-    elif model == "position_based" or model == "u_shaped":
-        return calculate_position_based(journeys)
-    elif model == "w_shaped":
-        return calculate_w_shaped(journeys)
-    else:
-        raise HTTPException(status_code=400, detail="Invalid model name")
+    specs = []
+    for config in configs:
+        model = normalize_model(config.model)
+        if model not in MODEL_LABELS:
+            raise HTTPException(status_code=400, detail=f"Invalid model name: {config.model}")
+        check_model_parameters(
+            model, config.half_life, config.first_weight, config.middle_weight, config.last_weight,
+            config.others_weight
+        )
+        params = model_parameters(
+            model, config.half_life, config.first_weight, config.middle_weight, config.last_weight,
+            config.others_weight
+        )
+        specs.append((model, params))
+    
+    matrix = await stream_attribution(specs, filters)
+    
+    if not matrix.journeys:
+        raise HTTPException(status_code=404, detail="No journeys found. Please generate sample data first.")
+    
+    return [ParameterizedAttribution(model_name=MODEL_LABELS[model], params=dict(params),
+                                     channels=format_model_results(matrix, row))
+            for row, (model, params) in enumerate(specs)]
 
 @api_router.get("/attribution/compare/all", response_model=List[ModelComparison])
-async def compare_all_models():
+@conditional(analytics_version)
+@fast_response
+@cached_result("compare_all")
+async def compare_all_models(
+    sample: Optional[float] = Query(None, gt=0, le=1, description="Fraction of journeys to sample"),
+    max_error: Optional[float] = Query(
+        None, gt=0, lt=1, description="Largest 95% confidence half-width of a channel's share, as a fraction"
+    ),
+    filters: Dict = Depends(journey_filters)
+):
     """Compare all attribution models"""
-    journeys = await db.journeys.find({}, {"_id": 0}).to_list(1000)
+    if sample is not None or max_error is not None:
+        return await estimated_comparison(filters, sample, max_error)
     
-    if not journeys:
-        raise HTTPException(status_code=404, detail="No journeys found")
+    stored = await stored_attribution(list(MODEL_LABELS), filters)
+    if stored and stored["journeys"]:
+        return [ModelComparison(model_name=MODEL_LABELS[model],
+                                channels=format_attribution_results(data, stored["total_revenue"]))
+                for model, data in stored["channel_data"].items()]
     
-    models = [
-        ("First-Touch", calculate_first_touch(journeys)),
-        ("Last-Touch", calculate_last_touch(journeys)),
-        ("Last Non-Direct", calculate_last_non_direct(journeys)),
-        ("Linear", calculate_linear(journeys)),
-        ("Time Decay", calculate_time_decay(journeys)),
-        ("U-Shaped", calculate_position_based(journeys)),
-        ("W-Shaped", calculate_w_shaped(journeys))
-    ]
+    matrix = await stream_attribution(list(MODEL_LABELS), filters)
     
-    return [ModelComparison(model_name=name, channels=channels) for name, channels in models]
+    if not matrix.journeys:
+        raise HTTPException(status_code=404, detail="No journeys found")
+    
+    return [ModelComparison(model_name=MODEL_LABELS[model], channels=format_model_results(matrix, model))
+            for model in matrix.models]
 
 @api_router.get("/stats")
-async def get_stats():
+@conditional(analytics_version)
+@cached_result("stats")
+async def get_stats(filters: Dict = Depends(journey_filters)):
     """Get overall statistics"""
-    journeys = await db.journeys.find({}, {"_id": 0}).to_list(1000)
-    
-    if not journeys:
-        return {
-            "total_conversions": 0,
-            "total_revenue": 0,
-            "avg_touchpoints": 0,
-            "avg_time_to_conversion": 0,
-            "total_marketing_spend": 0,
-            "overall_roas": 0
-        }
-    
-    total_revenue = sum(j["conversion_value"] for j in journeys)
-    total_touchpoints = sum(j["touchpoint_count"] for j in journeys)
-    total_time = sum(j["time_to_conversion"] for j in journeys)
-    
-    total_spend = 0
-    for journey in journeys:
-        for tp in journey["touchpoints"]:
-            total_spend += tp["cost"]
-    
-    return {
-        "total_conversions": len(journeys),
-        "total_revenue": round(total_revenue, 2),
-        "avg_touchpoints": round(total_touchpoints / len(journeys), 1),
-        "avg_time_to_conversion": round(total_time / len(journeys), 1),
-        "total_marketing_spend": round(total_spend, 2),
-        "overall_roas": round(total_revenue / total_spend, 2) if total_spend > 0 else 0
-    }
+    stats = StatsAccumulator()
+    if not await aggregate_into(stats, functools.partial(stats_pipeline, cost_path=STORED_COST_PATH), filters):
+        await fold_journeys(stats, query=filters)
+    return stats.result()
 
 @api_router.get("/advanced-metrics")
+@conditional(analytics_version)
+@cached_result("advanced_metrics")
 async def get_advanced_metrics():
     """Get advanced marketing metrics"""
-    journeys = await db.journeys.find({}, {"_id": 0}).to_list(1000)
+    channel_metrics = ChannelMetricsAccumulator()
     
-    if not journeys:
+    if not await fold_journeys(channel_metrics):
         return {}
     
-    # Calculate channel-specific metrics
-    channel_metrics = {}
-    for journey in journeys:
-        for tp in journey["touchpoints"]:
-            channel = tp["channel"]
-            if channel not in channel_metrics:
-                channel_metrics[channel] = {
-                    "total_interactions": 0,
-                    "conversions": 0,
-                    "revenue": 0,
-                    "spend": 0
-                }
-            channel_metrics[channel]["total_interactions"] += 1
-            channel_metrics[channel]["spend"] += tp["cost"]
+    return channel_metrics.result()
+
+@api_router.get("/revenue-trends")
+@conditional(analytics_version)
+@cached_result("revenue_trends")
+async def get_revenue_trends(filters: Dict = Depends(journey_filters)):
+    """Get daily revenue trends"""
+    trends = RevenueTrendsAccumulator()
+    days = rollup_window(filters)
+    rows = await read_daily_totals(days) if days is not None else None
+    if rows is not None:
+        trends.load(rows)
+    elif not await aggregate_into(trends, functools.partial(revenue_trends_pipeline, cost_path=STORED_COST_PATH), filters):
+        await fold_journeys(trends, query=filters)
+    return trends.result()
+
+@api_router.get("/channel-synergy")
+@conditional(analytics_version)
+@cached_result("channel_synergy")
+async def get_channel_synergy(
+    top_k: Optional[int] = Query(None, ge=1, description="Only this many of the strongest pairs"),
+    rank_by: str = Query("co_occurrences", pattern=f"^({'|'.join(SynergyAccumulator.RANKINGS)})$")
+):
+    """Get co-occurrence, ordering, lift and conversion value statistics for every channel pair"""
+    synergy = await fit_synergy()
+    return synergy.result(top_k, rank_by)
+
+@api_router.get("/path-analysis")
+@conditional(analytics_version)
+async def get_path_analysis(
+    top_k: int = Query(10, ge=1, le=PATH_ANALYSIS_MAX_K),
+    prefix_length: Optional[int] = Query(None, ge=1, description="Rank path prefixes of this many touchpoints"),
+    rank_by: str = Query("journeys", pattern=f"^({'|'.join(PATH_RANKINGS)})$"),
+    path: Optional[List[str]] = Query(None, description="Channels of one path to report, in touchpoint order"),
+    filters: Dict = Depends(journey_filters)
+):
+    """Get the top converting channel paths or path prefixes with their revenue and time to conversion"""
+    return path_report(await fit_paths(filters), top_k, prefix_length, rank_by, path)
+
+@api_router.get("/funnel-analysis")
+@conditional(analytics_version)
+@cached_result("funnel_analysis")
+async def get_funnel_analysis():
+    """Get customer journey funnel by touchpoint count"""
+    funnel = FunnelAccumulator()
+    if not await aggregate_into(funnel, funnel_pipeline):
+        await fold_journeys(funnel)
+    return funnel.result()
+
+@api_router.get("/top-performers")
+@conditional(analytics_version)
+@cached_result("top_performers")
+async def get_top_performers():
+    """Get top and bottom performing channels across all models"""
+    # Get linear attribution as a fair baseline
+    stored = await stored_attribution(["linear"], {})
+    if stored:
+        if not stored["journeys"]:
+            return {"top": [], "bottom": []}
+        sorted_channels = format_attribution_results(stored["channel_data"]["linear"], stored["total_revenue"])
+    else:
+        matrix = await stream_attribution(["linear"])
         
-        # Count unique channels in journey
-        unique_channels = set(tp["channel"] for tp in journey["touchpoints"])
-        for channel in unique_channels:
-            if channel in channel_metrics:
-                channel_metrics[channel]["conversions"] += 1
-                channel_metrics[channel]["revenue"] += journey["conversion_value"] / len(unique_channels)
-    
-    # Format results with conversion rate and CPA
-    results = []
-    for channel, metrics in channel_metrics.items():
-        conversion_rate = (metrics["conversions"] / metrics["total_interactions"] * 100) if metrics["total_interactions"] > 0 else 0
-        cpa = metrics["spend"] / metrics["conversions"] if metrics["conversions"] > 0 else 0
+        if not matrix.journeys:
+            return {"top": [], "bottom": []}
         
-        results.append({
-            "channel": channel,
-            "conversion_rate": round(conversion_rate, 2),
-            "cpa": round(cpa, 2),
-            "total_interactions": metrics["total_interactions"],
-            "conversions": metrics["conversions"],
-            "revenue": round(metrics["revenue"], 2),
-            "spend": round(metrics["spend"], 2)
-        })
+        # Sort by attributed revenue
+        sorted_channels = format_model_results(matrix, "linear")
     
-    return sorted(results, key=lambda x: x["conversion_rate"], reverse=True)
+    return performers(sorted_channels)
 
-@api_router.get("/revenue-trends")
-async def get_revenue_trends():
-    """Get daily revenue trends"""
-    journeys = await db.journeys.find({}, {"_id": 0}).to_list(1000)
+def performers(sorted_channels: List[AttributionResult]) -> Dict:
+    """The five strongest and five weakest channels of a ranked attribution"""
+    return {
+        "top": [{"channel": ch.channel, "revenue": ch.attributed_revenue, "roas": ch.roas} 
+                for ch in sorted_channels[:5]],
+        "bottom": [{"channel": ch.channel, "revenue": ch.attributed_revenue, "roas": ch.roas} 
+                   for ch in sorted_channels[-5:]]
+    }
+
+@api_router.get("/attribution-variance")
+@conditional(analytics_version)
+@cached_result("attribution_variance")
+async def get_attribution_variance():
+    """Analyze how much attribution varies across different models"""
+    matrix = await stream_attribution(VARIANCE_MODELS)
     
-    if not journeys:
+    if not matrix.journeys:
         return []
     
-    # Group by conversion date
-    date_revenue = {}
-    for journey in journeys:
-        date_str = journey["conversion_date"][:10]  # Get YYYY-MM-DD
-        if date_str not in date_revenue:
-            date_revenue[date_str] = {
-                "conversions": 0,
-                "revenue": 0,
-                "spend": 0
-            }
-        date_revenue[date_str]["conversions"] += 1
-        date_revenue[date_str]["revenue"] += journey["conversion_value"]
-        
-        for tp in journey["touchpoints"]:
-            date_revenue[date_str]["spend"] += tp["cost"]
+    return variance_report(matrix, list(range(len(matrix.models))))
+
+def variance_report(matrix: AttributionMatrix, rows: List[int]) -> List[Dict]:
+    """Spread of each channel's attributed revenue across the models of the given matrix rows"""
+    # Channel x model matrix of attributed revenue, rounded as the API reports it
+    revenues = np.array([[round(value, 2) for value in row] for row in matrix.revenue[rows].T.tolist()])
+    present = matrix.present()[rows].T
+    stats = spread_statistics(revenues, present)
     
-    # Sort by date and format
-    sorted_dates = sorted(date_revenue.keys())
-    results = []
-    cumulative_revenue = 0
-    
-    for date in sorted_dates:
-        data = date_revenue[date]
-        cumulative_revenue += data["revenue"]
-        results.append({
-            "date": date,
-            "revenue": round(data["revenue"], 2),
-            "conversions": data["conversions"],
-            "spend": round(data["spend"], 2),
-            "cumulative_revenue": round(cumulative_revenue, 2),
-            "roas": round(data["revenue"] / data["spend"], 2) if data["spend"] > 0 else 0
+    variance_data = []
+    for channel_id in np.flatnonzero(stats["count"]):
+        variance_data.append({
+            "channel": matrix.index.names[channel_id],
+            "avg_revenue": round(float(stats["mean"][channel_id]), 2),
+            "std_dev": round(float(stats["std"][channel_id]), 2),
+            "coefficient_of_variation": round(float(stats["cov"][channel_id]), 2),
+            "min_revenue": round(float(stats["min"][channel_id]), 2),
+            "max_revenue": round(float(stats["max"][channel_id]), 2)
         })
     
-    return results
+    return sorted(variance_data, key=lambda x: x["coefficient_of_variation"], reverse=True)
 
-@api_router.get("/channel-synergy")
-async def get_channel_synergy():
-    """Get channel co-occurrence matrix for synergy analysis"""
-    journeys = await db.journeys.find({}, {"_id": 0}).to_list(1000)
+# Dashboard: the widgets of a page view answered from one pass over the journeys
+DASHBOARD_MAX_WIDGETS = int(os.environ.get('DASHBOARD_MAX_WIDGETS', '32'))
+
+class DashboardPass:
+    """Accumulators of every widget in a dashboard request, folded together in one pass per journeys query"""
     
-    if not journeys:
-        return []
+    def __init__(self):
+        self.groups: Dict[str, Dict] = {}
+        self.fits: Dict[tuple, Callable] = {}
     
-    # Build co-occurrence matrix
-    synergy_matrix = {}
+    def group(self, query: Dict) -> Dict:
+        return self.groups.setdefault(repr(query), {"query": query, "accumulators": {}, "models": {}, "journeys": 0})
     
-    for journey in journeys:
-        channels = list(set(tp["channel"] for tp in journey["touchpoints"]))
-        
-        # Count co-occurrences
-        for i, ch1 in enumerate(channels):
-            if ch1 not in synergy_matrix:
-                synergy_matrix[ch1] = {}
+    def accumulator(self, query: Dict, name, factory: Callable):
+        """The accumulator `name` of the pass over `query`, shared by every widget asking for it"""
+        accumulators = self.group(query)["accumulators"]
+        if name not in accumulators:
+            accumulators[name] = factory()
+        return accumulators[name]
+    
+    def attribution(self, query: Dict, models: List[ModelSpec]) -> List[int]:
+        """Rows of the pass's attribution matrix crediting `models`; every model is evaluated once"""
+        rows = self.group(query)["models"]
+        specs = [(model, resolve_params(model)) if isinstance(model, str) else model for model in models]
+        return [rows.setdefault(spec, len(rows)) for spec in specs]
+    
+    def matrix(self, query: Dict) -> AttributionMatrix:
+        return self.group(query)["accumulators"]["matrix"]
+    
+    def journeys(self, query: Dict) -> int:
+        return self.group(query)["journeys"]
+    
+    def fit(self, key: tuple, fit: Callable) -> None:
+        """Cache a fitted model under `key` once the pass is done, for the widget and later requests alike"""
+        self.fits.setdefault(key, fit)
+    
+    @property
+    def passes(self) -> int:
+        return sum(1 for group in self.groups.values() if group["accumulators"] or group["models"])
+    
+    async def run(self) -> None:
+        for group in self.groups.values():
+            if group["models"]:
+                group["accumulators"]["matrix"] = AttributionMatrix(ChannelIndex(CHANNELS), list(group["models"]))
+            if group["accumulators"]:
+                group["journeys"] = await fold_journeys(*group["accumulators"].values(), query=group["query"])
+        for key, fit in self.fits.items():
+            await result_cache.get_or_compute(key, fit)
+
+def answered(value):
+    async def answer():
+        return value
+    return answer
+
+# Each planner registers what its widget needs with the pass, and returns the coroutine function that
+# answers the widget once the pass has run; answers match the widget's own endpoint
+async def plan_stats(shared: DashboardPass, filters: Dict):
+    stats = shared.accumulator(filters, "stats", StatsAccumulator)
+    
+    async def answer():
+        return stats.result()
+    return answer
+
+async def plan_attribution(shared: DashboardPass, filters: Dict, model: str, order: int, mode: str, tolerance: float,
+                           max_samples: int, half_life: Optional[float], first_weight: Optional[float],
+                           middle_weight: Optional[float], last_weight: Optional[float],
+                           others_weight: Optional[float], sample: Optional[float], max_error: Optional[float]):
+    model = normalize_model(model)
+    if model not in MODEL_LABELS and model not in ("markov", "shapley"):
+        raise HTTPException(status_code=400, detail="Invalid model name")
+    sampled = sample is not None or max_error is not None
+    if sampled:
+        check_sampled_model(model)
+    check_model_parameters(model, half_life, first_weight, middle_weight, last_weight, others_weight)
+    
+    if model == "markov":
+        key = await fit_key("markov_fit", order, repr(filters))
+        if key not in result_cache:
+            shared.attribution(filters, ["linear"])
+            markov = shared.accumulator(filters, ("markov", order), lambda: MarkovAccumulator(order))
             
-            for ch2 in channels:
-                if ch2 not in synergy_matrix[ch1]:
-                    synergy_matrix[ch1][ch2] = 0
-                synergy_matrix[ch1][ch2] += 1
+            async def fit():
+                with metrics.stage("compute"):
+                    async with compute_backend.admit():
+                        return shared.matrix(filters), await compute_backend.run(MarkovModel, markov)
+            shared.fit(key, fit)
+        return lambda: markov_attribution(order, filters)
     
-    # Format for heatmap
-    results = []
-    for ch1, connections in synergy_matrix.items():
-        for ch2, count in connections.items():
-            results.append({
-                "channel1": ch1,
-                "channel2": ch2,
-                "co_occurrences": count
-            })
+    if model == "shapley":
+        key = await fit_key("shapley_game", repr(filters))
+        if key not in result_cache:
+            shared.attribution(filters, ["linear"])
+            coalitions = shared.accumulator(filters, "shapley", ShapleyAccumulator)
+            
+            async def fit():
+                return shared.matrix(filters), coalitions.coalition_game()
+            shared.fit(key, fit)
+        return lambda: shapley_attribution(mode, tolerance, max_samples, filters)
     
-    return results
+    params = model_parameters(model, half_life, first_weight, middle_weight, last_weight, others_weight)
+    # Samples are drawn apart from the shared pass, which reads every journey anyway
+    if sampled:
+        return lambda: estimated_model_results(model, params, filters, sample, max_error)
+    if params == resolve_params(model):
+        stored = await stored_attribution([model], filters)
+        if stored and stored["journeys"]:
+            return answered(format_attribution_results(stored["channel_data"][model], stored["total_revenue"]))
+    
+    row, = shared.attribution(filters, [(model, params)])
+    
+    async def answer():
+        matrix = shared.matrix(filters)
+        if not matrix.journeys:
+            raise HTTPException(status_code=404, detail="No journeys found. Please generate sample data first.")
+        return format_model_results(matrix, row)
+    return answer
 
-@api_router.get("/funnel-analysis")
-async def get_funnel_analysis():
-    """Get customer journey funnel by touchpoint count"""
-    journeys = await db.journeys.find({}, {"_id": 0}).to_list(1000)
+async def plan_compare_all(shared: DashboardPass, filters: Dict, sample: Optional[float], max_error: Optional[float]):
+    if sample is not None or max_error is not None:
+        return lambda: estimated_comparison(filters, sample, max_error)
     
-    if not journeys:
-        return []
+    stored = await stored_attribution(list(MODEL_LABELS), filters)
+    if stored and stored["journeys"]:
+        return answered([ModelComparison(model_name=MODEL_LABELS[model],
+                                         channels=format_attribution_results(data, stored["total_revenue"]))
+                         for model, data in stored["channel_data"].items()])
     
-    # Group by touchpoint count
-    funnel_data = {}
-    for journey in journeys:
-        count = journey["touchpoint_count"]
-        if count not in funnel_data:
-            funnel_data[count] = {
-                "journeys": 0,
-                "revenue": 0,
-                "avg_conversion_value": 0
-            }
-        funnel_data[count]["journeys"] += 1
-        funnel_data[count]["revenue"] += journey["conversion_value"]
-    
-    # Calculate averages and format
-    results = []
-    for touchpoint_count in sorted(funnel_data.keys()):
-        data = funnel_data[touchpoint_count]
-        results.append({
-            "touchpoint_count": touchpoint_count,
-            "journeys": data["journeys"],
-            "revenue": round(data["revenue"], 2),
-            "avg_conversion_value": round(data["revenue"] / data["journeys"], 2)
-        })
+    rows = shared.attribution(filters, list(MODEL_LABELS))
     
-    return results
+    async def answer():
+        matrix = shared.matrix(filters)
+        if not matrix.journeys:
+            raise HTTPException(status_code=404, detail="No journeys found")
+        return [ModelComparison(model_name=MODEL_LABELS[model], channels=format_model_results(matrix, row))
+                for model, row in zip(MODEL_LABELS, rows)]
+    return answer
 
-@api_router.get("/top-performers")
-async def get_top_performers():
-    """Get top and bottom performing channels across all models"""
-    journeys = await db.journeys.find({}, {"_id": 0}).to_list(1000)
+async def plan_advanced_metrics(shared: DashboardPass):
+    channel_metrics = shared.accumulator({}, "channel_metrics", ChannelMetricsAccumulator)
     
-    if not journeys:
-        return {"top": [], "bottom": []}
+    async def answer():
+        return channel_metrics.result() if shared.journeys({}) else {}
+    return answer
+
+async def plan_revenue_trends(shared: DashboardPass, filters: Dict):
+    days = rollup_window(filters)
+    rows = await read_daily_totals(days) if days is not None else None
+    if rows is not None:
+        trends = RevenueTrendsAccumulator()
+        trends.load(rows)
+    else:
+        trends = shared.accumulator(filters, "revenue_trends", RevenueTrendsAccumulator)
     
-    # Get linear attribution as a fair baseline
-    linear_results = calculate_linear(journeys)
+    async def answer():
+        return trends.result()
+    return answer
+
+async def plan_channel_synergy(shared: DashboardPass, top_k: Optional[int], rank_by: str):
+    key = await fit_key("synergy_fit")
+    if key not in result_cache:
+        synergy = shared.accumulator({}, "synergy", SynergyAccumulator)
+        
+        async def fit():
+            return synergy
+        shared.fit(key, fit)
     
-    # Sort by attributed revenue
-    sorted_channels = sorted(linear_results, key=lambda x: x.attributed_revenue, reverse=True)
+    async def answer():
+        return (await fit_synergy()).result(top_k, rank_by)
+    return answer
+
+async def plan_path_analysis(shared: DashboardPass, filters: Dict, top_k: int, prefix_length: Optional[int],
+                             rank_by: str, path: Optional[List[str]]):
+    key = await fit_key("path_index", repr(filters))
+    if key not in result_cache:
+        paths = shared.accumulator(filters, "paths", PathAccumulator)
+        
+        async def fit():
+            with metrics.stage("compute"):
+                async with compute_backend.admit():
+                    return await compute_backend.run(PathIndex, paths)
+        shared.fit(key, fit)
     
-    return {
-        "top": [{"channel": ch.channel, "revenue": ch.attributed_revenue, "roas": ch.roas} 
-                for ch in sorted_channels[:5]],
-        "bottom": [{"channel": ch.channel, "revenue": ch.attributed_revenue, "roas": ch.roas} 
-                   for ch in sorted_channels[-5:]]
-    }
+    async def answer():
+        return path_report(await fit_paths(filters), top_k, prefix_length, rank_by, path)
+    return answer
 
-@api_router.get("/attribution-variance")
-async def get_attribution_variance():
-    """Analyze how much attribution varies across different models"""
-    journeys = await db.journeys.find({}, {"_id": 0}).to_list(1000)
+async def plan_funnel_analysis(shared: DashboardPass):
+    funnel = shared.accumulator({}, "funnel", FunnelAccumulator)
     
-    if not journeys:
-        return []
+    async def answer():
+        return funnel.result()
+    return answer
+
+async def plan_top_performers(shared: DashboardPass):
+    stored = await stored_attribution(["linear"], {})
+    if stored is None:
+        row, = shared.attribution({}, ["linear"])
+    
+    async def answer():
+        if stored is not None:
+            if not stored["journeys"]:
+                return {"top": [], "bottom": []}
+            return performers(format_attribution_results(stored["channel_data"]["linear"], stored["total_revenue"]))
+        matrix = shared.matrix({})
+        if not matrix.journeys:
+            return {"top": [], "bottom": []}
+        return performers(format_model_results(matrix, row))
+    return answer
+
+async def plan_attribution_variance(shared: DashboardPass):
+    rows = shared.attribution({}, VARIANCE_MODELS)
     
-    # Calculate attribution for all models
-    models_data = {
-        "First-Touch": calculate_first_touch(journeys),
-        "Last-Touch": calculate_last_touch(journeys),
-        "Linear": calculate_linear(journeys),
-        "Time Decay": calculate_time_decay(journeys),
-        "U-Shaped": calculate_position_based(journeys),
-        "W-Shaped": calculate_w_shaped(journeys)
+    async def answer():
+        matrix = shared.matrix({})
+        return variance_report(matrix, rows) if matrix.journeys else []
+    return answer
+
+# Widget name: (endpoint whose parameters, defaults and cached results the widget shares, planner)
+DASHBOARD_WIDGETS = {
+    "stats": (get_stats, plan_stats),
+    "attribution": (get_attribution, plan_attribution),
+    "compare_all": (compare_all_models, plan_compare_all),
+    "advanced_metrics": (get_advanced_metrics, plan_advanced_metrics),
+    "revenue_trends": (get_revenue_trends, plan_revenue_trends),
+    "channel_synergy": (get_channel_synergy, plan_channel_synergy),
+    "path_analysis": (get_path_analysis, plan_path_analysis),
+    "funnel_analysis": (get_funnel_analysis, plan_funnel_analysis),
+    "top_performers": (get_top_performers, plan_top_performers),
+    "attribution_variance": (get_attribution_variance, plan_attribution_variance)
+}
+
+def endpoint_parameters(endpoint: Callable) -> type:
+    """A model validating an endpoint's query and path parameters, other than the journey filters"""
+    fields = {
+        name: (parameter.annotation, ... if parameter.default is inspect.Parameter.empty else parameter.default)
+        for name, parameter in inspect.signature(endpoint).parameters.items() if name != "filters"
     }
+    return create_model(f"{endpoint.__name__}_parameters", __config__=ConfigDict(extra="forbid"), **fields)
+
+DASHBOARD_PARAMETERS = {name: endpoint_parameters(endpoint) for name, (endpoint, _) in DASHBOARD_WIDGETS.items()}
+
+@api_router.post("/dashboard")
+async def get_dashboard(request: DashboardRequest, filters: Dict = Depends(journey_filters)):
+    """Answer several dashboard widgets with one pass over the journeys per distinct query"""
+    if len(request.widgets) > DASHBOARD_MAX_WIDGETS:
+        raise HTTPException(status_code=400, detail=f"At most {DASHBOARD_MAX_WIDGETS} widgets per dashboard")
     
-    # Build channel variance data
-    all_channels = set()
-    for model_results in models_data.values():
-        for result in model_results:
-            all_channels.add(result.channel)
+    # Validate every widget before any work starts
+    widgets = []
+    for position, widget in enumerate(request.widgets):
+        if widget.widget not in DASHBOARD_WIDGETS:
+            raise HTTPException(status_code=400, detail=f"Unknown widget: {widget.widget}")
+        try:
+            params = DASHBOARD_PARAMETERS[widget.widget].model_validate(widget.params).model_dump()
+        except ValidationError as e:
+            errors = e.errors(include_url=False, include_context=False)
+            for error in errors:
+                error["loc"] = ("body", "widgets", position, "params", *error["loc"])
+            raise HTTPException(status_code=422, detail=jsonable_encoder(errors))
+        widgets.append((widget.id or widget.widget, widget.widget, params))
+    ids = [widget_id for widget_id, _, _ in widgets]
+    if len(set(ids)) != len(ids):
+        raise HTTPException(status_code=400, detail="Widget ids must be unique")
     
-    variance_data = []
-    for channel in all_channels:
-        revenues = []
-        for model_name, results in models_data.items():
-            for result in results:
-                if result.channel == channel:
-                    revenues.append(result.attributed_revenue)
-                    break
-        
-        if revenues:
-            avg_revenue = sum(revenues) / len(revenues)
-            variance = sum((r - avg_revenue) ** 2 for r in revenues) / len(revenues)
-            std_dev = variance ** 0.5
-            
-            variance_data.append({
-                "channel": channel,
-                "avg_revenue": round(avg_revenue, 2),
-                "std_dev": round(std_dev, 2),
-                "coefficient_of_variation": round((std_dev / avg_revenue * 100) if avg_revenue > 0 else 0, 2),
-                "min_revenue": round(min(revenues), 2),
-                "max_revenue": round(max(revenues), 2)
-            })
+    shared = DashboardPass()
+    answers = {}
+    errors = {}
+    for widget_id, name, params in widgets:
+        endpoint, plan = DASHBOARD_WIDGETS[name]
+        kwargs = {**params, "filters": filters} if "filters" in inspect.signature(endpoint).parameters else params
+        # A cached answer from the widget's endpoint (or an earlier dashboard) needs no part of the pass
+        key = None
+        cache_endpoint = getattr(endpoint, "cache_endpoint", None)
+        if cache_endpoint:
+            key = await result_key(cache_endpoint, kwargs)
+            metrics.record_cache_lookup(cache_endpoint, key in result_cache)
+        try:
+            if key is not None and key in result_cache:
+                cached = await result_cache.get_or_compute(key, lambda: inspect.unwrap(endpoint)(**kwargs))
+                answer = answered(cached)
+            else:
+                answer = await plan(shared, **kwargs)
+                if key is not None:
+                    answer = functools.partial(result_cache.get_or_compute, key, answer)
+        except HTTPException as e:
+            errors[widget_id] = {"status_code": e.status_code, "detail": e.detail}
+            continue
+        answers[widget_id] = answer
     
-    return sorted(variance_data, key=lambda x: x["coefficient_of_variation"], reverse=True)
+    await shared.run()
+    
+    results = {}
+    for widget_id, answer in answers.items():
+        try:
+            results[widget_id] = await answer()
+        except HTTPException as e:
+            errors[widget_id] = {"status_code": e.status_code, "detail": e.detail}
+    return {"passes": shared.passes, "widgets": results, "errors": errors}
+
+@api_router.get("/cache-stats")
+async def get_cache_stats():
+    """Get result cache hit/miss counters"""
+    return {**result_cache.stats(), "dataset_version": await dataset_version()}
+
+@api_router.get("/snapshot")
+async def get_snapshot():
+    """Get the columnar snapshot's age and whether it trails the journeys collection"""
+    return await snapshot_status()
 
 # Include the router in the main app
 app.include_router(api_router)
 
+# Responses are gzip/brotli-encoded when the client accepts it; added first so request metrics include the encoding
+COMPRESS_RESPONSES = os.environ.get('COMPRESS_RESPONSES', 'true').lower() in ('1', 'true', 'yes')
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', '1024'))
+
+if COMPRESS_RESPONSES:
+    app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MIN_BYTES)
+
+# Per-route latency, stage times and work counts at /metrics; PROFILE_SLOW_REQUESTS_MS turns on the sampling profiler
+EVENT_LOOP_LAG_INTERVAL = float(os.environ.get('EVENT_LOOP_LAG_INTERVAL', '0.5'))
+PROFILE_SLOW_REQUESTS_MS = float(os.environ['PROFILE_SLOW_REQUESTS_MS']) if os.environ.get('PROFILE_SLOW_REQUESTS_MS') else None
+PROFILE_SAMPLE_INTERVAL_MS = float(os.environ.get('PROFILE_SAMPLE_INTERVAL_MS', '5'))
+PROFILE_DIR = Path(os.environ.get('PROFILE_DIR', ROOT_DIR / 'profiles'))
+
+stack_sampler = StackSampler(PROFILE_SAMPLE_INTERVAL_MS / 1000) if PROFILE_SLOW_REQUESTS_MS is not None else None
+event_loop_monitor: Optional[asyncio.Task] = None
+
+app.add_middleware(
+    MetricsMiddleware,
+    sampler=stack_sampler,
+    slow_request_seconds=PROFILE_SLOW_REQUESTS_MS / 1000 if PROFILE_SLOW_REQUESTS_MS is not None else None,
+    profile_dir=PROFILE_DIR
+)
+
+cache_entries = metrics.registry.register(metrics.Gauge("result_cache_entries", "Entries in the result cache"))
+cache_hit_ratio = metrics.registry.register(metrics.Gauge(
+    "result_cache_hit_ratio", "Share of result cache lookups served from the cache or an in-flight computation"))
+compute_pending = metrics.registry.register(metrics.Gauge("compute_pending_jobs", "Admitted compute jobs"))
+
+def collect_runtime_metrics():
+    stats = result_cache.stats()
+    cache_entries.set(value=stats["entries"])
+    cache_hit_ratio.set(value=stats["hit_ratio"])
+    compute_pending.set(value=compute_backend.pending)
+
+metrics.registry.collectors.append(collect_runtime_metrics)
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus text exposition of this worker's metrics"""
+    return Response(metrics.registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Link", "ETag"],
 )
 
+@app.exception_handler(ComputeOverloaded)
+async def compute_overloaded_handler(request, exc):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Analytics workers are busy, please retry shortly"},
+        headers={"Retry-After": "1"}
+    )
+
+@app.exception_handler(SnapshotUnavailable)
+async def snapshot_unavailable_handler(request, exc):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -806,6 +1960,63 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+async def ensure_journey_indexes():
+    await db.journeys.create_index("journey_id", unique=True)
+    await db.journeys.create_index("conversion_date")
+    await db.journeys.create_index(compact.touchpoint_path("channel", JOURNEY_STORAGE))
+    await db.attribution_daily.create_index([("model", 1), ("day", 1)])
+
+@app.on_event("startup")
+async def prepare_journeys_collection():
+    """Create the journeys indexes, load the storage codes and convert legacy string conversion dates"""
+    try:
+        await ensure_journey_indexes()
+        await load_journey_codes()
+        if JOURNEY_STORAGE == "compact":
+            # Generated data then never needs a new code
+            known = {"channel": CHANNELS, "interaction_type": INTERACTION_TYPES}
+            missing = {field: [name for name in names if name not in journey_codes.codes[field]]
+                       for field, names in known.items()}
+            await register_journey_codes({field: names for field, names in missing.items() if names})
+        sample = await db.journeys.find_one({}, {"tp": 1})
+        if sample and ("tp" in sample) != (JOURNEY_STORAGE == "compact"):
+            logger.warning("Journeys are not stored in the %s layout; run python -m compact migrate --to %s",
+                           JOURNEY_STORAGE, JOURNEY_STORAGE)
+        migrated = await db.journeys.update_many(
+            {"conversion_date": {"$type": "string"}},
+            [{"$set": {"conversion_date": {"$toDate": "$conversion_date"}}}]
+        )
+        if migrated.modified_count:
+            logger.info("Converted conversion_date to a date on %d journeys", migrated.modified_count)
+            await bump_dataset_version()
+    except PyMongoError as e:
+        logger.warning("Could not prepare the journeys collection: %s", e)
+
+@app.on_event("startup")
+async def report_snapshot():
+    """Warn when analytics read a snapshot that is missing or behind the journeys collection"""
+    if ANALYTICS_SOURCE != "snapshot":
+        return
+    status = await snapshot_status()
+    if not status["available"]:
+        logger.warning("No snapshot at %s; run python -m snapshot refresh", SNAPSHOT_PATH)
+    elif status["stale"]:
+        logger.warning("Snapshot at %s is from dataset version %s, the journeys collection is at %s",
+                       SNAPSHOT_PATH, status["dataset_version"], status["current_dataset_version"])
+
+@app.on_event("startup")
+async def start_monitoring():
+    """Start the event-loop lag monitor, and the stack sampler when slow requests are profiled"""
+    global event_loop_monitor
+    event_loop_monitor = asyncio.create_task(metrics.monitor_event_loop(EVENT_LOOP_LAG_INTERVAL))
+    if stack_sampler is not None:
+        stack_sampler.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
+    compute_backend.shutdown()
+    if event_loop_monitor is not None:
+        event_loop_monitor.cancel()
+    if stack_sampler is not None:
+        stack_sampler.stop()
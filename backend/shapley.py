@@ -0,0 +1,159 @@
+"""Shapley-value attribution over journey channel coalitions.
+
+Each journey is reduced to the bitmask of distinct channels it touched and
+journeys are collapsed to (mask, revenue) pairs.  A coalition's value is the
+revenue of every journey whose channel set is contained in it.  Exact mode
+builds the whole 2^n coalition table once with a subset-sum (zeta) transform
+and reads every marginal contribution from it; sampled mode estimates the
+values from random permutations until the standard error is within tolerance.
+"""
+import asyncio
+from math import factorial
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+import numpy as np
+
+from attribution_engine import ChannelIndex, JourneyFrame
+
+# Bitmasks are int64, so at most 62 channels can be encoded
+MAX_CHANNELS = 62
+
+
+def journey_masks(frame: JourneyFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """Channel-set bitmask and conversion value of every non-empty journey"""
+    nonempty = frame.lengths > 0
+    if not nonempty.any():
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+    bits = np.left_shift(np.int64(1), frame.channel_ids.astype(np.int64))
+    masks = np.bitwise_or.reduceat(bits, frame.offsets[:-1][nonempty])
+    return masks, frame.conversion_value[nonempty]
+
+
+def popcount(values: np.ndarray, bits: int) -> np.ndarray:
+    counts = np.zeros(len(values), dtype=np.int64)
+    for bit in range(bits):
+        counts += (values >> bit) & 1
+    return counts
+
+
+class ShapleyAccumulator:
+    """Revenue per distinct channel-set bitmask, folded batch by batch"""
+
+    def __init__(self):
+        self.index: Optional[ChannelIndex] = None
+        self.masks = np.zeros(0, dtype=np.int64)
+        self.revenue = np.zeros(0, dtype=np.float64)
+
+    def update(self, frame: JourneyFrame) -> None:
+        if len(frame.index) > MAX_CHANNELS:
+            raise ValueError(f"Shapley attribution supports at most {MAX_CHANNELS} channels")
+        self.index = frame.index
+        masks, revenue = journey_masks(frame)
+        self.masks, inverse = np.unique(np.concatenate([self.masks, masks]), return_inverse=True)
+        self.revenue = np.bincount(
+            inverse.reshape(-1), weights=np.concatenate([self.revenue, revenue]), minlength=len(self.masks)
+        )
+
+    def coalition_game(self) -> "CoalitionGame":
+        return CoalitionGame(self.masks, self.revenue, self.index.names if self.index else [])
+
+
+class CoalitionGame:
+    """Journeys re-encoded over only the channels that actually appear"""
+
+    def __init__(self, masks: np.ndarray, revenue: np.ndarray, channel_names: List[str]):
+        union = int(np.bitwise_or.reduce(masks)) if len(masks) else 0
+        self.channel_ids = [bit for bit in range(len(channel_names)) if union >> bit & 1]
+        self.channels = [channel_names[bit] for bit in self.channel_ids]
+        self.players = len(self.channel_ids)
+        self.revenue = revenue
+
+        # Compact bit positions so the coalition table is 2^players, not 2^len(index)
+        compact = np.zeros(len(masks), dtype=np.int64)
+        for player, bit in enumerate(self.channel_ids):
+            compact |= ((masks >> bit) & 1) << player
+        self.masks = compact
+
+    def coalition_values(self) -> np.ndarray:
+        """v(S) for all 2^n coalitions, computed once with a subset-sum transform"""
+        values = np.zeros(1 << self.players, dtype=np.float64)
+        np.add.at(values, self.masks, self.revenue)
+        for player in range(self.players):
+            # Each coalition with this player also collects every coalition without it
+            blocks = values.reshape(-1, 2, 1 << player)
+            blocks[:, 1, :] += blocks[:, 0, :]
+        return values
+
+    def exact(self) -> np.ndarray:
+        """Exact Shapley values from the memoized coalition table"""
+        n = self.players
+        values = self.coalition_values()
+        coalitions = np.arange(1 << n, dtype=np.int64)
+        sizes = popcount(coalitions, n)
+        weights = np.array([factorial(s) * factorial(n - s - 1) / factorial(n) for s in range(n)] + [0.0])
+
+        shapley = np.zeros(n, dtype=np.float64)
+        for player in range(n):
+            bit = 1 << player
+            without = coalitions[(coalitions & bit) == 0]
+            marginal = values[without | bit] - values[without]
+            shapley[player] = np.dot(weights[sizes[without]], marginal)
+        return shapley
+
+
+def sample_marginals(masks: np.ndarray, revenue: np.ndarray, players: int, permutations: int,
+                     seed: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Sum and sum of squares of each player's marginal contribution over random permutations"""
+    rng = np.random.default_rng(seed)
+    totals = np.zeros(players, dtype=np.float64)
+    squares = np.zeros(players, dtype=np.float64)
+    # Bound the (prefixes x journey masks) comparison to roughly 8M cells per chunk
+    chunk = max(1, 8_000_000 // max(1, (players + 1) * max(1, len(masks))))
+
+    for start in range(0, permutations, chunk):
+        count = min(chunk, permutations - start)
+        order = np.argsort(rng.random((count, players)), axis=1)
+        prefixes = np.zeros((count, players + 1), dtype=np.int64)
+        prefixes[:, 1:] = np.cumsum(np.left_shift(np.int64(1), order), axis=1)
+        contained = (masks[None, None, :] & ~prefixes[:, :, None]) == 0
+        values = contained.astype(np.float64) @ revenue
+        marginal = np.diff(values, axis=1)
+        np.add.at(totals, order.reshape(-1), marginal.reshape(-1))
+        np.add.at(squares, order.reshape(-1), (marginal ** 2).reshape(-1))
+    return totals, squares
+
+
+async def sample_shapley(game: CoalitionGame, run: Callable[..., Awaitable], workers: int,
+                         tolerance: float, max_permutations: int, seed: int = 0,
+                         round_permutations: int = 256) -> Tuple[np.ndarray, float, int]:
+    """Monte Carlo Shapley values spread over workers until the relative standard error is within tolerance.
+
+    Returns the estimates, the achieved relative standard error and the permutations used.
+    """
+    n = game.players
+    totals = np.zeros(n, dtype=np.float64)
+    squares = np.zeros(n, dtype=np.float64)
+    sampled = 0
+    scale = max(float(game.revenue.sum()), 1e-12)
+    error = float("inf")
+    round_index = 0
+
+    while sampled < max_permutations:
+        per_worker = min(round_permutations, max(1, (max_permutations - sampled) // workers))
+        jobs = [
+            run(sample_marginals, game.masks, game.revenue, n, per_worker, seed + round_index * workers + worker)
+            for worker in range(workers)
+        ]
+        for job_totals, job_squares in await asyncio.gather(*jobs):
+            totals += job_totals
+            squares += job_squares
+        sampled += per_worker * workers
+        round_index += 1
+
+        mean = totals / sampled
+        variance = np.maximum(squares / sampled - mean ** 2, 0)
+        error = float(np.sqrt(variance / sampled).max() / scale)
+        if error <= tolerance:
+            break
+
+    return totals / max(sampled, 1), error, sampled
@@ -0,0 +1,312 @@
+"""Columnar journey snapshots for analytics without MongoDB.
+
+A snapshot is a directory holding one raw column file per ``JourneyFrame``
+array, concatenated over every journey (``offsets`` are global), plus a
+``manifest.json`` with the row counts, channel names, the dataset version it
+was exported at and a unique ``snapshot_id``.  Columns are memory-mapped, so
+opening a snapshot is constant time and frames are views into the page
+cache; only filtered batches are copied.
+
+Each write goes to its own generation directory next to the snapshot path,
+and the path itself is a symlink to the current generation.  Publishing is a
+single atomic ``os.replace`` of that link, so a reader sees either the old
+manifest and columns or the new ones, never a mix.  The previous generation
+is kept until the next write, for readers that resolved the link just before
+the swap.
+
+The columns are fixed-width numbers, which numpy memory-maps directly; that
+gives the zero-copy reads of an Arrow/Parquet file without adding pyarrow.
+
+Export the journeys collection, or write seeded sample data with no MongoDB
+at all, from the backend directory:
+
+    python -m snapshot refresh
+    python -m snapshot generate --journeys 1000000 --seed 42
+"""
+import argparse
+import asyncio
+import json
+import operator
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+import numpy as np
+
+from attribution_engine import ChannelIndex, JourneyFrame
+
+TOUCHPOINT_COLUMNS = {
+    "channel_ids": "<i4",
+    "sequence": "<i8",
+    "cost": "<f8",
+    "days_before": "<i8"
+}
+JOURNEY_COLUMNS = {
+    "conversion_value": "<f8",
+    "touchpoint_count": "<i8",
+    "time_to_conversion": "<i8",
+    "conversion_day": "<M8[D]"
+}
+
+MANIFEST = "manifest.json"
+
+COMPARISONS = {"$gte": operator.ge, "$gt": operator.gt, "$lte": operator.le, "$lt": operator.lt}
+
+
+class SnapshotUnavailable(Exception):
+    """Raised when analytics are configured to read a snapshot that has not been written"""
+
+
+def generation_dirs(path: Path) -> Iterator[Path]:
+    """Published generation directories of the snapshot at `path`"""
+    for candidate in path.parent.glob(f".{path.name}.*"):
+        if candidate.is_dir() and not candidate.is_symlink() and (candidate / MANIFEST).exists():
+            yield candidate
+
+
+def manifest_stamp(path: Path) -> Optional[tuple]:
+    """Changes whenever a snapshot is written at `path`; None when there is none"""
+    try:
+        stat = (path / MANIFEST).stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+class SnapshotWriter:
+    """Append frames to a new generation directory that the snapshot link points to on commit"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.snapshot_id = uuid.uuid4().hex
+        self.staging = self.path.with_name(f".{self.path.name}.{self.snapshot_id}")
+        self.staging.mkdir(parents=True)
+        self.files = {
+            name: open(self.staging / f"{name}.bin", "wb")
+            for name in ("offsets", *TOUCHPOINT_COLUMNS, *JOURNEY_COLUMNS)
+        }
+        self.files["offsets"].write(np.zeros(1, dtype="<i8").tobytes())
+        self.journeys = 0
+        self.touchpoints = 0
+        self.channels = []
+
+    def append(self, frame: JourneyFrame) -> None:
+        # Frames of one export share a channel index, which only ever grows
+        self.channels = list(frame.index.names)
+        for name, dtype in {**TOUCHPOINT_COLUMNS, **JOURNEY_COLUMNS}.items():
+            self.files[name].write(np.ascontiguousarray(getattr(frame, name), dtype=dtype).tobytes())
+        self.files["offsets"].write((frame.offsets[1:] + self.touchpoints).astype("<i8").tobytes())
+        self.journeys += frame.journey_count
+        self.touchpoints += len(frame.channel_ids)
+
+    def commit(self, **details) -> Dict:
+        """Write the manifest and point the snapshot link at the new generation in one atomic rename"""
+        for file in self.files.values():
+            file.close()
+        manifest = {
+            "snapshot_id": self.snapshot_id,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "journeys": self.journeys,
+            "touchpoints": self.touchpoints,
+            "channels": self.channels,
+            **details
+        }
+        with open(self.staging / MANIFEST, "w") as file:
+            json.dump(manifest, file, indent=2)
+
+        previous = None
+        if self.path.is_symlink():
+            previous = self.path.with_name(os.readlink(self.path)).name
+        elif self.path.exists():
+            # A snapshot written before generations were introduced becomes the previous generation
+            previous = f".{self.path.name}.{uuid.uuid4().hex}"
+            os.replace(self.path, self.path.with_name(previous))
+
+        # Relative, so the snapshot's directory can be moved as a whole
+        link = self.path.with_name(f".{self.path.name}.{os.getpid()}.link")
+        if link.is_symlink():
+            link.unlink()
+        os.symlink(self.staging.name, link)
+        os.replace(link, self.path)
+
+        # Readers holding an older generation keep their memory maps after its files are unlinked
+        for generation in generation_dirs(self.path):
+            if generation.name not in (self.staging.name, previous):
+                shutil.rmtree(generation, ignore_errors=True)
+        return manifest
+
+    def abort(self) -> None:
+        for file in self.files.values():
+            file.close()
+        shutil.rmtree(self.staging, ignore_errors=True)
+
+
+def _column(path: Path, dtype: str, length: int) -> np.ndarray:
+    if not length:
+        # mmap cannot map an empty file
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(length,))
+
+
+class Snapshot:
+    """A memory-mapped snapshot read as JourneyFrame batches"""
+
+    def __init__(self, path: Path):
+        while True:
+            # Resolved up front, so the manifest and every column come from the same generation
+            self.path = Path(path).resolve()
+            try:
+                self._open()
+                return
+            except FileNotFoundError:
+                # Refreshes pruned the generation before it was mapped; the link then points at a newer one
+                if Path(path).resolve() == self.path:
+                    raise SnapshotUnavailable(f"No snapshot at {path}; run python -m snapshot refresh")
+
+    def _open(self) -> None:
+        with open(self.path / MANIFEST) as file:
+            self.manifest = json.load(file)
+        journeys = self.manifest["journeys"]
+        touchpoints = self.manifest["touchpoints"]
+        self.columns = {"offsets": _column(self.path / "offsets.bin", "<i8", journeys + 1)}
+        for name, dtype in TOUCHPOINT_COLUMNS.items():
+            self.columns[name] = _column(self.path / f"{name}.bin", dtype, touchpoints)
+        for name, dtype in JOURNEY_COLUMNS.items():
+            self.columns[name] = _column(self.path / f"{name}.bin", dtype, journeys)
+        if not journeys:
+            self.columns["offsets"] = np.zeros(1, dtype="<i8")
+
+    @property
+    def snapshot_id(self) -> str:
+        return self.manifest["snapshot_id"]
+
+    @property
+    def journeys(self) -> int:
+        return self.manifest["journeys"]
+
+    def frames(self, index: ChannelIndex, batch_size: int) -> Iterator[JourneyFrame]:
+        """Consecutive frames of up to `batch_size` journeys, as views of the mapped columns"""
+        names = self.manifest["channels"]
+        lookup = None
+        if index.names[:len(names)] != names:
+            lookup = np.array([index.id_for(name) for name in names], dtype=np.int32)
+        else:
+            for name in names[len(index.names):]:
+                index.id_for(name)
+
+        columns = self.columns
+        offsets = columns["offsets"]
+        for start in range(0, self.journeys, batch_size):
+            end = min(start + batch_size, self.journeys)
+            first, last = int(offsets[start]), int(offsets[end])
+            channel_ids = np.asarray(columns["channel_ids"][first:last])
+            yield JourneyFrame(
+                index=index,
+                channel_ids=lookup[channel_ids] if lookup is not None else channel_ids,
+                sequence=np.asarray(columns["sequence"][first:last]),
+                cost=np.asarray(columns["cost"][first:last]),
+                days_before=np.asarray(columns["days_before"][first:last]),
+                offsets=np.asarray(offsets[start:end + 1]) - first,
+                conversion_value=np.asarray(columns["conversion_value"][start:end]),
+                touchpoint_count=np.asarray(columns["touchpoint_count"][start:end]),
+                time_to_conversion=np.asarray(columns["time_to_conversion"][start:end]),
+                conversion_day=np.asarray(columns["conversion_day"][start:end]),
+            )
+
+
+def journey_mask(frame: JourneyFrame, query: Dict) -> np.ndarray:
+    """Journeys of a frame matching the document-layout journeys query built by journey_filters"""
+    mask = np.ones(frame.journey_count, dtype=bool)
+    for field, condition in query.items():
+        if field == "touchpoints.channel":
+            ids = [frame.index.ids[name] for name in condition["$in"] if name in frame.index.ids]
+            touched = np.isin(frame.channel_ids, ids)
+            mask &= np.bincount(frame.journey_index[touched], minlength=frame.journey_count) > 0
+            continue
+        if field == "conversion_date":
+            # Conversion days are UTC midnights, which is all the date bounds of journey_filters ever are
+            values = frame.conversion_day.astype("datetime64[us]")
+            convert = lambda bound: np.datetime64(bound.astimezone(timezone.utc).replace(tzinfo=None), "us")  # noqa: E731
+        elif field == "conversion_value":
+            values = frame.conversion_value
+            convert = float
+        else:
+            raise ValueError(f"Snapshots cannot filter on {field}")
+        for op, bound in condition.items():
+            mask &= COMPARISONS[op](values, convert(bound))
+    return mask
+
+
+def take(frame: JourneyFrame, mask: np.ndarray) -> JourneyFrame:
+    """A new frame holding only the masked journeys"""
+    keep = np.flatnonzero(mask)
+    lengths = frame.lengths[keep]
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+    rows = np.repeat(frame.offsets[keep] - offsets[:-1], lengths) + np.arange(offsets[-1])
+    return JourneyFrame(
+        index=frame.index,
+        channel_ids=frame.channel_ids[rows],
+        sequence=frame.sequence[rows],
+        cost=frame.cost[rows],
+        days_before=frame.days_before[rows],
+        offsets=offsets,
+        conversion_value=frame.conversion_value[keep],
+        touchpoint_count=frame.touchpoint_count[keep],
+        time_to_conversion=frame.time_to_conversion[keep],
+        conversion_day=frame.conversion_day[keep],
+    )
+
+
+def select(frame: JourneyFrame, query: Optional[Dict]) -> JourneyFrame:
+    """Apply a journeys query to a frame, copying only when it drops journeys"""
+    if not query:
+        return frame
+    mask = journey_mask(frame, query)
+    return frame if mask.all() else take(frame, mask)
+
+
+def generate(path: Path, journeys: int, seed: int) -> Dict:
+    """Write seeded sample journeys straight to a snapshot"""
+    import server
+
+    generator = server.sample_generator(journeys, seed)
+    index = ChannelIndex(server.CHANNELS)
+    writer = SnapshotWriter(path)
+    try:
+        for block in range(generator.blocks):
+            writer.append(JourneyFrame.from_journeys(generator.block(block), index))
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.commit(dataset_version=None, source=f"generated (seed {seed})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write the columnar journey snapshot read by ANALYTICS_SOURCE=snapshot")
+    parser.add_argument("command", choices=("refresh", "generate"))
+    parser.add_argument("--path", type=Path, default=None, help="Snapshot directory (default SNAPSHOT_PATH)")
+    parser.add_argument("--journeys", type=int, default=100_000, help="generate: number of journeys")
+    parser.add_argument("--seed", type=int, default=42, help="generate: random seed")
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        # The client is never used, so any MongoDB settings will do
+        os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+        os.environ.setdefault("DB_NAME", "attribution")
+    import server
+
+    path = args.path or server.SNAPSHOT_PATH
+    started = time.perf_counter()
+    if args.command == "generate":
+        manifest = generate(path, args.journeys, args.seed)
+    else:
+        manifest = asyncio.run(server.refresh_snapshot(path))
+    print(f"Wrote {manifest['journeys']} journeys to {path} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-import { useEffect, useState } from "react";
+import { useEffect, useRef, useState } from "react";
 import "@/App.css";
 import axios from "axios";
 import { BarChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer, Cell } from 'recharts';
@@ -16,6 +16,18 @@ import { Tooltip as TooltipUI, TooltipContent, TooltipProvider, TooltipTrigger }
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
+const JOURNEYS_PAGE_SIZE = 50;
+const JOURNEY_SUMMARY_FIELDS = "journey_id,customer_name,touchpoint_count,time_to_conversion,conversion_value,touchpoints.channel";
+const SEARCH_DEBOUNCE_MS = 300;
+
+// Touchpoint filter options as /journeys touchpoint count bounds
+const TOUCHPOINT_RANGES = {
+  "all": {},
+  "2-3": { min_touchpoints: 2, max_touchpoints: 3 },
+  "4-5": { min_touchpoints: 4, max_touchpoints: 5 },
+  "6+": { min_touchpoints: 6 }
+};
+
 const CHANNEL_COLORS = {
   "Google Ads": "#4285F4",
   "Facebook Ads": "#1877F2",
@@ -88,12 +100,15 @@ function App() {
   const [attributionData, setAttributionData] = useState([]);
   const [comparisonData, setComparisonData] = useState([]);
   const [journeys, setJourneys] = useState([]);
+  const [journeysCursor, setJourneysCursor] = useState(null);
+  const [loadingJourneys, setLoadingJourneys] = useState(false);
   const [selectedJourney, setSelectedJourney] = useState(null);
   const [journeyDetailModal, setJourneyDetailModal] = useState(false);
   const [loading, setLoading] = useState(true);
   const [searchTerm, setSearchTerm] = useState("");
   const [filterTouchpoints, setFilterTouchpoints] = useState("all");
   const [dataGenerated, setDataGenerated] = useState(false);
+  const journeysRequest = useRef(0);
 
   useEffect(() => {
     initializeData();
@@ -105,6 +120,13 @@ function App() {
     }
   }, [selectedModel, dataGenerated]);
 
+  // Search and filter run server-side, so matches on pages not yet loaded are found too
+  useEffect(() => {
+    if (!dataGenerated) return;
+    const timer = setTimeout(() => fetchJourneys(), SEARCH_DEBOUNCE_MS);
+    return () => clearTimeout(timer);
+  }, [searchTerm, filterTouchpoints]);
+
   const initializeData = async () => {
     try {
       setLoading(true);
@@ -117,11 +139,9 @@ function App() {
         await axios.post(`${API}/generate-data`);
       }
       
-      // Fetch all data
+      // Fetch all data; the overview widgets come back from one pass over the journeys
       await Promise.all([
-        fetchStats(),
-        fetchAttributionData(selectedModel),
-        fetchComparisonData(),
+        fetchOverview(selectedModel),
         fetchJourneys()
       ]);
       
@@ -133,12 +153,21 @@ function App() {
     }
   };
 
-  const fetchStats = async () => {
+  const fetchOverview = async (model) => {
     try {
-      const response = await axios.get(`${API}/stats`);
-      setStats(response.data);
+      const response = await axios.post(`${API}/dashboard`, {
+        widgets: [
+          { widget: "stats" },
+          { widget: "attribution", params: { model } },
+          { widget: "compare_all" }
+        ]
+      });
+      const { widgets } = response.data;
+      if (widgets.stats) setStats(widgets.stats);
+      if (widgets.attribution) setAttributionData(widgets.attribution);
+      if (widgets.compare_all) setComparisonData(widgets.compare_all);
     } catch (error) {
-      console.error("Error fetching stats:", error);
+      console.error("Error fetching dashboard:", error);
     }
   };
 
@@ -151,21 +180,23 @@ function App() {
     }
   };
 
-  const fetchComparisonData = async () => {
-    try {
-      const response = await axios.get(`${API}/attribution/compare/all`);
-      setComparisonData(response.data);
-    } catch (error) {
-      console.error("Error fetching comparison:", error);
-    }
-  };
-
-  const fetchJourneys = async () => {
+  // The explorer only needs summary fields; full journeys are fetched when a row is opened
+  const fetchJourneys = async (after = null) => {
+    // Responses to superseded searches are dropped
+    const request = ++journeysRequest.current;
     try {
-      const response = await axios.get(`${API}/journeys`);
-      setJourneys(response.data);
+      setLoadingJourneys(true);
+      const params = { limit: JOURNEYS_PAGE_SIZE, fields: JOURNEY_SUMMARY_FIELDS, ...TOUCHPOINT_RANGES[filterTouchpoints] };
+      if (searchTerm.trim()) params.search = searchTerm.trim();
+      if (after) params.after = after;
+      const response = await axios.get(`${API}/journeys`, { params });
+      if (request !== journeysRequest.current) return;
+      setJourneys(previous => after ? [...previous, ...response.data] : response.data);
+      setJourneysCursor(response.headers["x-next-cursor"] || null);
     } catch (error) {
       console.error("Error fetching journeys:", error);
+    } finally {
+      if (request === journeysRequest.current) setLoadingJourneys(false);
     }
   };
 
@@ -201,18 +232,6 @@ function App() {
     }).format(value);
   };
 
-  const filteredJourneys = journeys.filter(journey => {
-    const matchesSearch = journey.customer_name.toLowerCase().includes(searchTerm.toLowerCase()) ||
-                         journey.journey_id.toLowerCase().includes(searchTerm.toLowerCase());
-    
-    const matchesFilter = filterTouchpoints === "all" ||
-                         (filterTouchpoints === "2-3" && journey.touchpoint_count >= 2 && journey.touchpoint_count <= 3) ||
-                         (filterTouchpoints === "4-5" && journey.touchpoint_count >= 4 && journey.touchpoint_count <= 5) ||
-                         (filterTouchpoints === "6+" && journey.touchpoint_count >= 6);
-    
-    return matchesSearch && matchesFilter;
-  });
-
   if (loading) {
     return (
       <div className="min-h-screen flex items-center justify-center bg-gradient-to-br from-slate-50 to-blue-50">
@@ -511,7 +530,7 @@ function App() {
                   </TableRow>
                 </TableHeader>
                 <TableBody>
-                  {filteredJourneys.slice(0, 20).map((journey) => (
+                  {journeys.map((journey) => (
                     <TableRow key={journey.journey_id} data-testid={`journey-row-${journey.journey_id}`}>
                       <TableCell className="font-medium">{journey.journey_id}</TableCell>
                       <TableCell>{journey.customer_name}</TableCell>
@@ -550,11 +569,24 @@ function App() {
                 </TableBody>
               </Table>
             </div>
-            {filteredJourneys.length === 0 && (
+            {journeys.length === 0 && !loadingJourneys && (
               <div className="text-center py-8 text-slate-500">
                 No journeys found matching your filters.
               </div>
             )}
+            {journeysCursor && (
+              <div className="text-center pt-4">
+                <Button
+                  data-testid="load-more-journeys"
+                  variant="outline"
+                  size="sm"
+                  disabled={loadingJourneys}
+                  onClick={() => fetchJourneys(journeysCursor)}
+                >
+                  {loadingJourneys ? "Loading..." : "Load more journeys"}
+                </Button>
+              </div>
+            )}
           </CardContent>
         </Card>
       </div>
@@ -0,0 +1,79 @@
+"""Shared setup: the backend's flat modules on the path and an in-process MongoDB stand-in."""
+import asyncio
+import json
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "attribution_test")
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from httpx import ASGITransport, AsyncClient  # noqa: E402
+from mongomock_motor import AsyncMongoMockClient  # noqa: E402
+
+import server  # noqa: E402
+
+
+@pytest.fixture
+def mock_db(monkeypatch):
+    """An empty mongomock database serving as the server's db, with a fresh result cache"""
+    db = AsyncMongoMockClient()["attribution_test"]
+    monkeypatch.setattr(server, "db", db)
+    server.result_cache.clear()
+    yield db
+    server.result_cache.clear()
+
+
+@pytest.fixture
+def api(mock_db):
+    """Send one request to the app in-process: api("GET", "/api/stats", params=...) returns the response"""
+    def request(method, path, **kwargs):
+        async def send():
+            async with AsyncClient(transport=ASGITransport(app=server.app), base_url="http://test") as client:
+                return await client.request(method, path, **kwargs)
+        return asyncio.run(send())
+    return request
+
+
+def ndjson(journeys):
+    """An NDJSON request body of journey documents"""
+    return "\n".join(json.dumps(jsonable_encoder(journey)) for journey in journeys)
+
+
+def make_journey(journey_id, channels, value, day="2024-03-01", costs=None):
+    """A valid journey over `channels` in order, converting on `day` one day after its last touchpoint"""
+    touchpoints = [
+        {"sequence": position + 1, "channel": channel, "timestamp": f"{day}T00:00:00+00:00",
+         "cost": costs[position] if costs else 0.0, "interaction_type": "Click",
+         "days_before_conversion": len(channels) - position}
+        for position, channel in enumerate(channels)
+    ]
+    return {"journey_id": journey_id, "customer_name": f"Customer {journey_id}", "conversion_value": value,
+            "conversion_date": f"{day}T00:00:00+00:00", "touchpoint_count": len(channels),
+            "time_to_conversion": len(channels), "touchpoints": touchpoints}
+
+
+def insert(api, journeys):
+    """Append journeys through /journeys/bulk, so every write path runs"""
+    report = api("POST", "/api/journeys/bulk", content=ndjson(journeys)).json()
+    assert report["inserted"] == len(journeys), report["errors"]
+
+
+@pytest.fixture
+def churned_db(api, mock_db):
+    """200 generated journeys, then 50 appended through /journeys/bulk and 10 deleted one at a time"""
+    assert api("POST", "/api/generate-data", params={"count": 200, "seed": 7}).status_code == 200
+    generator = server.sample_generator(50, 8)
+    appended = [{**journey, "journey_id": f"B{journey['journey_id']}"}
+                for block in range(generator.blocks) for journey in generator.block(block)]
+    insert(api, appended)
+
+    async def some_ids():
+        return [journey["journey_id"] for journey in await mock_db.journeys.find({}, {"journey_id": 1}).to_list(10)]
+    for journey_id in asyncio.run(some_ids())[:10]:
+        assert api("DELETE", f"/api/journeys/{journey_id}").status_code == 200
+    return mock_db
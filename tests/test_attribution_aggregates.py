@@ -0,0 +1,49 @@
+"""The incrementally maintained attribution aggregates match a full recomputation after every kind of write."""
+import asyncio
+
+import pytest
+
+import server
+from attribution_engine import MODEL_NAMES
+
+
+def test_aggregates_stay_consistent_through_writes(churned_db):
+    report = asyncio.run(server.check_attribution_aggregates())
+    assert report == {"consistent": True, "mismatches": [], "mismatch_count": 0}
+
+
+def test_stored_results_match_streamed_results(churned_db):
+    async def both():
+        stored = await server.read_attribution_aggregates(MODEL_NAMES)
+        streamed = await server.stream_attribution(MODEL_NAMES)
+        return stored, streamed
+
+    stored, streamed = asyncio.run(both())
+    assert stored["journeys"] == streamed.journeys == 240
+    assert stored["total_revenue"] == pytest.approx(streamed.total_revenue)
+    for row, model in enumerate(MODEL_NAMES):
+        expected = [result.model_dump() for result in server.format_model_results(streamed, row)]
+        actual = server.format_attribution_results(stored["channel_data"][model], stored["total_revenue"])
+        assert [result.model_dump() for result in actual] == expected, model
+
+
+def test_checker_flags_a_corrupted_row(churned_db):
+    async def corrupt_and_check():
+        await churned_db.attribution_aggregates.update_one({"_id": "linear:Google Ads"}, {"$inc": {"revenue": 5.0}})
+        return await server.check_attribution_aggregates()
+
+    report = asyncio.run(corrupt_and_check())
+    assert not report["consistent"]
+    assert [(m["collection"], m["id"], m["measure"]) for m in report["mismatches"]] == [
+        ("attribution_aggregates", "linear:Google Ads", "revenue")
+    ]
+    assert report["mismatches"][0]["stored"] == pytest.approx(report["mismatches"][0]["expected"] + 5.0)
+
+
+def test_rebuild_repairs_the_aggregates(churned_db):
+    async def corrupt_rebuild_check():
+        await churned_db.attribution_aggregates.delete_many({"model": "first_touch"})
+        await server.rebuild_attribution_aggregates()
+        return await server.check_attribution_aggregates()
+
+    assert asyncio.run(corrupt_rebuild_check())["consistent"]
@@ -0,0 +1,48 @@
+"""Smoke run of benchmarks.suite at 1k journeys, saving a baseline and then comparing against it."""
+import json
+import sys
+
+import pytest
+
+import server
+from benchmarks import suite
+
+SIZE = "1k"
+
+
+def run_suite(monkeypatch, *args):
+    monkeypatch.setattr(sys, "argv", ["benchmarks.suite", "--sizes", SIZE, "--repeat", "1", *args])
+    suite.main()
+
+
+@pytest.fixture
+def suite_args(monkeypatch, tmp_path):
+    # run_asgi points the server at its own database and journey source
+    monkeypatch.setattr(server, "db", server.db)
+    monkeypatch.setattr(server, "journey_source", server.journey_source)
+    server.result_cache.clear()
+    yield ["--data-dir", str(tmp_path / "data"), "--baseline", str(tmp_path / "baseline.json")]
+    server.result_cache.clear()
+
+
+def test_suite_saves_and_compares_a_baseline(monkeypatch, tmp_path, suite_args, capsys):
+    run_suite(monkeypatch, *suite_args, "--save-baseline")
+    results = json.loads((tmp_path / "baseline.json").read_text())["results"]
+    assert f"in-process markov {SIZE}" in results
+    assert f"asgi:snapshot /api/dashboard {SIZE}" in results
+    assert all(result["p50_ms"] >= 0 and result["peak_memory_mb"] >= 0 for result in results.values())
+
+    # One timed run per case at this size is noisy; the compare path is what is under test
+    run_suite(monkeypatch, *suite_args, "--threshold", "100")
+    assert "no regressions against" in capsys.readouterr().out
+
+
+def test_compare_flags_growth_past_threshold_and_noise():
+    baseline = {"case": {"p50_ms": 100.0, "peak_memory_mb": 10.0}}
+    assert suite.compare({"case": {"p50_ms": 120.0, "peak_memory_mb": 10.5}}, baseline, 0.25) == []
+    assert suite.compare({"case": {"p50_ms": 130.0, "peak_memory_mb": 10.0}}, baseline, 0.25) == [
+        ("case", "p50_ms", 100.0, 130.0)
+    ]
+    # Below the absolute noise floor growth is ignored, whatever the ratio
+    small = {"case": {"p50_ms": 1.0, "peak_memory_mb": 0.1}}
+    assert suite.compare({"case": {"p50_ms": 4.0, "peak_memory_mb": 0.5}}, small, 0.25) == []
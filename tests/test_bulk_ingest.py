@@ -0,0 +1,60 @@
+"""POST /journeys/bulk validates each NDJSON line, reports failures per line and inserts the rest."""
+import asyncio
+import json
+
+import server
+from tests.conftest import ndjson
+
+
+def journeys(count, seed=3):
+    generator = server.sample_generator(count, seed)
+    return [journey for block in range(generator.blocks) for journey in generator.block(block)]
+
+
+def stored_ids(db):
+    async def ids():
+        return sorted(journey["journey_id"] for journey in await db.journeys.find({}, {"journey_id": 1}).to_list(None))
+    return asyncio.run(ids())
+
+
+def test_invalid_lines_are_reported_and_valid_lines_inserted(api, mock_db):
+    asyncio.run(server.ensure_journey_indexes())
+    valid = journeys(4)
+    no_touchpoints = {**valid[0], "journey_id": "EMPTY", "touchpoints": [], "touchpoint_count": 0}
+    miscounted = {**valid[1], "journey_id": "MISCOUNTED", "touchpoint_count": len(valid[1]["touchpoints"]) + 1}
+    duplicate = {**valid[2]}
+    body = "\n".join([
+        ndjson(valid[:2]),
+        ndjson([no_touchpoints]),
+        "{not json",
+        ndjson([miscounted]),
+        ndjson(valid[2:]),
+        json.dumps([1, 2]),
+        ndjson([duplicate]),
+    ])
+
+    report = api("POST", "/api/journeys/bulk", content=body).json()
+    errors = {error["line"]: error["error"] for error in report["errors"]}
+    assert (report["received"], report["inserted"], report["failed"]) == (9, 4, 5)
+    assert sorted(errors) == [3, 4, 5, 8, 9]
+    assert errors[3] == "touchpoints: at least one touchpoint is required"
+    assert errors[4].startswith("Invalid JSON")
+    assert errors[5] == f"touchpoint_count: {miscounted['touchpoint_count']} does not match " \
+                        f"{len(miscounted['touchpoints'])} touchpoints"
+    assert errors[8] == "Expected a JSON object"
+    assert errors[9].startswith("E11000")
+    assert stored_ids(mock_db) == sorted(journey["journey_id"] for journey in valid)
+
+
+def test_schema_errors_name_the_field(api, mock_db):
+    journey = journeys(1)[0]
+    del journey["customer_name"]
+    report = api("POST", "/api/journeys/bulk", content=ndjson([journey])).json()
+    assert report["inserted"] == 0
+    assert report["errors"] == [{"line": 1, "error": "customer_name: Field required"}]
+    assert stored_ids(mock_db) == []
+
+
+def test_inserted_journeys_reach_the_analytics(api, mock_db):
+    api("POST", "/api/journeys/bulk", content=ndjson(journeys(30)))
+    assert api("GET", "/api/stats").json()["total_conversions"] == 30
@@ -0,0 +1,85 @@
+"""Channel synergy: hand-computed lift and PMI on a small fixture, and a brute-force check on random journeys."""
+import math
+import random
+from itertools import combinations
+
+import pytest
+
+from tests.conftest import insert, make_journey
+
+# Supports: A in 3 journeys, B in 3 and C in 2, out of 4
+HAND_JOURNEYS = [(["A", "B"], 100.0), (["B", "A", "C"], 200.0), (["A"], 300.0), (["C", "B"], 400.0)]
+
+HAND_PAIRS = {
+    # lift = together * journeys / (support1 * support2)
+    ("A", "B"): {"co_occurrences": 2, "lift": 8 / 9, "before": 1, "after": 1, "together": 150.0, "apart": 350.0},
+    ("A", "C"): {"co_occurrences": 1, "lift": 2 / 3, "before": 1, "after": 0, "together": 200.0, "apart": 800 / 3},
+    ("B", "C"): {"co_occurrences": 2, "lift": 4 / 3, "before": 1, "after": 1, "together": 300.0, "apart": 100.0},
+}
+
+
+def synergy(api, **params):
+    response = api("GET", "/api/channel-synergy", params=params)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def by_pair(rows):
+    """Rows keyed by their channels in name order, with the ordering counts swapped to match"""
+    pairs = {}
+    for row in rows:
+        first, second = row["channel1"], row["channel2"]
+        before, after = row["channel1_before_channel2"], row["channel2_before_channel1"]
+        if first > second:
+            first, second, before, after = second, first, after, before
+        pairs[first, second] = {**row, "before": before, "after": after}
+    return pairs
+
+
+def test_hand_computed_pairs(api, mock_db):
+    insert(api, [make_journey(f"H{i}", channels, value) for i, (channels, value) in enumerate(HAND_JOURNEYS)])
+    pairs = by_pair(synergy(api))
+    assert set(pairs) == set(HAND_PAIRS)
+    for pair, expected in HAND_PAIRS.items():
+        row = pairs[pair]
+        assert row["co_occurrences"] == expected["co_occurrences"]
+        assert (row["before"], row["after"]) == (expected["before"], expected["after"])
+        assert row["lift"] == round(expected["lift"], 4)
+        assert row["pmi"] == round(math.log2(expected["lift"]), 4)
+        assert row["avg_value_together"] == round(expected["together"], 2)
+        assert row["avg_value_apart"] == round(expected["apart"], 2)
+
+    assert [(row["channel1"], row["channel2"]) for row in synergy(api, rank_by="lift")][0] == ("B", "C")
+    assert [row["pmi"] for row in synergy(api, rank_by="pmi", top_k=2)] == [round(math.log2(4 / 3), 4),
+                                                                             round(math.log2(8 / 9), 4)]
+
+
+def test_matches_brute_force(api, mock_db):
+    rng = random.Random(2)
+    channels = [f"C{number}" for number in range(6)]
+    # Channels may repeat within a journey
+    journeys = [make_journey(f"R{number:03d}", [rng.choice(channels) for _ in range(rng.randint(1, 6))],
+                             float(rng.randrange(10, 500)))
+                for number in range(150)]
+    insert(api, journeys)
+    pairs = by_pair(synergy(api))
+
+    support = {channel: sum(channel in {t["channel"] for t in j["touchpoints"]} for j in journeys)
+               for channel in channels}
+    expected_pairs = set()
+    for first, second in combinations(sorted(channels), 2):
+        together = [j for j in journeys if {first, second} <= {t["channel"] for t in j["touchpoints"]}]
+        if not together:
+            continue
+        expected_pairs.add((first, second))
+        sequence = [[t["channel"] for t in j["touchpoints"]] for j in together]
+        row = pairs[first, second]
+        assert row["co_occurrences"] == len(together)
+        assert row["before"] == sum(any(s[i] == first and second in s[i + 1:] for i in range(len(s))) for s in sequence)
+        assert row["after"] == sum(any(s[i] == second and first in s[i + 1:] for i in range(len(s))) for s in sequence)
+        lift = len(together) * len(journeys) / (support[first] * support[second])
+        assert row["lift"] == pytest.approx(lift, abs=1e-4)
+        assert row["pmi"] == pytest.approx(math.log2(lift), abs=1e-4)
+        assert row["avg_value_together"] == pytest.approx(
+            sum(j["conversion_value"] for j in together) / len(together), abs=0.005)
+    assert set(pairs) == expected_pairs
@@ -0,0 +1,114 @@
+"""The compact storage layout decodes back to the journeys that were written, through every read path."""
+import asyncio
+
+import numpy as np
+import pytest
+
+import compact
+import server
+from attribution_engine import ChannelIndex, JourneyFrame
+from tests.conftest import insert
+
+
+def generated(count=120, seed=4):
+    generator = server.sample_generator(count, seed)
+    return [journey for block in range(generator.blocks) for journey in generator.block(block)]
+
+
+def as_stored(journeys):
+    return [{**journey, "conversion_date": journey["conversion_date"].isoformat()} for journey in journeys]
+
+
+def codes_for(journeys):
+    return compact.CodeTable(compact.CodeTable().missing(journeys))
+
+
+def test_encode_then_decode_is_lossless():
+    journeys = as_stored(generated())
+    codes = codes_for(journeys)
+    documents = compact.encode_journeys(journeys, codes)
+    assert all("touchpoints" not in document and len(document["tp"]["c"]) == document["touchpoint_count"]
+               for document in documents)
+    assert compact.decode_journeys(documents, codes) == journeys
+
+
+def test_decoded_frame_matches_the_document_frame():
+    journeys = as_stored(generated())
+    codes = codes_for(journeys)
+    index = ChannelIndex(server.CHANNELS)
+    expected = JourneyFrame.from_journeys(journeys, index)
+    frame = compact.decode_frame(compact.encode_journeys(journeys, codes), index, codes)
+    for field in ("channel_ids", "sequence", "cost", "days_before", "offsets", "conversion_value",
+                  "touchpoint_count", "time_to_conversion", "conversion_day"):
+        np.testing.assert_array_equal(getattr(frame, field), getattr(expected, field), err_msg=field)
+
+
+def test_unknown_codes_are_reported():
+    journeys = as_stored(generated(5))
+    codes = codes_for(journeys)
+    documents = compact.encode_journeys(journeys, codes)
+    stale = compact.CodeTable({"channel": codes.names["channel"][:1], "interaction_type": []})
+    with pytest.raises(compact.UnknownCode):
+        compact.decode_journeys(documents, stale)
+    with pytest.raises(compact.UnknownCode):
+        compact.decode_frame(documents, ChannelIndex(server.CHANNELS), stale)
+
+
+@pytest.fixture
+def layout(monkeypatch):
+    def use(name):
+        monkeypatch.setattr(server, "JOURNEY_STORAGE", name)
+        monkeypatch.setattr(server, "STORED_FRAME_PROJECTION",
+                            compact.translate_projection(server.FRAME_PROJECTION, name))
+        monkeypatch.setattr(server, "STORED_COST_PATH", compact.touchpoint_path("cost", name))
+        monkeypatch.setattr(server, "journey_codes", compact.CodeTable())
+    return use
+
+
+def read_back(api):
+    """Every journey through the listing, plus the analytics that decode frames and filter by channel"""
+    return {
+        "journeys": api("GET", "/api/journeys").json(),
+        "fields": api("GET", "/api/journeys", params={"fields": "journey_id,touchpoints.channel"}).json(),
+        "stats": api("GET", "/api/stats", params={"channel": ["Email Campaign"]}).json(),
+        "linear": api("GET", "/api/attribution/linear", params={"min_value": 10000}).json(),
+    }
+
+
+def stored_journeys():
+    return asyncio.run(server.db.journeys.find({}, {"_id": 0}).sort("journey_id", 1).to_list(None))
+
+
+def test_reads_match_across_layouts(api, mock_db, layout):
+    journeys = as_stored(generated())
+    layout("document")
+    insert(api, journeys)
+    documents = stored_journeys()
+    expected = read_back(api)
+    assert [journey["journey_id"] for journey in expected["journeys"]] == sorted(j["journey_id"] for j in journeys)
+
+    layout("compact")
+    assert asyncio.run(server.migrate_journey_layout("compact")) == {"layout": "compact", "converted": len(journeys)}
+    assert all("tp" in document and "touchpoints" not in document for document in stored_journeys())
+    server.result_cache.clear()
+    assert read_back(api) == expected
+
+    # A process with a stale code table reloads it instead of failing
+    server.journey_codes = compact.CodeTable()
+    server.result_cache.clear()
+    assert read_back(api) == expected
+
+    layout("document")
+    asyncio.run(server.migrate_journey_layout("document"))
+    assert stored_journeys() == documents
+
+
+def test_compact_writes_decode_on_read(api, mock_db, layout):
+    journeys = as_stored(generated(60, seed=5))
+    layout("compact")
+    insert(api, journeys)
+    assert all("tp" in document for document in stored_journeys())
+    assert api("GET", "/api/journeys").json() == [
+        server.Journey.model_validate(journey).model_dump(mode="json")
+        for journey in sorted(journeys, key=lambda journey: journey["journey_id"])
+    ]
@@ -0,0 +1,77 @@
+"""Response compression negotiated from Accept-Encoding, skipped for small bodies."""
+import gzip
+
+import pytest
+
+import compression
+from tests.conftest import insert, make_journey
+
+CHANNELS = ["Google Ads", "Email Campaign", "Facebook Ads", "Organic Search", "Referral", "Webinar", "LinkedIn"]
+
+
+@pytest.fixture
+def journeys(api):
+    insert(api, [make_journey(f"Z{number:03d}", CHANNELS[number % 5:], 100.0 + number) for number in range(40)])
+
+
+def test_large_json_is_gzipped(api, journeys):
+    identity = api("GET", "/api/attribution/linear", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in identity.headers and len(identity.content) >= 1024
+
+    compressed = api("GET", "/api/attribution/linear", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in compressed.headers["vary"]
+    assert int(compressed.headers["content-length"]) < len(identity.content)
+    assert compressed.json() == identity.json()
+
+
+def test_streamed_pages_are_gzipped(api, journeys):
+    identity = api("GET", "/api/journeys", headers={"Accept-Encoding": "identity"})
+    compressed = api("GET", "/api/journeys", headers={"Accept-Encoding": "gzip;q=0.5, deflate"})
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert compressed.json() == identity.json()
+
+
+def test_small_bodies_are_sent_as_is(api):
+    response = api("GET", "/api/", headers={"Accept-Encoding": "gzip, br"})
+    assert "content-encoding" not in response.headers
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert response.json() == {"message": "AttributionIQ API"}
+
+
+def test_not_modified_responses_are_not_encoded(api, journeys):
+    tag = api("GET", "/api/attribution/linear").headers["etag"]
+    response = api("GET", "/api/attribution/linear", headers={"If-None-Match": tag, "Accept-Encoding": "gzip"})
+    assert response.status_code == 304 and "content-encoding" not in response.headers
+
+
+@pytest.mark.parametrize("header, with_brotli, expected", [
+    ("gzip, br", True, "br"),
+    ("gzip, br", False, "gzip"),
+    ("br;q=0.5, gzip", True, "gzip"),
+    ("br;q=1, gzip;q=0.8", True, "br"),
+    ("*", True, "br"),
+    ("*;q=0, gzip", True, "gzip"),
+    ("gzip;q=0", True, None),
+    ("deflate, identity", True, None),
+    ("", True, None),
+])
+def test_negotiation(monkeypatch, header, with_brotli, expected):
+    monkeypatch.setattr(compression, "brotli", object() if with_brotli else None)
+    assert compression.negotiate(header) == expected
+
+
+def test_brotli_round_trip(monkeypatch):
+    brotli = pytest.importorskip("brotli")
+    encoder = compression.Encoder("br", gzip_level=6, brotli_quality=4)
+    body = b'{"channel": "Google Ads"}' * 100
+    chunks = encoder.compress(body[:1000], final=False) + encoder.compress(body[1000:], final=True)
+    assert brotli.decompress(chunks) == body
+
+
+def test_gzip_chunks_decode_as_one_stream():
+    encoder = compression.Encoder("gzip", gzip_level=6, brotli_quality=4)
+    body = b'{"journey_id": "J001"}\n' * 200
+    chunks = [encoder.compress(body[start:start + 700], final=start + 700 >= len(body))
+              for start in range(0, len(body), 700)]
+    assert gzip.decompress(b"".join(chunks)) == body
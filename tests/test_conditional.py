@@ -0,0 +1,44 @@
+"""Conditional GET: ETags per data version and request, 304 on a match, new tags after writes."""
+from tests.conftest import insert, make_journey
+
+
+def test_matching_if_none_match_gets_an_empty_304(api):
+    insert(api, [make_journey("T1", ["Google Ads", "Email Campaign"], 500.0)])
+    first = api("GET", "/api/attribution/linear")
+    tag = first.headers["etag"]
+    assert first.status_code == 200 and tag.startswith('W/"')
+    assert first.headers["cache-control"] == "no-cache"
+
+    repeated = api("GET", "/api/attribution/linear", headers={"If-None-Match": tag})
+    assert repeated.status_code == 304
+    assert repeated.content == b""
+    assert repeated.headers["etag"] == tag
+
+    # Strong and weak forms of the tag, lists and * all match
+    for header in (tag.removeprefix("W/"), f'"other", {tag}', "*"):
+        assert api("GET", "/api/attribution/linear", headers={"If-None-Match": header}).status_code == 304
+
+
+def test_tags_differ_per_request_and_change_after_writes(api):
+    insert(api, [make_journey("T1", ["Google Ads", "Email Campaign"], 500.0)])
+    tag = api("GET", "/api/attribution/linear").headers["etag"]
+    assert api("GET", "/api/attribution/first_touch").headers["etag"] != tag
+    assert api("GET", "/api/attribution/linear", params={"min_value": 1}).headers["etag"] != tag
+    assert api("GET", "/api/attribution/linear", headers={"If-None-Match": '"stale"'}).status_code == 200
+
+    insert(api, [make_journey("T2", ["Referral"], 250.0)])
+    after_insert = api("GET", "/api/attribution/linear", headers={"If-None-Match": tag})
+    assert after_insert.status_code == 200
+    assert {row["channel"] for row in after_insert.json()} == {"Google Ads", "Email Campaign", "Referral"}
+    assert after_insert.headers["etag"] != tag
+
+    assert api("DELETE", "/api/journeys/T2").status_code == 200
+    after_delete = api("GET", "/api/attribution/linear", headers={"If-None-Match": after_insert.headers["etag"]})
+    assert after_delete.status_code == 200
+    assert after_delete.headers["etag"] not in (tag, after_insert.headers["etag"])
+
+
+def test_live_state_and_errors_are_not_tagged(api):
+    assert "etag" not in api("GET", "/api/cache-stats").headers
+    missing = api("GET", "/api/journeys/none")
+    assert missing.status_code == 404 and "etag" not in missing.headers
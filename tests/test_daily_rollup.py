@@ -0,0 +1,77 @@
+"""Date-windowed reads of the daily rollup match folding the journeys in that window."""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import server
+from attribution_engine import MODEL_NAMES
+
+
+async def conversion_days(db):
+    journeys = await db.journeys.find({}, {"conversion_date": 1}).to_list(None)
+    return sorted({journey["conversion_date"].replace(tzinfo=timezone.utc) for journey in journeys})
+
+
+def windows(days):
+    """Open-ended, closed, single-day and empty conversion_date ranges over the data"""
+    first, last = days[0], days[-1]
+    middle = days[len(days) // 2]
+    return [
+        {"$gte": middle},
+        {"$lt": middle},
+        {"$gte": first + timedelta(days=10), "$lt": last - timedelta(days=10)},
+        {"$gte": middle, "$lt": middle + timedelta(days=1)},
+        {"$gte": datetime(2000, 1, 1, tzinfo=timezone.utc), "$lt": datetime(2000, 2, 1, tzinfo=timezone.utc)},
+    ]
+
+
+@pytest.mark.parametrize("pipelines", [True, False], ids=["pipeline", "python"])
+def test_windowed_reads_match_folds(churned_db, monkeypatch, pipelines):
+    monkeypatch.setattr(server, "USE_AGGREGATION_PIPELINES", pipelines)
+
+    async def compare():
+        for days in windows(await conversion_days(churned_db)):
+            query = {"conversion_date": days}
+            stored = await server.stored_attribution(MODEL_NAMES, query)
+            streamed = await server.stream_attribution(MODEL_NAMES, query)
+            assert stored["journeys"] == streamed.journeys, days
+            assert stored["total_revenue"] == pytest.approx(streamed.total_revenue)
+            for row, model in enumerate(MODEL_NAMES):
+                expected = [result.model_dump() for result in server.format_model_results(streamed, row)]
+                actual = server.format_attribution_results(stored["channel_data"][model], stored["total_revenue"])
+                assert [result.model_dump() for result in actual] == expected, (model, days)
+
+    asyncio.run(compare())
+
+
+def test_daily_totals_match_the_journeys(churned_db):
+    async def both():
+        rows = await server.read_daily_totals({})
+        journeys = await churned_db.journeys.find({}, {"conversion_date": 1, "conversion_value": 1}).to_list(None)
+        return rows, journeys
+
+    rows, journeys = asyncio.run(both())
+    expected = {}
+    for journey in journeys:
+        day = expected.setdefault(journey["conversion_date"].date().isoformat(), [0, 0.0])
+        day[0] += 1
+        day[1] += journey["conversion_value"]
+    assert {row["_id"]: row["conversions"] for row in rows} == {day: count for day, (count, _) in expected.items()}
+    for row in rows:
+        assert row["revenue"] == pytest.approx(expected[row["_id"]][1])
+
+
+def test_checker_flags_a_corrupted_day(churned_db):
+    async def corrupt_and_check():
+        document = await churned_db.attribution_daily.find_one({"model": "last_touch"})
+        channel = next(iter(document["channels"]))
+        await churned_db.attribution_daily.update_one(
+            {"_id": document["_id"]}, {"$inc": {f"channels.{channel}.conversions": 1}}
+        )
+        return document["_id"], channel, await server.check_attribution_aggregates()
+
+    document_id, channel, report = asyncio.run(corrupt_and_check())
+    assert [(m["collection"], m["id"], m["measure"]) for m in report["mismatches"]] == [
+        ("attribution_daily", document_id, f"channels.{channel}.conversions")
+    ]
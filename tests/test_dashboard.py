@@ -0,0 +1,80 @@
+"""POST /api/dashboard answers every widget exactly as its own endpoint does, from one shared pass per filter set."""
+import inspect
+
+import pytest
+
+import server
+
+# (widget, params, endpoint path, endpoint query)
+WIDGETS = [
+    ("stats", {}, "/api/stats", {}),
+    ("attribution", {"model": "linear"}, "/api/attribution/linear", {}),
+    ("attribution", {"model": "time_decay", "half_life": 3}, "/api/attribution/time_decay", {"half_life": 3}),
+    ("attribution", {"model": "markov", "order": 2}, "/api/attribution/markov", {"order": 2}),
+    ("attribution", {"model": "shapley", "mode": "exact"}, "/api/attribution/shapley", {"mode": "exact"}),
+    ("compare_all", {}, "/api/attribution/compare/all", {}),
+    ("advanced_metrics", {}, "/api/advanced-metrics", {}),
+    ("revenue_trends", {}, "/api/revenue-trends", {}),
+    ("channel_synergy", {"top_k": 5, "rank_by": "lift"}, "/api/channel-synergy", {"top_k": 5, "rank_by": "lift"}),
+    ("path_analysis", {"top_k": 5, "prefix_length": 2}, "/api/path-analysis", {"top_k": 5, "prefix_length": 2}),
+    ("funnel_analysis", {}, "/api/funnel-analysis", {}),
+    ("top_performers", {}, "/api/top-performers", {}),
+    ("attribution_variance", {}, "/api/attribution-variance", {}),
+]
+
+FILTERS = {"channel": ["Email Campaign"], "min_value": 5000}
+
+
+def dashboard(api, widgets, **filters):
+    response = api("POST", "/api/dashboard", params=filters, json={"widgets": widgets})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def request_body():
+    return [{"widget": widget, "id": f"w{position}", "params": params}
+            for position, (widget, params, _, _) in enumerate(WIDGETS)]
+
+
+@pytest.mark.parametrize("filters", [{}, FILTERS])
+def test_widgets_equal_their_endpoints(api, churned_db, filters):
+    result = dashboard(api, request_body(), **filters)
+    assert result["errors"] == {}
+
+    # Answered afresh, so each endpoint computes on its own rather than reading what the dashboard cached
+    server.result_cache.clear()
+    for position, (widget, _, path, query) in enumerate(WIDGETS):
+        # Widgets whose endpoints take no filters answer for every journey
+        endpoint = server.DASHBOARD_WIDGETS[widget][0]
+        accepts_filters = "filters" in inspect.signature(endpoint).parameters
+        response = api("GET", path, params={**query, **(filters if accepts_filters else {})})
+        assert response.status_code == 200, (widget, response.text)
+        assert result["widgets"][f"w{position}"] == response.json(), widget
+
+
+def test_one_pass_per_filter_set(api, churned_db):
+    server.result_cache.clear()
+    widgets = [{"widget": "attribution", "params": {"model": "time_decay", "half_life": 2}},
+               {"widget": "channel_synergy"}, {"widget": "path_analysis"}]
+    assert dashboard(api, widgets)["passes"] == 1
+    # Every answer is now cached, so a repeat needs no pass at all
+    assert dashboard(api, widgets)["passes"] == 0
+
+
+def test_failing_widgets_do_not_fail_the_others(api, churned_db):
+    result = dashboard(api, [
+        {"widget": "attribution", "id": "bad", "params": {"model": "nonsense"}},
+        {"widget": "stats", "id": "good"},
+    ])
+    assert result["errors"] == {"bad": {"status_code": 400, "detail": "Invalid model name"}}
+    assert result["widgets"]["good"] == api("GET", "/api/stats").json()
+
+
+@pytest.mark.parametrize("widgets, status", [
+    ([{"widget": "nope"}], 400),
+    ([{"widget": "stats"}, {"widget": "stats"}], 400),
+    ([{"widget": "channel_synergy", "params": {"top_k": 0}}], 422),
+    ([{"widget": "stats", "params": {"unexpected": 1}}], 422),
+])
+def test_invalid_requests_are_rejected(api, churned_db, widgets, status):
+    assert api("POST", "/api/dashboard", json={"widgets": widgets}).status_code == status
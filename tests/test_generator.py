@@ -0,0 +1,67 @@
+"""Seeded generation: the same seed gives the same journeys however and however often they are generated."""
+from datetime import datetime, timezone
+
+import pytest
+
+import generator
+import server
+
+END = datetime(2024, 6, 30, tzinfo=timezone.utc)
+
+
+def make(count, seed, pattern_weights=(1, 1, 1)):
+    return generator.JourneyGenerator(
+        count, seed, channels=server.CHANNELS, paid_channels=server.PAID_CHANNELS,
+        opening_channels=server.OPENING_CHANNELS, closing_channels=server.CLOSING_CHANNELS,
+        interaction_types=server.INTERACTION_TYPES, names=server.INDIAN_NAMES, pattern_weights=pattern_weights,
+        end_date=END
+    )
+
+
+@pytest.fixture
+def small_blocks(monkeypatch):
+    monkeypatch.setattr(generator, "BLOCK_SIZE", 64)
+
+
+def test_same_seed_same_journeys(small_blocks):
+    first = make(300, 42)
+    assert first.blocks == 5
+    assert make(300, 42).journeys() == first.journeys()
+    # Blocks are independent of each other, so the order they are generated in does not matter
+    again = make(300, 42)
+    backwards = {index: again.block(index) for index in reversed(range(again.blocks))}
+    assert [journey for index in range(again.blocks) for journey in backwards[index]] == first.journeys()
+    assert make(300, 43).journeys() != first.journeys()
+
+
+def test_journeys_are_valid_and_follow_the_patterns(small_blocks):
+    journeys = make(200, 1, pattern_weights=(1, 0, 0)).journeys()
+    assert [journey["journey_id"] for journey in journeys] == [f"J{number:03d}" for number in range(1, 201)]
+    for journey in journeys:
+        server.Journey.model_validate(journey)
+        touchpoints = journey["touchpoints"]
+        assert len(touchpoints) == journey["touchpoint_count"]
+        assert [touchpoint["sequence"] for touchpoint in touchpoints] == list(range(1, len(touchpoints) + 1))
+        assert touchpoints[0]["channel"] in server.PAID_CHANNELS
+        assert touchpoints[-1]["channel"] in server.CLOSING_CHANNELS
+        days = [touchpoint["days_before_conversion"] for touchpoint in touchpoints]
+        assert days == sorted(days, reverse=True) and days[-1] == 0
+
+
+def test_invalid_pattern_weights_are_rejected(api, mock_db):
+    with pytest.raises(ValueError):
+        make(10, 0, pattern_weights=(0, 0, 0))
+    response = api("POST", "/api/generate-data", params={"count": 10, "paid_first": 0, "organic_first": 0, "mixed": 0})
+    assert response.status_code == 400
+
+
+def test_generate_data_is_reproducible(api, mock_db, small_blocks):
+    def generate(seed):
+        response = api("POST", "/api/generate-data", params={"count": 250, "seed": seed})
+        assert response.json()["seed"] == seed
+        return api("GET", "/api/journeys").json()
+
+    stored = generate(9)
+    assert len(stored) == 250
+    assert generate(9) == stored
+    assert generate(10) != stored
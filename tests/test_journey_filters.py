@@ -0,0 +1,85 @@
+"""Date, channel and value filters narrow attribution, stats and revenue trends to the matching journeys."""
+import random
+from collections import defaultdict
+
+import pytest
+
+from tests.conftest import insert, make_journey
+
+CHANNELS = ["Email", "Google Ads", "Facebook", "Direct", "Referral"]
+DAYS = [f"2024-03-{day:02d}" for day in range(25, 32)] + [f"2024-04-{day:02d}" for day in range(1, 6)]
+
+
+def build_journeys(count=80, seed=11):
+    rng = random.Random(seed)
+    return [
+        make_journey(f"F{number:03d}", [rng.choice(CHANNELS) for _ in range(rng.randint(1, 4))],
+                     float(rng.randrange(10, 1000, 10)), day=rng.choice(DAYS))
+        for number in range(count)
+    ]
+
+
+def matches(journey, start=None, end=None, channel=None, min_value=None, max_value=None):
+    day = journey["conversion_date"][:10]
+    value = journey["conversion_value"]
+    return ((start is None or day >= start) and (end is None or day <= end)
+            and (channel is None or any(touchpoint["channel"] in channel for touchpoint in journey["touchpoints"]))
+            and (min_value is None or value >= min_value) and (max_value is None or value <= max_value))
+
+
+def linear_revenue(journeys):
+    revenue = defaultdict(float)
+    for journey in journeys:
+        for touchpoint in journey["touchpoints"]:
+            revenue[touchpoint["channel"]] += journey["conversion_value"] / len(journey["touchpoints"])
+    return revenue
+
+
+@pytest.fixture
+def journeys(api, mock_db):
+    journeys = build_journeys()
+    insert(api, journeys)
+    return journeys
+
+
+@pytest.mark.parametrize("filters", [
+    {"start": "2024-03-29"},
+    {"start": "2024-03-28", "end": "2024-04-02"},
+    {"end": "2024-03-26"},
+    {"channel": ["Facebook"]},
+    {"channel": ["Email", "Referral"], "start": "2024-04-01"},
+    {"min_value": 300},
+    {"min_value": 200, "max_value": 600, "end": "2024-03-31"},
+])
+def test_filters_narrow_every_endpoint(api, journeys, filters):
+    expected = [journey for journey in journeys if matches(journey, **filters)]
+    assert 0 < len(expected) < len(journeys)
+
+    stats = api("GET", "/api/stats", params=filters).json()
+    assert stats["total_conversions"] == len(expected)
+    assert stats["total_revenue"] == pytest.approx(sum(journey["conversion_value"] for journey in expected))
+
+    attribution = api("GET", "/api/attribution/linear", params=filters).json()
+    revenue = {row["channel"]: row["attributed_revenue"] for row in attribution}
+    assert revenue == pytest.approx(dict(linear_revenue(expected)), abs=0.01)
+
+    daily = defaultdict(float)
+    for journey in expected:
+        daily[journey["conversion_date"][:10]] += journey["conversion_value"]
+    trends = api("GET", "/api/revenue-trends", params=filters).json()
+    assert {row["date"]: row["revenue"] for row in trends} == pytest.approx(dict(daily))
+
+
+def test_a_filter_nothing_matches_is_not_an_error(api, journeys):
+    assert api("GET", "/api/stats", params={"start": "2025-01-01"}).json()["total_conversions"] == 0
+    assert api("GET", "/api/revenue-trends", params={"channel": ["Nowhere"]}).json() == []
+
+
+@pytest.mark.parametrize("filters, detail", [
+    ({"start": "2024-04-02", "end": "2024-04-01"}, "start must not be after end"),
+    ({"min_value": 500, "max_value": 100}, "min_value must not exceed max_value"),
+])
+def test_inverted_ranges_are_rejected(api, journeys, filters, detail):
+    response = api("GET", "/api/stats", params=filters)
+    assert response.status_code == 400
+    assert response.json()["detail"] == detail
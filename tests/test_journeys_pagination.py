@@ -0,0 +1,76 @@
+"""Keyset pages of /api/journeys cover every matching journey exactly once, filters included."""
+import pytest
+
+from tests.conftest import insert, make_journey
+
+CHANNELS = ["Email", "Google Ads", "Facebook", "Direct"]
+# Ids that are awkward in a URL or outside ASCII still make valid cursors
+ODD_IDS = ["a/b+c", "émail-1", "x y", "zz?&="]
+
+
+def build_journeys():
+    journeys = [
+        make_journey(f"J{number:03d}", [CHANNELS[(number + step) % 4] for step in range(number % 5 + 1)],
+                     float(number * 10), day=f"2024-03-{number % 28 + 1:02d}")
+        for number in range(60)
+    ]
+    journeys += [make_journey(journey_id, ["Direct"], 5.0) for journey_id in ODD_IDS]
+    journeys[7]["customer_name"] = "Searchable Person"
+    journeys[41]["customer_name"] = "Another SEARCHABLE one"
+    return journeys
+
+
+def walk(api, limit, **params):
+    """journey_ids of every page in order, following X-Next-Cursor until it is absent"""
+    seen = []
+    cursor = None
+    while True:
+        page_params = {**params, "limit": limit, **({"after": cursor} if cursor else {})}
+        response = api("GET", "/api/journeys", params=page_params)
+        assert response.status_code == 200, response.text
+        page = [journey["journey_id"] for journey in response.json()]
+        assert len(page) <= limit
+        seen += page
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return seen
+        assert page, "a cursor was sent with an empty page"
+
+
+@pytest.fixture
+def journeys(api, mock_db):
+    journeys = build_journeys()
+    insert(api, journeys)
+    return journeys
+
+
+@pytest.mark.parametrize("params, keep", [
+    ({}, lambda j: True),
+    ({"search": "searchable"}, lambda j: "searchable" in j["customer_name"].lower()),
+    ({"search": "J01"}, lambda j: "J01" in j["journey_id"]),
+    ({"min_touchpoints": 3}, lambda j: j["touchpoint_count"] >= 3),
+    ({"min_touchpoints": 2, "max_touchpoints": 3}, lambda j: 2 <= j["touchpoint_count"] <= 3),
+    ({"channel": "Facebook", "min_value": 100}, lambda j: j["conversion_value"] >= 100 and any(
+        touchpoint["channel"] == "Facebook" for touchpoint in j["touchpoints"])),
+])
+@pytest.mark.parametrize("limit", [1, 7, 64, 1000])
+def test_pages_cover_every_match_once(api, journeys, params, keep, limit):
+    seen = walk(api, limit, **params)
+    expected = sorted(journey["journey_id"] for journey in journeys if keep(journey))
+    assert expected
+    assert len(seen) == len(set(seen))
+    assert seen == expected
+
+
+def test_link_header_follows_the_same_cursor(api, journeys):
+    response = api("GET", "/api/journeys", params={"limit": 10, "min_touchpoints": 2})
+    cursor = response.headers["X-Next-Cursor"]
+    assert f"after={cursor}" in response.headers["Link"]
+    assert "min_touchpoints=2" in response.headers["Link"]
+
+
+@pytest.mark.parametrize("cursor", ["", "!!!", "SjAwMQ==", "SjAwM", "SjAw MQ", "_w"])
+def test_malformed_cursor_is_rejected(api, journeys, cursor):
+    response = api("GET", "/api/journeys", params={"after": cursor})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Malformed cursor"
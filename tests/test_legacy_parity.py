@@ -0,0 +1,54 @@
+"""The columnar engine reproduces the original per-dict attribution loops to the cent."""
+import random
+
+import pytest
+
+import server
+from attribution_engine import ChannelIndex, JourneyFrame
+from benchmarks.legacy_attribution import LEGACY_MODELS, to_engine_layout
+from tests.conftest import make_journey
+
+MODELS = list(LEGACY_MODELS)
+
+# Single touchpoints, repeated channels, only Direct Traffic and a direct last touch
+EDGE_JOURNEYS = [
+    make_journey("E1", ["Google Ads"], 120.0, costs=[15.5]),
+    make_journey("E2", ["Email Campaign", "Email Campaign", "Email Campaign"], 75.25),
+    make_journey("E3", ["Direct Traffic", "Direct Traffic"], 310.0),
+    make_journey("E4", ["Facebook Ads", "Organic Search", "Direct Traffic"], 999.99, costs=[40.0, 0.0, 0.0]),
+    make_journey("E5", ["Webinar", "Google Ads", "Webinar", "Referral", "Google Ads", "Direct Traffic"], 1234.56,
+                 costs=[0.0, 12.0, 0.0, 0.0, 8.5, 0.0]),
+]
+
+
+@pytest.fixture(scope="module")
+def journeys():
+    random.seed(42)
+    return server.build_sample_journeys(2000) + EDGE_JOURNEYS
+
+
+def legacy(journeys, model):
+    channel_data, total_revenue = LEGACY_MODELS[model](journeys)
+    return [result.model_dump() for result in
+            server.format_attribution_results(to_engine_layout(channel_data), total_revenue)]
+
+
+@pytest.mark.parametrize("model", MODELS)
+def test_each_model_matches_legacy(journeys, model):
+    assert [result.model_dump() for result in server.calculate_model(journeys, model)] == legacy(journeys, model)
+
+
+def test_single_pass_matrix_matches_legacy(journeys):
+    matrix = server.evaluate_attribution(journeys, MODELS)
+    for row, model in enumerate(MODELS):
+        assert [result.model_dump() for result in server.format_model_results(matrix, row)] == legacy(journeys, model)
+
+
+def test_batches_fold_to_the_same_result(journeys):
+    # A matrix folded over several frames equals one over all journeys, as streamed requests rely on
+    index = ChannelIndex(server.CHANNELS)
+    folded = server.AttributionMatrix(index, MODELS)
+    for start in range(0, len(journeys), 300):
+        folded.update(JourneyFrame.from_journeys(journeys[start:start + 300], index))
+    for row, model in enumerate(MODELS):
+        assert [result.model_dump() for result in server.format_model_results(folded, row)] == legacy(journeys, model)
@@ -0,0 +1,42 @@
+"""Markov removal-effect attribution on a chain small enough to solve by hand."""
+import pytest
+
+from tests.conftest import insert, make_journey
+
+# START -> A -> B -> CONV, START -> A -> CONV and twice START -> B -> CONV.
+# First order: START goes to A or B with 1/2 each, A to B or CONV with 1/2 each, B always converts.
+# Without A only START -> B converts (1/2); without B only START -> A -> CONV does (1/4).
+# Removal effects are 1/2 and 3/4 against a conversion probability of 1, so the shares are 2/5 and 3/5.
+JOURNEYS = [(["A", "B"], 100.0), (["A"], 200.0), (["B"], 300.0), (["B"], 400.0)]
+
+
+def revenue_by_channel(response):
+    assert response.status_code == 200, response.text
+    return {row["channel"]: row for row in response.json()}
+
+
+def test_two_channel_chain_matches_removal_effects(api):
+    insert(api, [make_journey(f"M{i}", channels, value) for i, (channels, value) in enumerate(JOURNEYS)])
+    rows = revenue_by_channel(api("GET", "/api/attribution/markov"))
+
+    assert set(rows) == {"A", "B"}
+    assert rows["A"]["attributed_revenue"] == 400.0
+    assert rows["B"]["attributed_revenue"] == 600.0
+    assert rows["A"]["attribution_percentage"] == 40.0
+    # Touchpoint statistics come from the linear pass
+    assert (rows["A"]["touchpoint_count"], rows["B"]["touchpoint_count"]) == (2, 3)
+
+
+def test_channel_on_every_path_has_full_removal_effect(api):
+    insert(api, [make_journey("C1", ["C", "A"], 100.0), make_journey("C2", ["A"], 100.0)])
+    rows = revenue_by_channel(api("GET", "/api/attribution/markov"))
+    # Removing A loses every conversion, removing C the half that START sends to it
+    assert rows["A"]["attributed_revenue"] == pytest.approx(200.0 * 2 / 3, abs=0.005)
+    assert rows["C"]["attributed_revenue"] == pytest.approx(200.0 * 1 / 3, abs=0.005)
+
+
+def test_higher_order_chains_are_accepted(api):
+    insert(api, [make_journey(f"M{i}", channels, value) for i, (channels, value) in enumerate(JOURNEYS)])
+    rows = revenue_by_channel(api("GET", "/api/attribution/markov", params={"order": 2}))
+    assert sum(row["attributed_revenue"] for row in rows.values()) == pytest.approx(1000.0, abs=0.01)
+    assert api("GET", "/api/attribution/markov", params={"order": 9}).status_code == 422
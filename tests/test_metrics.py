@@ -0,0 +1,108 @@
+"""/metrics exposes per-route requests, latency, stage times, work counts and cache series in Prometheus text."""
+import re
+
+import pytest
+
+import metrics
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)$')
+LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+ROUTE = "/api/attribution/{model}"
+
+
+def scrape(api):
+    """Every sample of /metrics keyed by (name, frozenset of labels)"""
+    response = api("GET", "/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    samples = {}
+    for line in response.text.splitlines():
+        if line.startswith("#"):
+            continue
+        match = SAMPLE.match(line)
+        assert match, line
+        name, labels, value = match.groups()
+        samples[name, frozenset(LABEL.findall(labels or ""))] = float(value)
+    return samples
+
+
+def sample(samples, name, **labels):
+    return samples.get((name, frozenset(labels.items())), 0.0)
+
+
+@pytest.fixture
+def generated(api, mock_db):
+    assert api("POST", "/api/generate-data", params={"count": 60, "seed": 1}).status_code == 200
+    return api("GET", "/api/journeys").json()
+
+
+def test_a_request_shows_up_in_every_series(api, generated):
+    touchpoints = sum(journey["touchpoint_count"] for journey in generated)
+    before = scrape(api)
+    # Non-default parameters are not served by the stored aggregates, so the journeys are folded
+    for _ in range(2):
+        assert api("GET", "/api/attribution/time_decay", params={"half_life": 2}).status_code == 200
+    assert api("GET", "/api/attribution/nonsense").status_code == 400
+    assert api("GET", "/no-such-route").status_code == 404
+    after = scrape(api)
+
+    def delta(name, **labels):
+        return sample(after, name, **labels) - sample(before, name, **labels)
+
+    assert delta("http_requests_total", route=ROUTE, method="GET", status="200") == 2
+    assert delta("http_requests_total", route=ROUTE, method="GET", status="400") == 1
+    assert delta("http_requests_total", route="unmatched", method="GET", status="404") == 1
+    assert delta("http_request_duration_seconds_count", route=ROUTE, method="GET") == 3
+    assert delta("http_request_duration_seconds_sum", route=ROUTE, method="GET") > 0
+    for stage in ("db_fetch", "decode", "compute", "serialize"):
+        assert delta("http_request_stage_seconds_count", route=ROUTE, stage=stage) >= 1, stage
+    # Only the first request folds; the second is a cache hit
+    assert delta("journeys_processed_total", route=ROUTE) == len(generated)
+    assert delta("touchpoints_processed_total", route=ROUTE) == touchpoints
+    # The rejected request is looked up before the model name is checked, so it misses too
+    assert delta("result_cache_lookups_total", endpoint="attribution", outcome="miss") == 2
+    assert delta("result_cache_lookups_total", endpoint="attribution", outcome="hit") == 1
+    assert sample(after, "result_cache_entries") >= 1
+    assert 0 <= sample(after, "result_cache_hit_ratio") <= 1
+    assert ("compute_pending_jobs", frozenset()) in after
+
+
+def test_histogram_buckets_are_cumulative(api, generated):
+    samples = scrape(api)
+    buckets = {}
+    for (name, labels), value in samples.items():
+        if name == "http_request_duration_seconds_bucket":
+            labels = dict(labels)
+            le = labels.pop("le")
+            buckets.setdefault(frozenset(labels.items()), []).append(
+                (float("inf") if le == "+Inf" else float(le), value))
+    assert buckets
+    for labels, counts in buckets.items():
+        counts.sort()
+        values = [value for _, value in counts]
+        assert values == sorted(values)
+        assert len(counts) == len(metrics.LATENCY_BUCKETS) + 1
+        assert values[-1] == samples["http_request_duration_seconds_count", labels]
+
+
+def test_rendering_escapes_labels_and_formats_numbers():
+    counter = metrics.Counter("things_total", "Things", ("kind",))
+    counter.inc('a "quoted"\\path\nline')
+    counter.inc("b", amount=2.5)
+    histogram = metrics.Histogram("wait_seconds", "Waits", buckets=(0.1, 1.0))
+    histogram.observe(value=0.1)
+    histogram.observe(value=5)
+    assert counter.render() == [
+        "# HELP things_total Things",
+        "# TYPE things_total counter",
+        'things_total{kind="a \\"quoted\\"\\\\path\\nline"} 1',
+        'things_total{kind="b"} 2.5',
+    ]
+    assert histogram.render()[2:] == [
+        'wait_seconds_bucket{le="0.1"} 1',
+        'wait_seconds_bucket{le="1"} 1',
+        'wait_seconds_bucket{le="+Inf"} 2',
+        "wait_seconds_sum 5.1",
+        "wait_seconds_count 2",
+    ]
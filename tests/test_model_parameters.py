@@ -0,0 +1,98 @@
+"""Tuning parameters of the rule-based models: validation, derived remainders and the batch endpoint."""
+import pytest
+
+from attribution_engine import resolve_params
+from tests.conftest import insert, make_journey
+
+
+def test_unset_parameters_take_the_defaults():
+    assert resolve_params("time_decay") == (("half_life", 7),)
+    assert resolve_params("position_based") == (("first", 0.4), ("last", 0.4), ("middle", 0.2))
+    assert resolve_params("linear") == ()
+
+
+def test_remainder_is_derived_from_the_explicit_weights():
+    assert dict(resolve_params("position_based", first=0.5, last=0.3)) == {"first": 0.5, "middle": 0.2, "last": 0.3}
+    assert dict(resolve_params("w_shaped", first=0.2)) == {"first": 0.2, "middle": 0.3, "last": 0.3, "others": 0.2}
+    # An explicit remainder is kept, even if the weights then sum to less than 1
+    assert dict(resolve_params("position_based", first=0.2, middle=0.1)) == {"first": 0.2, "middle": 0.1, "last": 0.4}
+
+
+@pytest.mark.parametrize("model, overrides", [
+    ("position_based", {"first": 0.7, "last": 0.5}),
+    ("position_based", {"first": 0.5, "middle": 0.5, "last": 0.5}),
+    ("w_shaped", {"first": 0.4, "middle": 0.4, "last": 0.4}),
+    ("time_decay", {"half_life": 0}),
+])
+def test_invalid_parameters_raise(model, overrides):
+    with pytest.raises(ValueError):
+        resolve_params(model, **overrides)
+
+
+@pytest.fixture
+def three_touch(api, mock_db):
+    insert(api, [make_journey("J1", ["Email", "Facebook", "Direct"], 100.0)])
+
+
+def revenue(results):
+    return {result["channel"]: result["attributed_revenue"] for result in results}
+
+
+def test_parameters_change_the_credit(api, three_touch):
+    response = api("GET", "/api/attribution/position_based", params={"first_weight": 0.5, "last_weight": 0.5})
+    assert response.status_code == 200
+    assert revenue(response.json()) == {"Email": 50.0, "Direct": 50.0, "Facebook": 0.0}
+
+    # Days before conversion are 3, 2 and 1: with a one-day half-life the weights are 1/8, 1/4 and 1/2
+    response = api("GET", "/api/attribution/time_decay", params={"half_life": 1})
+    assert revenue(response.json()) == pytest.approx({"Email": 100 / 7, "Facebook": 200 / 7, "Direct": 400 / 7},
+                                                     abs=0.005)
+
+
+@pytest.mark.parametrize("model, params, detail", [
+    ("linear", {"half_life": 3}, "half_life not used by the linear model"),
+    ("time_decay", {"first_weight": 0.5, "others_weight": 0.1},
+     "first_weight, others_weight not used by the time_decay model"),
+    ("position_based", {"others_weight": 0.1}, "others_weight not used by the position_based model"),
+    ("position_based", {"first_weight": 0.7, "last_weight": 0.5},
+     "Position weights must be non-negative and sum to at most 1"),
+    ("markov", {"half_life": 3}, "half_life not used by the markov model"),
+    ("nonsense", {}, "Invalid model name"),
+])
+def test_endpoint_rejects_bad_parameters(api, three_touch, model, params, detail):
+    response = api("GET", f"/api/attribution/{model}", params=params)
+    assert response.status_code == 400
+    assert response.json()["detail"] == detail
+
+
+def test_batch_matches_single_requests(api, three_touch):
+    configs = [
+        {"model": "linear"},
+        {"model": "time_decay", "half_life": 1},
+        {"model": "position_based", "first_weight": 0.5, "last_weight": 0.5},
+        {"model": "w_shaped", "first_weight": 0.4},
+    ]
+    response = api("POST", "/api/attribution/batch", json=configs)
+    assert response.status_code == 200
+    results = response.json()
+    assert [result["params"] for result in results] == [
+        {}, {"half_life": 1}, {"first": 0.5, "middle": 0.0, "last": 0.5},
+        {"first": 0.4, "middle": 0.3, "last": 0.3, "others": 0.0},
+    ]
+    for config, result in zip(configs, results):
+        params = {key: value for key, value in config.items() if key != "model"}
+        single = api("GET", f"/api/attribution/{config['model']}", params=params).json()
+        assert result["channels"] == single
+
+
+@pytest.mark.parametrize("configs, detail", [
+    ([], "At least one parameter set is required"),
+    ([{"model": "linear"}, {"model": "shapley"}], "Invalid model name: shapley"),
+    ([{"model": "linear", "last_weight": 0.5}], "last_weight not used by the linear model"),
+    ([{"model": "w_shaped", "first_weight": 0.5, "middle_weight": 0.5, "last_weight": 0.5}],
+     "Position weights must be non-negative and sum to at most 1"),
+])
+def test_batch_rejects_bad_configs(api, three_touch, configs, detail):
+    response = api("POST", "/api/attribution/batch", json=configs)
+    assert response.status_code == 400
+    assert response.json()["detail"] == detail
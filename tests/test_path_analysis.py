@@ -0,0 +1,89 @@
+"""Path analysis counts, revenue and rankings against a brute-force count of the journeys' channel sequences."""
+import random
+from collections import defaultdict
+
+import pytest
+
+from tests.conftest import insert, make_journey
+
+CHANNELS = ["Email", "Search", "Social", "Direct"]
+
+
+def build_journeys(count=200, seed=6):
+    rng = random.Random(seed)
+    journeys = []
+    for number in range(count):
+        journey = make_journey(f"P{number:03d}", [rng.choice(CHANNELS) for _ in range(rng.randint(1, 4))],
+                               float(rng.randrange(10, 500)))
+        journey["time_to_conversion"] = rng.randint(1, 45)
+        journeys.append(journey)
+    return journeys
+
+
+def brute_force(journeys, prefix_length=None):
+    """Journeys, revenue and time to conversion per whole path, or per prefix of `prefix_length` touchpoints"""
+    sums = defaultdict(lambda: [0, 0.0, 0])
+    for journey in journeys:
+        path = tuple(touchpoint["channel"] for touchpoint in journey["touchpoints"])
+        if prefix_length is not None:
+            if len(path) < prefix_length:
+                continue
+            path = path[:prefix_length]
+        entry = sums[path]
+        entry[0] += 1
+        entry[1] += journey["conversion_value"]
+        entry[2] += journey["time_to_conversion"]
+    return {
+        path: {"path": list(path), "journeys": n, "share": round(n / len(journeys), 4), "revenue": round(revenue, 2),
+               "avg_value": round(revenue / n, 2), "avg_time_to_conversion": round(days / n, 1)}
+        for path, (n, revenue, days) in sums.items()
+    }
+
+
+def paths(api, **params):
+    response = api("GET", "/api/path-analysis", params={"top_k": 1000, **params})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+@pytest.fixture
+def journeys(api, mock_db):
+    journeys = build_journeys()
+    insert(api, journeys)
+    return journeys
+
+
+@pytest.mark.parametrize("prefix_length", [None, 1, 2, 3])
+def test_counts_match_brute_force(api, journeys, prefix_length):
+    expected = brute_force(journeys, prefix_length)
+    result = paths(api, **({"prefix_length": prefix_length} if prefix_length else {}))
+    assert result["journeys"] == len(journeys)
+    assert result["distinct_paths"] == len(brute_force(journeys))
+    assert {tuple(entry["path"]): entry for entry in result["paths"]} == expected
+    assert len(result["paths"]) == len(expected)
+
+
+@pytest.mark.parametrize("rank_by", ["journeys", "revenue", "avg_value"])
+def test_rankings_are_the_strongest_first(api, journeys, rank_by):
+    expected = sorted(brute_force(journeys).values(), key=lambda entry: -entry[rank_by])
+    top = paths(api, rank_by=rank_by, top_k=5)["paths"]
+    assert [entry[rank_by] for entry in top] == [entry[rank_by] for entry in expected[:5]]
+
+
+def test_lookup_of_one_path(api, journeys):
+    whole = brute_force(journeys)
+    prefixes = brute_force(journeys, 2)
+    path = next(path for path in whole if len(path) == 2)
+    result = paths(api, path=list(path), top_k=1)["path"]
+    assert {key: value for key, value in result.items() if key != "as_prefix"} == whole[path]
+    assert result["as_prefix"] == prefixes[path]
+
+    missing = paths(api, path=["Nowhere"], top_k=1)["path"]
+    assert missing["journeys"] == 0 and missing["as_prefix"]["journeys"] == 0
+
+
+def test_filters_apply_before_counting(api, journeys):
+    matching = [journey for journey in journeys if journey["conversion_value"] >= 250]
+    result = paths(api, min_value=250)
+    assert result["journeys"] == len(matching)
+    assert {tuple(entry["path"]): entry for entry in result["paths"]} == brute_force(matching)
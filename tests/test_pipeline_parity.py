@@ -0,0 +1,81 @@
+"""Aggregation pipelines of the summary endpoints match the in-Python fold they fall back to.
+
+Runs on mongomock by default, where pipeline stages it does not implement
+(``$dateTrunc`` for /revenue-trends) are skipped.  Set ``MONGO_TEST_URL`` to
+run every check against a real mongod, in a scratch database dropped afterwards.
+"""
+import asyncio
+import functools
+import os
+from datetime import datetime, timezone
+
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import OperationFailure
+
+import server
+from analytics import FunnelAccumulator, RevenueTrendsAccumulator, StatsAccumulator
+from pipelines import funnel_pipeline, revenue_trends_pipeline, stats_pipeline
+
+JOURNEYS = 3_000
+
+CHECKS = {
+    "stats": (StatsAccumulator, functools.partial(stats_pipeline, cost_path=server.STORED_COST_PATH)),
+    "funnel-analysis": (FunnelAccumulator, funnel_pipeline),
+    "revenue-trends": (RevenueTrendsAccumulator,
+                       functools.partial(revenue_trends_pipeline, cost_path=server.STORED_COST_PATH)),
+}
+
+QUERIES = {
+    "all": {},
+    "filtered": {
+        "conversion_date": {"$gte": datetime(2024, 1, 1, tzinfo=timezone.utc)},
+        "touchpoints.channel": {"$in": ["Email Campaign", "Google Ads"]},
+        "conversion_value": {"$gte": 100},
+    },
+}
+
+
+@pytest.fixture(scope="module")
+def seeded_db():
+    """A seeded journeys collection on mongod (MONGO_TEST_URL) or mongomock"""
+    url = os.environ.get("MONGO_TEST_URL")
+    if url:
+        db = AsyncIOMotorClient(url)["attribution_parity_test"]
+    else:
+        from mongomock_motor import AsyncMongoMockClient
+        db = AsyncMongoMockClient()["attribution_parity_test"]
+
+    async def seed():
+        await db.journeys.drop()
+        generator = server.sample_generator(JOURNEYS, seed=42)
+        for block in range(generator.blocks):
+            await db.journeys.insert_many(generator.block(block), ordered=False)
+    asyncio.run(seed())
+    yield db
+    asyncio.run(db.journeys.drop())
+
+
+@pytest.mark.parametrize("query", QUERIES.values(), ids=QUERIES.keys())
+@pytest.mark.parametrize("endpoint", CHECKS)
+def test_pipeline_matches_fold(seeded_db, monkeypatch, endpoint, query):
+    monkeypatch.setattr(server, "db", seeded_db)
+    accumulator_class, pipeline = CHECKS[endpoint]
+
+    async def both():
+        folded = accumulator_class()
+        journeys = await server.fold_journeys(folded, query=query)
+        aggregated = accumulator_class()
+        rows = await seeded_db.journeys.aggregate(pipeline(await server.stored_query(query))).to_list(None)
+        aggregated.load(rows)
+        return journeys, folded.result(), aggregated.result()
+
+    try:
+        journeys, folded, aggregated = asyncio.run(both())
+    except (NotImplementedError, OperationFailure) as e:
+        if os.environ.get("MONGO_TEST_URL"):
+            raise
+        pytest.skip(f"mongomock cannot run the /{endpoint} pipeline: {e}")
+
+    assert journeys > 0
+    assert aggregated == folded
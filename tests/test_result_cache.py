@@ -0,0 +1,114 @@
+"""The analytics result cache: single flight, cancellation, LRU bound, counters and generation keys."""
+import asyncio
+
+import pytest
+
+import server
+from result_cache import ResultCache
+
+
+def test_cancelled_first_caller_does_not_fail_waiters():
+    async def scenario():
+        cache = ResultCache()
+        release = asyncio.Event()
+        calls = 0
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return "value"
+
+        first = asyncio.create_task(cache.get_or_compute("key", compute))
+        await asyncio.sleep(0)
+        waiters = [asyncio.create_task(cache.get_or_compute("key", compute)) for _ in range(3)]
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+
+        assert await asyncio.gather(*waiters) == ["value"] * 3
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return cache, calls
+
+    cache, calls = asyncio.run(scenario())
+    assert calls == 1
+    assert "key" in cache
+    assert (cache.misses, cache.coalesced) == (1, 3)
+
+
+def test_result_is_stored_when_every_caller_is_cancelled():
+    async def scenario():
+        cache = ResultCache()
+        release = asyncio.Event()
+
+        async def compute():
+            await release.wait()
+            return 42
+
+        caller = asyncio.create_task(cache.get_or_compute("key", compute))
+        await asyncio.sleep(0)
+        caller.cancel()
+        release.set()
+        for _ in range(3):
+            await asyncio.sleep(0)
+        return cache
+
+    cache = asyncio.run(scenario())
+    assert "key" in cache
+
+
+def test_failures_reach_every_caller_and_are_not_cached():
+    async def scenario():
+        cache = ResultCache()
+
+        async def compute():
+            await asyncio.sleep(0)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(*(cache.get_or_compute("key", compute) for _ in range(3)),
+                                       return_exceptions=True)
+        return cache, results
+
+    cache, results = asyncio.run(scenario())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert "key" not in cache
+
+
+def test_lru_bound_and_counters():
+    async def value(v):
+        return v
+
+    async def scenario():
+        cache = ResultCache(max_entries=2)
+        await cache.get_or_compute("a", lambda: value(1))
+        await cache.get_or_compute("b", lambda: value(2))
+        # Touching a makes b the least recently used
+        assert await cache.get_or_compute("a", lambda: value(-1)) == 1
+        await cache.get_or_compute("c", lambda: value(3))
+        return cache
+
+    cache = asyncio.run(scenario())
+    assert "a" in cache and "c" in cache and "b" not in cache
+    assert cache.stats() == {
+        "entries": 2, "max_entries": 2, "hits": 1, "misses": 3, "coalesced": 0, "evictions": 1, "hit_ratio": 0.25
+    }
+
+
+def test_entries_are_keyed_by_dataset_generation(api, mock_db):
+    assert api("POST", "/api/generate-data", params={"count": 50, "seed": 1}).status_code == 200
+    first = api("GET", "/api/stats").json()
+    hits = server.result_cache.hits
+    assert api("GET", "/api/stats").json() == first
+    assert server.result_cache.hits == hits + 1
+
+    # Another worker's write: new data and a new generation, with this worker's cache left as it was
+    async def write_elsewhere():
+        journey = await mock_db.journeys.find_one({}, {"_id": 0})
+        await mock_db.journeys.insert_one({**journey, "journey_id": "elsewhere"})
+        await mock_db.meta.update_one({"_id": "journeys"}, {"$inc": {"generation": 1}})
+    asyncio.run(write_elsewhere())
+
+    after = api("GET", "/api/stats").json()
+    assert after["total_conversions"] == first["total_conversions"] + 1
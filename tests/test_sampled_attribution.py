@@ -0,0 +1,65 @@
+"""Sampled attribution: confidence intervals cover the exact values, and escalation to exact is reported."""
+import pytest
+
+import server
+
+PARAMS = {"half_life": 3}  # Not the defaults, so the stored aggregates do not answer exactly
+SEEDS = 25
+
+
+@pytest.fixture
+def generated(api, mock_db, monkeypatch):
+    monkeypatch.setattr(server, "SAMPLE_MIN_JOURNEYS", 50)
+    assert api("POST", "/api/generate-data", params={"count": 2000, "seed": 3}).status_code == 200
+
+
+def attribution(api, **params):
+    response = api("GET", "/api/attribution/time_decay", params={**PARAMS, **params})
+    assert response.status_code == 200, response.text
+    return {row["channel"]: row for row in response.json()}
+
+
+def exact_revenue(api):
+    rows = attribution(api, sample=0.5)
+    assert all(row["exact"] for row in rows.values())
+    return {channel: row["attributed_revenue"] for channel, row in rows.items()}
+
+
+def test_intervals_cover_the_exact_values(api, generated, monkeypatch):
+    exact = exact_revenue(api)
+    covered = total = 0
+    for seed in range(SEEDS):
+        monkeypatch.setattr(server, "SAMPLE_SEED", seed)
+        server.result_cache.clear()
+        rows = attribution(api, sample=0.1)
+        for channel, row in rows.items():
+            assert not row["exact"]
+            assert row["sample_fraction"] == pytest.approx(0.1, abs=0.02)
+            low, high = row["attributed_revenue_ci"]
+            assert low <= row["attributed_revenue"] <= high
+            covered += low <= exact[channel] <= high
+            total += 1
+    # 95% intervals; the bound leaves room for the spread of a few hundred draws
+    assert covered / total >= 0.88
+
+
+def test_small_samples_grow_to_the_minimum(api, generated):
+    rows = attribution(api, sample=0.01).values()
+    # 0.01 of 2000 journeys is below SAMPLE_MIN_JOURNEYS, so at least 50 * SAMPLE_MARGIN are sampled
+    assert all(not row["exact"] and row["sample_fraction"] >= 0.03 for row in rows)
+
+
+def test_escalation_to_exact_is_reported(api, generated):
+    exact = exact_revenue(api)
+    for params in ({"sample": 0.25}, {"sample": 1}, {"max_error": 0.0001}):
+        for channel, row in attribution(api, **params).items():
+            assert row["exact"] and row["sample_fraction"] == 1
+            assert row["attributed_revenue_ci"] == [row["attributed_revenue"]] * 2
+            assert row["attributed_revenue"] == exact[channel]
+
+    # Default parameters are answered exactly by the stored aggregates
+    response = api("GET", "/api/attribution/linear", params={"sample": 0.1})
+    assert all(row["exact"] and row["sample_fraction"] == 1 for row in response.json())
+
+    response = api("GET", "/api/attribution/markov", params={"sample": 0.1})
+    assert response.status_code == 400
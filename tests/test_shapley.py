@@ -0,0 +1,59 @@
+"""Shapley attribution: hand-computed values, efficiency and the sampled estimate against the exact one."""
+import random
+
+import pytest
+
+import server
+from tests.conftest import insert, make_journey
+
+# v(A) = 100, v(B) = 50 and v(AB) = 450, so phi(A) = (100 + 400) / 2 and phi(B) = (50 + 350) / 2
+HAND_JOURNEYS = [(["A"], 100.0), (["A", "B"], 300.0), (["B"], 50.0)]
+
+CHANNELS = [f"C{number:02d}" for number in range(8)]
+
+
+def revenue_by_channel(response):
+    assert response.status_code == 200, response.text
+    return {row["channel"]: row["attributed_revenue"] for row in response.json()}
+
+
+def random_journeys(count, seed=5):
+    rng = random.Random(seed)
+    return [
+        make_journey(f"S{number}", rng.sample(CHANNELS, rng.randint(1, 4)), round(rng.uniform(100, 1000), 2))
+        for number in range(count)
+    ]
+
+
+def test_two_channel_values_match_hand_computation(api):
+    insert(api, [make_journey(f"H{i}", channels, value) for i, (channels, value) in enumerate(HAND_JOURNEYS)])
+    assert revenue_by_channel(api("GET", "/api/attribution/shapley", params={"mode": "exact"})) == {
+        "A": 250.0, "B": 200.0
+    }
+
+
+def test_values_add_up_to_total_revenue(api):
+    journeys = random_journeys(300)
+    insert(api, journeys)
+    total = sum(journey["conversion_value"] for journey in journeys)
+    for mode in ("exact", "sample"):
+        values = revenue_by_channel(api("GET", "/api/attribution/shapley", params={"mode": mode}))
+        assert sum(values.values()) == pytest.approx(total, abs=0.01 * len(values)), mode
+
+
+def test_sampling_above_the_exact_limit_stays_within_tolerance(api, monkeypatch):
+    insert(api, random_journeys(300))
+    exact = revenue_by_channel(api("GET", "/api/attribution/shapley", params={"mode": "exact"}))
+    total = sum(exact.values())
+
+    # Eight channels exceed the lowered limit, so auto mode samples
+    monkeypatch.setattr(server, "SHAPLEY_EXACT_MAX_CHANNELS", 4)
+    tolerance = 0.005
+    server.result_cache.clear()
+    sampled = revenue_by_channel(api("GET", "/api/attribution/shapley", params={"tolerance": tolerance}))
+    assert api("GET", "/api/attribution/shapley", params={"mode": "exact"}).status_code == 400
+
+    assert set(sampled) == set(exact)
+    for channel, value in exact.items():
+        # The tolerance bounds the standard error relative to total revenue; allow four of them
+        assert abs(sampled[channel] - value) <= 4 * tolerance * total, channel
@@ -0,0 +1,63 @@
+"""Folding the journeys collection keeps memory bounded however many journeys it holds."""
+import asyncio
+import itertools
+import random
+import tracemalloc
+
+import pytest
+from mongomock_motor import AsyncCursor
+
+import server
+from analytics import FunnelAccumulator, StatsAccumulator
+from attribution_engine import AttributionMatrix, ChannelIndex
+
+BATCH_SIZE = 500
+
+# Peak traced allocations while folding: a few batches of documents and frames, whatever the collection size
+MAX_PEAK_MB = 8
+
+
+@pytest.fixture
+def streaming_cursors(monkeypatch):
+    """Hand out mongomock documents batch by batch, as a server cursor does.
+
+    mongomock_motor's to_list() ignores its length, and mongomock copies every
+    matching document on the first read, so unpatched the stand-in itself
+    would hold the whole collection in memory.
+    """
+    async def to_list(self, length=None):
+        cursor = self._AsyncCursor__cursor
+        if not hasattr(cursor, "stream"):
+            cursor.stream = cursor._factory()
+        return list(itertools.islice(cursor.stream, length))
+    monkeypatch.setattr(AsyncCursor, "to_list", to_list)
+
+
+async def fold_peak_mb(db, journeys: int) -> float:
+    await db.journeys.drop()
+    random.seed(42)
+    for start in range(0, journeys, 5000):
+        await db.journeys.insert_many(server.build_sample_journeys(min(5000, journeys - start)))
+
+    index = ChannelIndex(server.CHANNELS)
+    matrix = AttributionMatrix(index, list(server.MODEL_LABELS))
+    stats, funnel = StatsAccumulator(), FunnelAccumulator()
+    tracemalloc.start()
+    try:
+        folded = await server.fold_journeys(matrix, stats, funnel, index=index, batch_size=BATCH_SIZE)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    assert folded == matrix.journeys == journeys
+    assert stats.result()["total_conversions"] == journeys
+    return peak / 2 ** 20
+
+
+def test_fold_memory_does_not_grow_with_journeys(mock_db, streaming_cursors):
+    small = asyncio.run(fold_peak_mb(mock_db, 2_000))
+    large = asyncio.run(fold_peak_mb(mock_db, 8_000))
+
+    assert large < MAX_PEAK_MB
+    # Four times the journeys may not cost noticeably more than the batches in flight
+    assert large < small * 1.25 + 0.5, f"peak grew from {small:.1f} MB to {large:.1f} MB"